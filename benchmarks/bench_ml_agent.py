@@ -0,0 +1,75 @@
+"""
+ml-agent hot-path benchmarks: host detection, feature building, predictor and
+the full /predict endpoint through TestClient.
+Run through benchmarks/run.py, which sets PYTHONPATH to ml-agent/.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import warnings
+from typing import Dict, List
+
+from harness import format_row, measure
+from payloads import REPO_ROOT, generate_payload
+
+ML_AGENT_DIR = os.path.join(REPO_ROOT, "ml-agent")
+os.environ.setdefault(
+    "ML_AGENT_MODEL_PATH",
+    os.path.join(ML_AGENT_DIR, "app", "models", "A1", "MLP", "mlp_multioutput_scoredpairs_scaled_onehotencoded.pkl"),
+)
+# Measure the model path, not prediction cache hits on a repeated payload
+os.environ.setdefault("ML_AGENT_CACHE_MAX_ENTRIES", "0")
+
+
+def run(sizes: List[Dict[str, int]], rounds: int, min_time: float) -> List[Dict[str, object]]:
+    warnings.filterwarnings("ignore")
+    from fastapi.testclient import TestClient
+
+    from app.api import app
+    from app.forecasting.run import ModelPredictor
+    from app.preprocessing.transforms import build_feature_rows_from_payload, detect_current_host_with_app_metrics
+
+    predictor = ModelPredictor()
+    results: List[Dict[str, object]] = []
+    with TestClient(app) as client:
+        for size in sizes:
+            payload = generate_payload(size["nodes"], size["metrics"])
+            node_metrics_map = payload["data"]["NodeMetricsMap"]
+            body = json.dumps(payload)
+            cases = {
+                "ml_agent.detect_current_host_with_app_metrics": lambda: detect_current_host_with_app_metrics(
+                    node_metrics_map
+                ),
+                "ml_agent.build_feature_rows_from_payload": lambda: build_feature_rows_from_payload(
+                    payload, predictor.node_name_to_id
+                ),
+                "ml_agent.predict_for_all_targets": lambda: predictor.predict_for_all_targets(payload),
+                "ml_agent.api_predict": lambda: client.post(
+                    "/predict", content=body, headers={"Content-Type": "application/json"}
+                ).raise_for_status(),
+            }
+            for name, func in cases.items():
+                result = measure(name, func, rounds=rounds, min_time=min_time, params=dict(size))
+                print(format_row(result), file=sys.stderr)
+                results.append(result)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default="6x3,50x3,200x20", help="Comma-separated NODESxMETRICS payload sizes.")
+    parser.add_argument("--rounds", type=int, default=7)
+    parser.add_argument("--min-time", type=float, default=0.2)
+    args = parser.parse_args()
+    sizes = [
+        {"nodes": int(nodes), "metrics": int(metrics)}
+        for nodes, metrics in (token.split("x") for token in args.sizes.split(",") if token)
+    ]
+    json.dump(run(sizes, args.rounds, args.min_time), sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+orchestrator benchmarks: one synchronous run_cycle (fetch, predict, publish)
+against local stub load-watcher and ml-agent servers.
+Run through benchmarks/run.py, which sets PYTHONPATH to orchestrator/.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import struct
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+
+import msgpack
+
+from harness import format_row, measure
+from payloads import generate_payload
+
+OUTPUT_COLUMNS = [
+    "node_cpu_tgt", "node_energy_tgt", "node_power_tgt", "app_cpu_tgt",
+    "app_energy_tgt", "app_power_tgt", "app_latency_tgt", "app_qps_tgt",
+]
+
+
+def _canned_responses(payload: Dict, targets: int) -> Dict[str, Tuple[str, bytes]]:
+    """
+    Prediction responses shaped like ml-agent's JSON and msgpack formats.
+    """
+    hosts = list(payload["data"]["NodeMetricsMap"])
+    source, target_hosts = hosts[0], (hosts[1:] + hosts)[:targets]
+    target_ids = list(range(1, len(target_hosts) + 1))
+    rows = [[float(t * 10 + c) for c in range(len(OUTPUT_COLUMNS))] for t in target_ids]
+    as_json = {
+        "columns": OUTPUT_COLUMNS,
+        "source_host": source,
+        "source_id": 0,
+        "target_map": dict(zip(target_ids, target_hosts)),
+        "input_features": {tid: {} for tid in target_ids},
+        "predictions": dict(zip(target_ids, rows)),
+    }
+    flat = [value for row in rows for value in row]
+    as_msgpack = {
+        "columns": OUTPUT_COLUMNS,
+        "source_host": source,
+        "source_id": 0,
+        "target_ids": target_ids,
+        "target_hosts": target_hosts,
+        "feature_columns": [],
+        "features": b"",
+        "predictions": struct.pack(f"<{len(flat)}d", *flat),
+        "dtype": "<f8",
+    }
+    return {
+        "json": ("application/json", json.dumps(as_json).encode()),
+        "msgpack": ("application/msgpack", msgpack.packb(as_msgpack, use_bin_type=True)),
+    }
+
+
+def _start_stubs(snapshot: bytes, responses: Dict[str, Tuple[str, bytes]]) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def log_message(self, *_args: object) -> None:
+            pass
+
+        def _send(self, content_type: str, body: bytes) -> None:
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self) -> None:
+            self._send("application/json", snapshot)
+
+        def do_POST(self) -> None:
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            wants_msgpack = "msgpack" in self.headers.get("Accept", "")
+            self._send(*responses["msgpack" if wants_msgpack else "json"])
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run(sizes: List[Dict[str, int]], rounds: int, min_time: float) -> List[Dict[str, object]]:
+    import httpx
+
+    from app.config import Settings
+    from app.fingerprint import SnapshotFingerprinter, UnchangedSnapshotFilter
+    from app.orchestrator import run_cycle
+
+    results: List[Dict[str, object]] = []
+    for size in sizes:
+        payload = generate_payload(size["nodes"], size["metrics"])
+        server = _start_stubs(json.dumps(payload).encode(), _canned_responses(payload, size["targets"]))
+        base_url = f"http://127.0.0.1:{server.server_address[1]}"
+        try:
+            with httpx.Client() as client:
+                for response_format in ("json", "msgpack"):
+                    settings = Settings(
+                        load_watcher_url=f"{base_url}/watcher",
+                        ml_agent_url=f"{base_url}/predict",
+                        prediction_format=response_format,
+                    )
+                    result = measure(
+                        "orchestrator.run_cycle",
+                        lambda: run_cycle(client, settings),
+                        rounds=rounds,
+                        min_time=min_time,
+                        params={**size, "format": response_format},
+                    )
+                    print(format_row(result), file=sys.stderr)
+                    results.append(result)
+
+                snapshot_filter = UnchangedSnapshotFilter(SnapshotFingerprinter())
+                result = measure(
+                    "orchestrator.run_cycle_unchanged",
+                    lambda: run_cycle(client, settings, snapshot_filter),
+                    rounds=rounds,
+                    min_time=min_time,
+                    params=dict(size),
+                )
+                print(format_row(result), file=sys.stderr)
+                results.append(result)
+        finally:
+            server.shutdown()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default="6x3,50x3,200x20", help="Comma-separated NODESxMETRICS payload sizes.")
+    parser.add_argument("--targets", type=int, default=3, help="Target nodes in the stub prediction response.")
+    parser.add_argument("--rounds", type=int, default=7)
+    parser.add_argument("--min-time", type=float, default=0.2)
+    args = parser.parse_args()
+    sizes = [
+        {"nodes": int(nodes), "metrics": int(metrics), "targets": args.targets}
+        for nodes, metrics in (token.split("x") for token in args.sizes.split(",") if token)
+    ]
+    json.dump(run(sizes, args.rounds, args.min_time), sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Minimal timing harness shared by the benchmark scripts.
+Each benchmark is calibrated to run for roughly `min_time` seconds per round;
+the per-call timings of every round are summarized as JSON-friendly stats.
+"""
+from __future__ import annotations
+
+import gc
+import statistics
+import time
+from typing import Callable, Dict, List
+
+
+def measure(
+    name: str,
+    func: Callable[[], object],
+    rounds: int = 7,
+    min_time: float = 0.2,
+    params: Dict[str, object] | None = None,
+) -> Dict[str, object]:
+    func()  # warm up caches, lazy imports and JIT-ish paths
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        if time.perf_counter() - start >= min_time / 10 or number >= 1_000_000:
+            break
+        number *= 2
+
+    samples: List[float] = []
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(rounds):
+            start = time.perf_counter()
+            for _ in range(number):
+                func()
+            samples.append((time.perf_counter() - start) / number)
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+    ordered = sorted(samples)
+    return {
+        "name": name,
+        "params": params or {},
+        "rounds": rounds,
+        "iterations": number,
+        "min": ordered[0],
+        "median": statistics.median(ordered),
+        "mean": statistics.fmean(ordered),
+        "max": ordered[-1],
+        "stdev": statistics.stdev(ordered) if len(ordered) > 1 else 0.0,
+    }
+
+
+def format_row(result: Dict[str, object]) -> str:
+    params = ",".join(f"{k}={v}" for k, v in (result.get("params") or {}).items())  # type: ignore[union-attr]
+    label = f"{result['name']}[{params}]" if params else str(result["name"])
+    return f"{label:<60} median {float(result['median']) * 1e6:>12.1f} us   min {float(result['min']) * 1e6:>12.1f} us"
@@ -0,0 +1,63 @@
+"""
+Synthetic Load Watcher payloads for the benchmarks.
+Payloads are seeded from load-watcher/payload.json and scaled to N node buckets
+with M metrics per bucket. The real hosts come first (so the packaged model's
+node map still resolves the app host), followed by synthetic nodes.
+"""
+from __future__ import annotations
+
+import copy
+import json
+import os
+import random
+from typing import Dict, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SEED_PAYLOAD = os.path.join(REPO_ROOT, "load-watcher", "payload.json")
+
+
+def load_seed_payload(path: str = SEED_PAYLOAD) -> Dict:
+    with open(path, "r", encoding="utf-8") as handle:
+        return json.load(handle)
+
+
+def _app_host(node_metrics_map: Dict) -> str:
+    for host, bucket in node_metrics_map.items():
+        if any(m.get("name", "").startswith("ts:") for m in (bucket or {}).get("metrics", [])):
+            return host
+    return next(iter(node_metrics_map))
+
+
+def generate_payload(nodes: int = 6, metrics_per_bucket: int = 3, seed: int = 0, base: Dict | None = None) -> Dict:
+    """
+    Return a payload with `nodes` node buckets. Every bucket has at least
+    `metrics_per_bucket` metrics: the seed node metrics (values jittered by
+    +-10%) padded with filler metrics. The app host keeps its torchserve metrics.
+    """
+    rng = random.Random(seed)
+    payload = copy.deepcopy(base or load_seed_payload())
+    seed_map: Dict = payload["data"]["NodeMetricsMap"]
+    app_host = _app_host(seed_map)
+    template = [m for m in seed_map[app_host]["metrics"] if m["name"].endswith(":by_node")]
+
+    hosts: List[str] = [app_host] + [h for h in seed_map if h != app_host]
+    hosts = hosts[:nodes] + [f"bench-node-{idx}.novalocal" for idx in range(max(0, nodes - len(hosts)))]
+
+    node_metrics_map: Dict[str, Dict[str, List[Dict]]] = {}
+    for host in hosts:
+        metrics = copy.deepcopy(seed_map[host]["metrics"]) if host in seed_map else copy.deepcopy(template)
+        for metric in metrics:
+            metric["value"] = float(metric.get("value", 0.0)) * rng.uniform(0.9, 1.1)
+        for idx in range(len(metrics), metrics_per_bucket):
+            metrics.append(
+                {
+                    "name": f"bench:filler_{idx}",
+                    "type": "Unknown",
+                    "operator": "Latest",
+                    "rollup": "1m",
+                    "value": rng.uniform(0.0, 100.0),
+                }
+            )
+        node_metrics_map[host] = {"metrics": metrics}
+    payload["data"]["NodeMetricsMap"] = node_metrics_map
+    return payload
@@ -0,0 +1,113 @@
+"""
+Run the Python service benchmarks and save the results as JSON.
+
+  python benchmarks/run.py                                  # all suites, default sizes
+  python benchmarks/run.py --suite ml_agent --sizes 6x3,500x20
+  python benchmarks/run.py --compare benchmarks/results/<older>.json
+
+ml-agent and orchestrator both ship an `app` package, so each suite runs in its
+own interpreter with PYTHONPATH pointing at its service. Results are written to
+benchmarks/results/<UTC time>-<git sha>.json; --compare prints the median change
+against an earlier file and exits non-zero when a benchmark slowed down by more
+than --threshold.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+SUITES: Dict[str, Tuple[str, str]] = {
+    "ml_agent": ("bench_ml_agent.py", "ml-agent"),
+    "orchestrator": ("bench_orchestrator.py", "orchestrator"),
+}
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_suite(name: str, extra_args: List[str]) -> List[Dict[str, object]]:
+    script, service = SUITES[name]
+    env = dict(os.environ, PYTHONPATH=os.path.join(REPO_ROOT, service))
+    output = subprocess.check_output(
+        [sys.executable, os.path.join(BENCH_DIR, script), *extra_args], env=env, cwd=REPO_ROOT
+    )
+    return json.loads(output)
+
+
+def _key(result: Dict[str, object]) -> str:
+    return json.dumps([result["name"], result.get("params", {})], sort_keys=True)
+
+
+def compare(current: List[Dict[str, object]], baseline_path: str, threshold: float) -> bool:
+    with open(baseline_path, "r", encoding="utf-8") as handle:
+        baseline = {_key(result): result for result in json.load(handle)["benchmarks"]}
+    regressed = False
+    for result in current:
+        previous = baseline.get(_key(result))
+        if previous is None:
+            continue
+        change = float(result["median"]) / float(previous["median"]) - 1.0
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressed = True
+        params = ",".join(f"{k}={v}" for k, v in result.get("params", {}).items())  # type: ignore[union-attr]
+        print(f"{result['name']}[{params}]: {change:+.1%}{flag}")
+    return regressed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run ml-agent and orchestrator benchmarks.")
+    parser.add_argument("--suite", choices=sorted(SUITES), action="append", help="Suite to run (default: all).")
+    parser.add_argument("--sizes", help="Comma-separated NODESxMETRICS payload sizes, e.g. 6x3,200x20.")
+    parser.add_argument("--rounds", type=int, default=7)
+    parser.add_argument("--min-time", type=float, default=0.2, help="Approximate seconds per round.")
+    parser.add_argument("--out", help="Output JSON path (default: benchmarks/results/<time>-<sha>.json).")
+    parser.add_argument("--compare", help="Earlier results JSON to compare medians against.")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Slowdown that counts as a regression.")
+    args = parser.parse_args()
+
+    extra = ["--rounds", str(args.rounds), "--min-time", str(args.min_time)]
+    if args.sizes:
+        extra += ["--sizes", args.sizes]
+    benchmarks: List[Dict[str, object]] = []
+    for suite in args.suite or sorted(SUITES):
+        benchmarks.extend(run_suite(suite, extra))
+
+    commit = _git_commit()
+    stamp = time.strftime("%Y%m%dT%H%M%SZ", time.gmtime())
+    out = args.out or os.path.join(BENCH_DIR, "results", f"{stamp}-{commit}.json")
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as handle:
+        json.dump(
+            {
+                "commit": commit,
+                "created": stamp,
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "cpus": os.cpu_count(),
+                "benchmarks": benchmarks,
+            },
+            handle,
+            indent=2,
+        )
+    print(f"Wrote {len(benchmarks)} results to {out}")
+
+    if args.compare and compare(benchmarks, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
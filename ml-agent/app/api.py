@@ -1,13 +1,53 @@
 from __future__ import annotations
 
-from typing import Any, Dict, List
+import asyncio
+import json
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
-from fastapi import FastAPI, HTTPException, Request
+import msgpack
+import numpy as np
+import orjson
+from fastapi import FastAPI, HTTPException, Query, Request, Response, WebSocket
+from fastapi.concurrency import run_in_threadpool
+from prometheus_client import make_asgi_app
 from pydantic import BaseModel
 
-from app.forecasting.run import ModelPredictor
-from app.config import get_output_names
-from app.preprocessing.transforms import detect_current_host_with_app_metrics, build_feature_rows_from_payload
+from app import metrics
+from app.codecs import (
+    COMPACT_JSON_MEDIA_TYPE,
+    MSGPACK_MEDIA_TYPE,
+    compact_body,
+    encode_compact_json,
+    encode_msgpack,
+    negotiate_format,
+)
+from app.collector.prom_client import PrometheusCollector
+from app.export.prometheus import PREDICTIONS, export_predictions
+from app.forecasting.batching import MicroBatcher
+from app.forecasting.run import AppPredictors, PredictionResult
+from app.forecasting.timeseries import HoltWintersForecaster
+from app.config import (
+    get_batching_settings,
+    get_collector_settings,
+    get_forecast_settings,
+    get_history_settings,
+    get_output_names,
+    get_profiler_settings,
+    get_scheduler_settings,
+    get_serving_settings,
+    get_stream_settings,
+    get_warmup_settings,
+)
+from app.logging import log_slow_request
+from app.preprocessing.history import TimeSeriesHistory
+from app.preprocessing.nodes import parse_selector
+from app.preprocessing.snapshot import SnapshotIndex
+from app.profiling import PROFILE_MODES, SamplingProfiler
+from app.scheduler.scheduler import Scheduler
+from app.streaming import StreamSession
 
 
 class PredictResponse(BaseModel):
@@ -19,8 +59,163 @@ class PredictResponse(BaseModel):
     predictions: Dict[int, list[float]]
 
 
-app = FastAPI(title="ml-agent", version="0.1.0")
-predictor = ModelPredictor()
+class BatchPredictItem(BaseModel):
+    index: int
+    result: Optional[PredictResponse] = None
+    error: Optional[str] = None
+
+
+class BatchPredictResponse(BaseModel):
+    items: List[BatchPredictItem]
+
+
+class AppPredictItem(BaseModel):
+    app: str
+    result: Optional[PredictResponse] = None
+    error: Optional[str] = None
+
+
+class AppsPredictResponse(BaseModel):
+    items: List[AppPredictItem]
+
+
+class ForecastResponse(BaseModel):
+    horizon: int
+    series: int
+    forecasts: Dict[str, Dict[str, List[float]]]
+
+
+LOGGER = logging.getLogger(__name__)
+
+# One predictor per distinct model across the configured applications
+_loading = time.perf_counter()
+apps = AppPredictors()
+metrics.STARTUP_SECONDS.labels("load").set(time.perf_counter() - _loading)
+predictor = apps.primary
+batcher = MicroBatcher(predictor, **get_batching_settings())
+
+
+def _build_history() -> Optional[TimeSeriesHistory]:
+    settings = get_history_settings()
+    if not settings["slots"]:
+        return None
+    return TimeSeriesHistory(**settings)
+
+
+# Rolling per-series history fed by every payload seen (None when disabled)
+history = _build_history()
+
+forecast_settings = get_forecast_settings()
+MAX_FORECAST_HORIZON = int(forecast_settings.pop("max_horizon"))  # type: ignore[call-overload]
+forecaster = HoltWintersForecaster(**forecast_settings)  # type: ignore[arg-type]
+
+# Forked workers (ML_AGENT_WORKERS > 1) each keep their own history and forecaster,
+# fed only by the requests they happen to serve
+MULTI_WORKER = int(get_serving_settings()["workers"]) > 1  # type: ignore[call-overload]
+
+
+def _observe(snapshot: SnapshotIndex) -> None:
+    if history is not None:
+        history.observe(snapshot)
+    forecaster.observe(snapshot)
+
+
+def _export(result: PredictionResult) -> None:
+    id_to_name = predictor.registry.id_to_name
+    width = result.outputs.shape[1] if result.outputs is not None and result.outputs.ndim == 2 else 0
+    export_predictions(result, id_to_name, _output_columns(width))
+
+
+def _select_targets(target_selector: Optional[str]) -> Optional[List[int]]:
+    """
+    Target node ids matching a "key=value,..." label selector (None selects every node).
+    """
+    if not target_selector:
+        return None
+    try:
+        return predictor.registry.select(parse_selector(target_selector))
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+
+def _record_request(
+    endpoint: str, received: float, timings: Dict[str, float], responding: float, serializing: float
+) -> None:
+    finished = time.perf_counter()
+    timings["response"] = serializing - responding
+    timings["serialize"] = finished - serializing
+    metrics.record_stage_timings(timings)
+    log_slow_request(endpoint, finished - received, timings)
+
+
+def _retain_exported_hosts(snapshot: SnapshotIndex) -> None:
+    # Nodes missing from complete collections have left the cluster; a partial one
+    # (failed queries) says nothing about the nodes it lacks
+    if not snapshot.partial:
+        PREDICTIONS.retain_hosts(snapshot.hosts)
+
+
+def _build_scheduler() -> Optional[Scheduler]:
+    collector_settings = get_collector_settings()
+    if collector_settings is None:
+        return None
+    return Scheduler(
+        PrometheusCollector(**collector_settings),  # type: ignore[arg-type]
+        predictor,
+        _export,
+        observers=(_observe, _retain_exported_hosts),
+        **get_scheduler_settings(),  # type: ignore[arg-type]
+    )
+
+
+# Collect-forecast-export loop, when ml-agent collects from Prometheus itself
+scheduler = _build_scheduler()
+
+stream_settings = get_stream_settings()
+
+warmup_settings = get_warmup_settings()
+# /readyz passes once the warmup has finished; error is set if it failed
+warmup_state: Dict[str, Any] = {"done": False, "seconds": None, "error": None}
+
+
+async def _warm_up() -> None:
+    started = time.perf_counter()
+    try:
+        await run_in_threadpool(apps.warmup, int(warmup_settings["rounds"]))
+    except Exception as exc:
+        warmup_state["error"] = f"Warmup failed: {exc}"
+        LOGGER.exception("Warmup failed; /readyz will keep failing.")
+        return
+    warmup_state["seconds"] = time.perf_counter() - started
+    warmup_state["done"] = True
+    metrics.STARTUP_SECONDS.labels("warmup").set(warmup_state["seconds"])
+    LOGGER.info("Warmup finished in %.3fs.", warmup_state["seconds"])
+
+profiler_settings = get_profiler_settings()
+profiler = SamplingProfiler(interval_seconds=float(profiler_settings["interval_seconds"]))
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI) -> AsyncIterator[None]:
+    batcher.start()
+    warmup: Optional[asyncio.Task] = None
+    if warmup_settings["rounds"]:
+        # Serve (and answer /healthz) right away; /readyz waits for the warmup
+        warmup = asyncio.create_task(_warm_up())
+    else:
+        warmup_state["done"] = True
+    if scheduler is not None:
+        scheduler.start()
+    yield
+    if warmup is not None:
+        warmup.cancel()
+    if scheduler is not None:
+        await scheduler.stop()
+    batcher.stop()
+
+
+app = FastAPI(title="ml-agent", version="0.1.0", lifespan=lifespan)
+app.mount("/metrics", make_asgi_app(metrics.scrape_registry()))
 
 
 @app.get("/healthz")
@@ -28,63 +223,328 @@ def healthz() -> Dict[str, str]:
     return {"status": "ok"}
 
 
+@app.get("/readyz")
+def readyz() -> Dict[str, Any]:
+    """
+    Readiness: passes once every model has been warmed up on a synthetic snapshot
+    (ML_AGENT_WARMUP_ROUNDS), 503 until then. /healthz only reports liveness.
+    """
+    if not warmup_state["done"]:
+        raise HTTPException(status_code=503, detail=warmup_state["error"] or "Warming up")
+    return {"status": "ready", "warmup_seconds": warmup_state["seconds"]}
+
+
 @app.post("/predict", response_model=PredictResponse)
-async def predict(request: Request) -> PredictResponse:
+async def predict(
+    request: Request,
+    format_: Optional[str] = Query(default=None, alias="format"),
+    target_selector: Optional[str] = None,
+) -> Any:
     """
     Accepts a Load Watcher JSON payload in the request body.
     The agent infers the current host in where the app is running by finding which node bucket contains torchserve metrics.
+    ?target_selector=key=value,... restricts the candidate targets to nodes with matching registry labels.
+    Clients may ask for the compact columnar format via ?format=compact|msgpack or the Accept header;
+    it is encoded directly, without response-model validation.
+    Every stage, serialization included, is timed into ml_agent_predict_stage_seconds.
     """
+    received = time.perf_counter()
+    raw = await request.body()
+    metrics.REQUEST_PAYLOAD_BYTES.labels("/predict").observe(len(raw))
+    started = time.perf_counter()
     try:
-        payload: Dict[str, Any] = await request.json()
+        payload: Dict[str, Any] = json.loads(raw)
     except Exception as exc:
         raise HTTPException(status_code=400, detail=f"Invalid JSON payload: {exc}") from exc
+    target_ids = _select_targets(target_selector)
     try:
-        result = predictor.predict_for_all_targets(
-            load_watcher_payload=payload
-        )
+        snapshot = SnapshotIndex.from_payload(payload)
+        parsed = time.perf_counter()
+        _observe(snapshot)
+        observed = time.perf_counter()
+        result = await batcher.submit(snapshot, target_ids)
     except Exception as exc:
         raise HTTPException(status_code=400, detail=f"Inference failed: {exc}") from exc
+    timings = {"parse": parsed - started, "observe": observed - parsed, **result.timings}
+
+    responding = time.perf_counter()
+    response_format = negotiate_format(format_, request.headers.get("accept"))
+    if response_format == "json":
+        response = _build_predict_response(result)
+        serializing = time.perf_counter()
+        content = response.model_dump_json().encode()
+        _record_request("/predict", received, timings, responding, serializing)
+        return Response(content=content, media_type="application/json")
 
+    body = _build_compact_body(result)
+    serializing = time.perf_counter()
+    if response_format == "msgpack":
+        content, media_type = encode_msgpack(body), MSGPACK_MEDIA_TYPE
+    else:
+        content, media_type = encode_compact_json(body), COMPACT_JSON_MEDIA_TYPE
+    _record_request("/predict", received, timings, responding, serializing)
+    return Response(content=content, media_type=media_type)
+
+
+@app.post("/predict/batch", response_model=BatchPredictResponse)
+async def predict_batch(
+    request: Request, target_selector: Optional[str] = None, observe: bool = False
+) -> BatchPredictResponse:
+    """
+    Accepts many Load Watcher payloads, either as a JSON array or as NDJSON (one payload per line).
+    All snapshots go through a single model call; results are returned in input order, and
+    snapshots that cannot be predicted get a per-item error instead of failing the batch.
+    ?target_selector applies to every snapshot, as in /predict. Batches are usually
+    replays of recorded snapshots, so they only feed the live history and forecaster
+    with ?observe=true.
+    """
+    target_ids = _select_targets(target_selector)
+    body = await request.body()
+    metrics.REQUEST_PAYLOAD_BYTES.labels("/predict/batch").observe(len(body))
+    content_type = request.headers.get("content-type", "")
+    items: List[Any] = []
+    if "ndjson" in content_type:
+        for line in body.splitlines():
+            if not line.strip():
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError as exc:
+                items.append(ValueError(f"Invalid JSON payload: {exc}"))
+    else:
+        try:
+            parsed = json.loads(body)
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=f"Invalid JSON payload: {exc}") from exc
+        if not isinstance(parsed, list):
+            raise HTTPException(status_code=400, detail="Batch payload must be a JSON array or NDJSON.")
+        items = parsed
+    metrics.REQUEST_BATCH_ITEMS.observe(len(items))
+
+    snapshots: List[SnapshotIndex] = []
+    positions: List[int] = []
+    errors: Dict[int, str] = {}
+    for idx, item in enumerate(items):
+        if isinstance(item, Exception):
+            errors[idx] = str(item)
+        elif not isinstance(item, dict):
+            errors[idx] = "Payload must be a JSON object."
+        else:
+            try:
+                snapshot = SnapshotIndex.from_payload(item)
+            except Exception as exc:
+                errors[idx] = f"Invalid payload: {exc}"
+                continue
+            if observe:
+                _observe(snapshot)
+            snapshots.append(snapshot)
+            positions.append(idx)
+
+    try:
+        outcomes = await run_in_threadpool(predictor.predict_snapshots, snapshots, target_ids)
+    except Exception as exc:
+        raise HTTPException(status_code=400, detail=f"Inference failed: {exc}") from exc
+
+    results: Dict[int, PredictResponse] = {}
+    for idx, outcome in zip(positions, outcomes):
+        if isinstance(outcome, Exception):
+            errors[idx] = f"Inference failed: {outcome}"
+        else:
+            metrics.record_stage_timings(outcome.timings)
+            results[idx] = _build_predict_response(outcome)
+
+    return BatchPredictResponse(
+        items=[
+            BatchPredictItem(index=idx, result=results.get(idx), error=errors.get(idx))
+            for idx in range(len(items))
+        ]
+    )
+
+
+@app.post("/predict/apps", response_model=AppsPredictResponse)
+async def predict_apps(request: Request, target_selector: Optional[str] = None) -> AppsPredictResponse:
+    """
+    Accepts one Load Watcher payload and predicts every configured application
+    running in it (ML_AGENT_APP_SCHEMAS), one model call per distinct model.
+    Applications that cannot be predicted (e.g. not running) get a per-item error.
+    """
+    raw = await request.body()
+    metrics.REQUEST_PAYLOAD_BYTES.labels("/predict/apps").observe(len(raw))
+    try:
+        payload: Dict[str, Any] = json.loads(raw)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=f"Invalid JSON payload: {exc}") from exc
+    try:
+        selector = parse_selector(target_selector)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    try:
+        snapshot = SnapshotIndex.from_payload(payload)
+        _observe(snapshot)
+        outcomes = await run_in_threadpool(apps.predict_apps, snapshot, selector)
+    except Exception as exc:
+        raise HTTPException(status_code=400, detail=f"Inference failed: {exc}") from exc
+
+    items: List[AppPredictItem] = []
+    for name, outcome in outcomes.items():
+        if isinstance(outcome, Exception):
+            items.append(AppPredictItem(app=name, error=f"Inference failed: {outcome}"))
+            continue
+        metrics.record_stage_timings(outcome.timings)
+        id_to_name = apps.by_app[name].registry.id_to_name
+        items.append(AppPredictItem(app=name, result=_build_predict_response(outcome, id_to_name)))
+    return AppsPredictResponse(items=items)
+
+
+@app.websocket("/predict/stream")
+async def predict_stream(
+    websocket: WebSocket,
+    format_: Optional[str] = Query(default=None, alias="format"),
+    target_selector: Optional[str] = None,
+) -> None:
+    """
+    Persistent prediction channel (see app.streaming): every message is a Load Watcher
+    payload and every reply the compact body of its prediction, tagged with the
+    snapshot timestamp, the message seq and the session's dropped count.
+    Replies are JSON text frames, or binary msgpack frames with ?format=msgpack.
+    Up to ML_AGENT_STREAM_BUFFER snapshots wait for prediction; the oldest is dropped beyond that.
+    """
+    binary = (format_ or "").strip().lower() == "msgpack"
+    await websocket.accept()
+    try:
+        target_ids = _select_targets(target_selector)
+    except HTTPException as exc:
+        await websocket.close(code=1008, reason=str(exc.detail))
+        return
+
+    async def handle(raw: bytes, received: float) -> Tuple[Optional[int], Dict[str, Any]]:
+        started = time.perf_counter()
+        metrics.REQUEST_PAYLOAD_BYTES.labels("/predict/stream").observe(len(raw))
+        try:
+            payload = json.loads(raw)
+        except ValueError as exc:
+            return None, {"error": f"Invalid JSON payload: {exc}"}
+        if not isinstance(payload, dict):
+            return None, {"error": "Payload must be a JSON object."}
+        timestamp = payload.get("timestamp")
+        try:
+            snapshot = SnapshotIndex.from_payload(payload)
+            parsed = time.perf_counter()
+            _observe(snapshot)
+            observed = time.perf_counter()
+            result = await batcher.submit(snapshot, target_ids)
+        except Exception as exc:
+            return timestamp, {"error": f"Inference failed: {exc}"}
+        timings = {"parse": parsed - started, "observe": observed - parsed, **result.timings}
+        responding = time.perf_counter()
+        body = _build_compact_body(result)
+        finished = time.perf_counter()
+        # Frames are encoded by the session after tagging, so there is no serialize stage here
+        timings["response"] = finished - responding
+        metrics.record_stage_timings(timings)
+        log_slow_request("/predict/stream", finished - received, timings)
+        return timestamp, body
+
+    def encode(body: Dict[str, Any]) -> Tuple[bytes, bool]:
+        if "error" in body:
+            return (msgpack.packb(body, use_bin_type=True) if binary else orjson.dumps(body)), binary
+        return (encode_msgpack(body) if binary else encode_compact_json(body)), binary
+
+    await StreamSession(websocket, handle, encode, int(stream_settings["buffer_size"])).run()
+
+
+@app.get("/forecast", response_model=ForecastResponse)
+def forecast(horizon: int = Query(default=1, ge=1)) -> ForecastResponse:
+    """
+    h-step-ahead energy/throughput/latency forecasts per host, one step per observed
+    payload interval. State is updated incrementally from every /predict payload.
+    Refused with several worker processes, since each one only sees part of them.
+    """
+    if MULTI_WORKER:
+        raise HTTPException(
+            status_code=409, detail="/forecast needs ML_AGENT_WORKERS=1; each worker only sees part of the payloads."
+        )
+    if horizon > MAX_FORECAST_HORIZON:
+        raise HTTPException(status_code=400, detail=f"horizon must be <= {MAX_FORECAST_HORIZON}")
+    return ForecastResponse(
+        horizon=horizon,
+        series=len(forecaster),
+        forecasts=forecaster.forecasts_by_kind(horizon),
+    )
+
+
+@app.post("/admin/profile")
+async def profile(
+    seconds: float = Query(default=5.0, gt=0),
+    mode: str = Query(default="cpu"),
+    top: int = Query(default=30, ge=1, le=500),
+    include_idle: bool = False,
+    format_: str = Query(default="json", alias="format"),
+) -> Any:
+    """
+    Profile the running process for `seconds` and return the report (see app.profiling):
+    mode=cpu samples every thread's stack, mode=memory diffs tracemalloc snapshots.
+    format=collapsed returns cpu samples as folded stacks for flamegraph tools.
+    Disabled unless ML_AGENT_PROFILER_ENABLED is set.
+    """
+    if not profiler_settings["enabled"]:
+        raise HTTPException(status_code=404, detail="Profiler is disabled; set ML_AGENT_PROFILER_ENABLED=true.")
+    if mode not in PROFILE_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of {list(PROFILE_MODES)}")
+    if seconds > profiler_settings["max_seconds"]:
+        raise HTTPException(status_code=400, detail=f"seconds must be <= {profiler_settings['max_seconds']:g}")
+    try:
+        report = await run_in_threadpool(profiler.run, mode, seconds, top, include_idle)
+    except RuntimeError as exc:
+        raise HTTPException(status_code=409, detail=str(exc)) from exc
+    if format_ == "collapsed" and mode == "cpu":
+        return Response(content="\n".join(report["collapsed"]) + "\n", media_type="text/plain")  # type: ignore[arg-type]
+    return report
+
+
+def _output_columns(num_outputs: int) -> List[str]:
     # Derive column names, honoring configured overrides and result width
-    any_row = next(iter(result.values()), [])
-    num_outputs = len(any_row)
     configured = get_output_names()
     if len(configured) >= num_outputs:
-        columns = configured[:num_outputs]
-    else:
-        # Fallback to generic names if configured list is shorter
-        columns = [f"y_{i}" for i in range(num_outputs)]
-
-    # Detect source host and id for clarity in response
-    node_metrics_map = (payload or {}).get("data", {}).get("NodeMetricsMap", {}) or {}
-    host_name = detect_current_host_with_app_metrics(node_metrics_map)
-    if not host_name:
-        raise HTTPException(status_code=400, detail="Unable to determine current_host from payload.")
-    src_id = predictor.node_name_to_id.get(host_name)
-    if src_id is None:
-        raise HTTPException(status_code=400, detail=f"Unknown current_host_name '{host_name}' in node map.")
+        return configured[:num_outputs]
+    # Fallback to generic names if configured list is shorter
+    return [f"y_{i}" for i in range(num_outputs)]
+
+
+def _build_predict_response(result: PredictionResult, id_to_name: Optional[Dict[int, str]] = None) -> PredictResponse:
+    any_row = next(iter(result.predictions.values()), [])
+    columns = _output_columns(len(any_row))
 
     # Build a target id->hostname map for only the returned predictions
-    id_to_name = {v: k for k, v in predictor.node_name_to_id.items()}
-    target_map: Dict[int, str] = {int(tid): id_to_name.get(int(tid), "") for tid in result.keys()}
-
-    # Reconstruct the exact input feature rows used by the model for transparency
-    target_ids_in_order = [int(tid) for tid in result.keys()]
-    features_df = build_feature_rows_from_payload(
-        payload=payload,
-        node_name_to_id=predictor.node_name_to_id,
-        target_node_ids=target_ids_in_order,
-    )
-    input_features: Dict[int, Dict[str, float]] = {}
-    for idx, tid in enumerate(target_ids_in_order):
-        row_series = features_df.iloc[idx]
-        input_features[int(tid)] = {str(col): float(row_series[col]) for col in features_df.columns}
+    id_to_name = id_to_name if id_to_name is not None else predictor.registry.id_to_name
+    target_map: Dict[int, str] = {tid: id_to_name.get(tid, "") for tid in result.target_ids}
+
+    # Expose the exact input feature rows used by the model for transparency
+    input_features: Dict[int, Dict[str, float]] = {
+        tid: dict(zip(result.feature_columns, row))
+        for tid, row in zip(result.target_ids, result.features.tolist())
+    }
 
     return PredictResponse(
         columns=columns,
-        source_host=host_name,
-        source_id=int(src_id),
+        source_host=result.source_host,
+        source_id=result.source_id,
         target_map=target_map,
         input_features=input_features,
-        predictions=result,
+        predictions=result.predictions,
+    )
+
+
+def _build_compact_body(result: PredictionResult) -> Dict[str, Any]:
+    id_to_name = predictor.registry.id_to_name
+    outputs = result.outputs if result.outputs is not None else np.zeros((0, 0))
+    return compact_body(
+        columns=_output_columns(outputs.shape[1] if outputs.ndim == 2 else 0),
+        source_host=result.source_host,
+        source_id=result.source_id,
+        target_ids=result.target_ids,
+        target_hosts=[id_to_name.get(tid, "") for tid in result.target_ids],
+        feature_columns=result.feature_columns,
+        features=result.features,
+        predictions=outputs,
     )
@@ -0,0 +1,81 @@
+"""
+Compact columnar encodings of a prediction result.
+Columns and target ids are sent once and features/predictions as row-major
+float arrays, encoded with orjson or msgpack instead of nested per-target dicts.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional
+
+import msgpack
+import numpy as np
+import orjson
+
+COMPACT_JSON_MEDIA_TYPE = "application/vnd.ml-agent.compact+json"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+
+# Values accepted in ?format= and the media types that select them in Accept
+FORMAT_MEDIA_TYPES: Dict[str, str] = {
+    "compact": COMPACT_JSON_MEDIA_TYPE,
+    "msgpack": MSGPACK_MEDIA_TYPE,
+}
+_ACCEPT_FORMATS: Dict[str, str] = {
+    COMPACT_JSON_MEDIA_TYPE: "compact",
+    MSGPACK_MEDIA_TYPE: "msgpack",
+    "application/x-msgpack": "msgpack",
+}
+
+
+def negotiate_format(query_format: Optional[str], accept: Optional[str]) -> str:
+    """
+    Pick the response format: an explicit ?format= wins, then the first Accept
+    media type we know; anything else gets the default "json" response.
+    """
+    if query_format:
+        value = query_format.strip().lower()
+        return value if value in FORMAT_MEDIA_TYPES else "json"
+    for part in (accept or "").split(","):
+        media_type = part.split(";", 1)[0].strip().lower()
+        if media_type in _ACCEPT_FORMATS:
+            return _ACCEPT_FORMATS[media_type]
+    return "json"
+
+
+def compact_body(
+    *,
+    columns: List[str],
+    source_host: str,
+    source_id: int,
+    target_ids: List[int],
+    target_hosts: List[str],
+    feature_columns: List[str],
+    features: np.ndarray,
+    predictions: np.ndarray,
+) -> Dict[str, Any]:
+    return {
+        "columns": columns,
+        "source_host": source_host,
+        "source_id": source_id,
+        "target_ids": target_ids,
+        "target_hosts": target_hosts,
+        "feature_columns": feature_columns,
+        "features": np.ascontiguousarray(features, dtype=np.float64),
+        "predictions": np.ascontiguousarray(predictions, dtype=np.float64),
+    }
+
+
+def encode_compact_json(body: Dict[str, Any]) -> bytes:
+    # 2D arrays serialize as nested lists; flatten to keep the row-major contract
+    flat = dict(body)
+    flat["features"] = body["features"].reshape(-1)
+    flat["predictions"] = body["predictions"].reshape(-1)
+    return orjson.dumps(flat, option=orjson.OPT_SERIALIZE_NUMPY)
+
+
+def encode_msgpack(body: Dict[str, Any]) -> bytes:
+    # Float arrays travel as raw little-endian float64 bytes
+    packed = dict(body)
+    packed["dtype"] = "<f8"
+    packed["features"] = body["features"].astype("<f8", copy=False).tobytes()
+    packed["predictions"] = body["predictions"].astype("<f8", copy=False).tobytes()
+    return msgpack.packb(packed, use_bin_type=True)
@@ -0,0 +1,338 @@
+"""
+Concurrent Prometheus collector producing Load Watcher shaped snapshots.
+Replaces the blocking, recursive DeploymentStatus.fetch_prom* calls of the legacy
+collector: node and app metrics are fetched with grouped PromQL queries over one
+pooled httpx.AsyncClient, values are validated in one vectorized pass and failed
+queries are retried with bounded exponential backoff.
+
+Collect once from the command line:
+  python -m app.collector.prom_client --url http://prometheus-k8s:9090 --pod-regex 'torchserve.*'
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import httpx
+import numpy as np
+
+LOGGER = logging.getLogger(__name__)
+
+NODE_METRICS: Tuple[str, ...] = (
+    "kepler:cpu_rate:1m:by_node",
+    "kepler:node_platform_watt:1m:by_node",
+    "kepler:node_platform_joules:1m:by_node",
+)
+APP_METRICS: Tuple[str, ...] = (
+    "kepler:container_torchserve_cpu_rate:1m",
+    "kepler:container_torchserve_watt:1m",
+    "kepler:container_torchserve_joules:1m",
+)
+TS_METRICS: Tuple[str, ...] = ("ts:latency:1m:ms", "ts:throughput:1m:rps")
+USERS_METRIC = "locust_current_users"
+
+# Upper bounds from the legacy collector; larger samples are treated as scrape glitches
+METRIC_LIMITS: Dict[str, float] = {
+    "kepler:cpu_rate:1m:by_node": 12000,
+    "kepler:node_platform_watt:1m:by_node": 300,
+    "kepler:node_platform_joules:1m:by_node": 18000,
+    "kepler:container_torchserve_cpu_rate:1m": 12000,
+    "kepler:container_torchserve_watt:1m": 300,
+    "kepler:container_torchserve_joules:1m": 18000,
+    "ts:latency:1m:ms": 2000,
+    "ts:throughput:1m:rps": 200,
+    USERS_METRIC: 70,
+}
+
+# Labels naming the host of a sample, in the order Load Watcher prefers them
+HOST_LABELS: Tuple[str, ...] = ("instance", "node", "nodename", "kubernetes_node")
+
+# Label carrying the metric name through arithmetic, which drops __name__
+METRIC_LABEL = "metric_name"
+
+
+@dataclass(frozen=True)
+class GroupQuery:
+    """
+    One PromQL query returning several metrics; samples are attributed to a
+    metric by METRIC_LABEL or __name__, or to `metric` when it is fixed.
+    """
+
+    expr: str
+    metrics: Tuple[str, ...]
+    metric: Optional[str] = None
+
+
+@dataclass
+class _Sample:
+    host: str
+    name: str
+    value: float
+
+
+@dataclass
+class CollectStats:
+    queries: int = 0
+    retries: int = 0
+    rejected: int = 0
+    failed_queries: List[str] = field(default_factory=list)
+
+    @property
+    def complete(self) -> bool:
+        return not self.failed_queries
+
+
+class CollectError(RuntimeError):
+    """Every query of a collection failed, so there is no snapshot to return."""
+
+
+def _name_regex(metrics: Sequence[str]) -> str:
+    # Metric names cannot contain regex metacharacters other than ':' and '_'
+    return "|".join(metrics)
+
+
+def build_queries(pod_regex: str = "", include_ts: bool = True, include_users: bool = True) -> List[GroupQuery]:
+    """
+    Queries equivalent to Load Watcher's recording-rule mode, with metrics that
+    share a shape merged into one query each.
+    """
+    queries = [GroupQuery(f'{{__name__=~"{_name_regex(NODE_METRICS)}"}}', NODE_METRICS)]
+
+    app_metrics = APP_METRICS + (TS_METRICS if include_ts else ())
+    if pod_regex:
+        # Normalize pod_name to pod, tag each series with its metric name and
+        # project it onto its node via kube_pod_info, like Load Watcher does per metric
+        selector = f'__name__=~"{_name_regex(app_metrics)}"'
+        by_pod = f'{{{selector},pod=~"{pod_regex}"}}'
+        by_pod_name = f'label_replace({{{selector},pod_name=~"{pod_regex}"}},"pod","$1","pod_name","(.*)")'
+        tagged = f'label_replace(({by_pod}) or ({by_pod_name}),"{METRIC_LABEL}","$1","__name__","(.+)")'
+        nodes = f'max by (pod,node) (kube_pod_info{{pod=~"{pod_regex}"}})'
+        expr = f"sum by (node,{METRIC_LABEL}) (({tagged}) * on(pod) group_left(node) ({nodes}))"
+        queries.append(GroupQuery(expr, app_metrics))
+    else:
+        queries.append(GroupQuery(f'{{__name__=~"{_name_regex(app_metrics)}"}}', app_metrics))
+
+    if include_users:
+        if pod_regex:
+            mask = f'count by (node) (max by (pod,node) (kube_pod_info{{pod=~"{pod_regex}"}})) > bool 0'
+            # One users total on the left, one series per node on the right: keep the node label
+            expr = f"sum({USERS_METRIC}) * on() group_right ({mask})"
+        else:
+            expr = f"sum({USERS_METRIC})"
+        queries.append(GroupQuery(expr, (USERS_METRIC,), metric=USERS_METRIC))
+    return queries
+
+
+def metric_type(name: str) -> str:
+    # Same heuristic Load Watcher applies to recording rules
+    if "_joules" in name:
+        return "Energy"
+    if "cpu" in name:
+        return "CPU"
+    return "Unknown"
+
+
+def _sample_host(labels: Dict[str, str]) -> str:
+    for label in HOST_LABELS:
+        value = labels.get(label)
+        if value:
+            return value
+    return ""
+
+
+def validate_samples(
+    samples: Sequence[_Sample], reject_zero: bool = False
+) -> Tuple[List[_Sample], int]:
+    """
+    Drop NaN/inf and above-limit values in one vectorized pass, and zeros with
+    reject_zero (Kepler reports 0 while restarting, but idle nodes are legitimately
+    0 too). Returns the valid samples and the number rejected.
+    """
+    if not samples:
+        return [], 0
+    values = np.fromiter((s.value for s in samples), dtype=np.float64, count=len(samples))
+    limits = np.fromiter(
+        (METRIC_LIMITS.get(s.name, np.inf) for s in samples), dtype=np.float64, count=len(samples)
+    )
+    valid = np.isfinite(values) & (values <= limits)
+    if reject_zero:
+        valid &= values != 0.0
+    kept = [sample for sample, ok in zip(samples, valid.tolist()) if ok]
+    return kept, len(samples) - len(kept)
+
+
+class PrometheusCollector:
+    """
+    Pooled, concurrent replacement for the legacy per-query collector.
+    All grouped queries of a cycle run concurrently on one keep-alive client.
+    A query is retried (up to max_attempts, with capped exponential backoff and
+    jitter) on transport/HTTP errors, a non-success status or a result without any
+    valid sample. Invalid samples are dropped and counted, without a retry.
+    A query that still fails after its last attempt marks the snapshot partial
+    ("partial": true); when every query fails, collect() raises CollectError.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        pod_regex: str = "",
+        include_ts: bool = True,
+        include_users: bool = True,
+        reject_zero: bool = False,
+        timeout_seconds: float = 10.0,
+        max_attempts: int = 3,
+        backoff_seconds: float = 0.5,
+        max_backoff_seconds: float = 5.0,
+        window_seconds: int = 900,
+        max_connections: int = 8,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.queries = build_queries(pod_regex, include_ts=include_ts, include_users=include_users)
+        self.reject_zero = reject_zero
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.window_seconds = window_seconds
+        self._timeout = timeout_seconds
+        self._limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self.last_stats = CollectStats()
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url, timeout=self._timeout, limits=self._limits, transport=self._transport
+            )
+        return self._client
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def __aenter__(self) -> "PrometheusCollector":
+        return self
+
+    async def __aexit__(self, *_exc: object) -> None:
+        await self.aclose()
+
+    async def collect(self) -> Dict[str, object]:
+        """
+        Run every query concurrently and return a Load Watcher style payload, with
+        "partial": true when some queries failed after every attempt. The metrics of
+        those queries are missing from it even though the nodes may report them.
+        """
+        stats = CollectStats(queries=len(self.queries))
+        end = int(time.time())
+        results = await asyncio.gather(*(self._run_query(query, end, stats) for query in self.queries))
+        self.last_stats = stats
+        if len(stats.failed_queries) == len(self.queries):
+            raise CollectError(f"All {len(self.queries)} Prometheus queries failed.")
+        snapshot = self._snapshot([sample for samples in results for sample in samples], end)
+        if not stats.complete:
+            LOGGER.warning(
+                "%d of %d Prometheus queries failed; snapshot is partial.",
+                len(stats.failed_queries), len(self.queries),
+            )
+            snapshot["partial"] = True
+        return snapshot
+
+    async def _run_query(self, query: GroupQuery, at: int, stats: CollectStats) -> List[_Sample]:
+        samples: List[_Sample] = []
+        for attempt in range(self.max_attempts):
+            if attempt:
+                stats.retries += 1
+                delay = min(self.max_backoff_seconds, self.backoff_seconds * (2 ** (attempt - 1)))
+                await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+            try:
+                samples = await self._query(query, at)
+            except (httpx.HTTPError, ValueError) as exc:
+                LOGGER.warning("Prometheus query failed (attempt %d/%d): %s", attempt + 1, self.max_attempts, exc)
+                continue
+            valid, rejected = validate_samples(samples, reject_zero=self.reject_zero)
+            if valid or attempt == self.max_attempts - 1:
+                stats.rejected += rejected
+                return valid
+            LOGGER.info(
+                "Prometheus query returned no valid samples (%d invalid; attempt %d/%d).",
+                rejected, attempt + 1, self.max_attempts,
+            )
+        stats.failed_queries.append(query.expr)
+        return []
+
+    async def _query(self, query: GroupQuery, at: int) -> List[_Sample]:
+        response = await self.client.get("/api/v1/query", params={"query": query.expr, "time": at})
+        response.raise_for_status()
+        body = response.json()
+        if body.get("status") != "success":
+            raise ValueError(f"{body.get('errorType', 'error')}: {body.get('error', 'query failed')}")
+        samples: List[_Sample] = []
+        for result in (body.get("data") or {}).get("result", []) or []:
+            labels: Dict[str, str] = result.get("metric") or {}
+            name = query.metric or labels.get(METRIC_LABEL) or labels.get("__name__", "")
+            if name not in query.metrics:
+                continue
+            try:
+                value = float(result["value"][1])
+            except (KeyError, IndexError, TypeError, ValueError):
+                value = float("nan")
+            samples.append(_Sample(_sample_host(labels), name, value))
+        return samples
+
+    def _snapshot(self, samples: Sequence[_Sample], end: int) -> Dict[str, object]:
+        node_metrics_map: Dict[str, Dict[str, List[Dict[str, object]]]] = {}
+        seen = set()
+        for sample in samples:
+            # One value per (host, metric), like Load Watcher's dedup
+            if (sample.host, sample.name) in seen:
+                continue
+            seen.add((sample.host, sample.name))
+            node_metrics_map.setdefault(sample.host, {"metrics": []})["metrics"].append(
+                {
+                    "name": sample.name,
+                    "type": metric_type(sample.name),
+                    "operator": "Latest",
+                    "rollup": "1m",
+                    "value": sample.value,
+                }
+            )
+        return {
+            "timestamp": end,
+            "window": {
+                "duration": f"{self.window_seconds // 60}m",
+                "start": end - self.window_seconds,
+                "end": end,
+            },
+            "source": "Prometheus",
+            "data": {"NodeMetricsMap": node_metrics_map},
+        }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Collect one Load Watcher style snapshot from Prometheus.")
+    parser.add_argument("--url", required=True, help="Prometheus base URL.")
+    parser.add_argument("--pod-regex", default="", help="Regex of the watched application pods.")
+    parser.add_argument("--no-ts", action="store_true", help="Skip TorchServe latency/throughput metrics.")
+    parser.add_argument("--no-users", action="store_true", help="Skip the locust users metric.")
+    args = parser.parse_args()
+
+    async def _collect() -> Dict[str, object]:
+        async with PrometheusCollector(
+            args.url, pod_regex=args.pod_regex, include_ts=not args.no_ts, include_users=not args.no_users
+        ) as collector:
+            return await collector.collect()
+
+    print(json.dumps(asyncio.run(_collect()), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,11 @@
 from __future__ import annotations
 
+import json
 import os
 from dataclasses import dataclass
-from typing import Dict, List, Tuple
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, TypeVar
+
+N = TypeVar("N", int, float)
 
 
 @dataclass(frozen=True)
@@ -38,8 +41,8 @@ FEATURE_RANGES: Dict[str, FeatureScaleRange] = {
 }
 
 
-# Node identity configuration: map Kubernetes node names to stable 1..4 IDs
-# Default ordering follows the previously used list in the project.
+# Node identity of the packaged model: Kubernetes node names -> ids 1..4, in the
+# order it was trained with. Other clusters load a node registry instead.
 HOSTNAME_LIST_DEFAULT: List[str] = [
     "cloudskin-k8s-edge-worker-1.novalocal",
     "cloudskin-k8s-control-plane-0.novalocal",
@@ -47,9 +50,45 @@ HOSTNAME_LIST_DEFAULT: List[str] = [
     "cloudskin-k8s-edge-worker-2.novalocal",
 ]
 NODE_NAME_TO_ID_DEFAULT: Dict[str, int] = {
-    name: i + 1 for i, name in enumerate(HOSTNAME_LIST_DEFAULT[:4])
+    name: i + 1 for i, name in enumerate(HOSTNAME_LIST_DEFAULT)
 }
-VALID_NODE_IDS: List[int] = [1, 2, 3, 4]
+
+# Model inputs preceding the node one-hot columns
+BASE_FEATURE_ORDER: List[str] = [
+    "torchserve_app_user",
+    "torchserve_node_cpu_src",
+    "torchserve_node_energy_src",
+    "torchserve_node_power_src",
+    "torchserve_app_cpu_src",
+    "torchserve_app_energy_src",
+    "torchserve_app_power_src",
+    "torchserve_app_latency_src",
+    "torchserve_app_qps_src",
+]
+
+
+def _env_number(name: str, default: N, cast: Callable[[str], N] = float) -> N:  # type: ignore[assignment]
+    """Env var `name` parsed with `cast`, or `default` when it is unset, empty or malformed."""
+    raw = os.environ.get(name, "").strip()
+    if not raw:
+        return default
+    try:
+        return cast(raw)
+    except ValueError:
+        return default
+
+
+def _env_positive(name: str, default: float) -> float:
+    """Float env var that must be > 0; anything else gives `default`."""
+    value = _env_number(name, default)
+    return value if value > 0 else default
+
+
+def _env_flag(name: str, default: bool) -> bool:
+    raw = os.environ.get(name)
+    if raw is None:
+        return default
+    return raw.strip().lower() in ("1", "true", "yes", "on")
 
 
 def get_model_path() -> str:
@@ -59,30 +98,269 @@ def get_model_path() -> str:
     )
 
 
-def get_feature_order() -> List[str]:
+def get_model_weights_dir() -> Optional[str]:
     """
-    The exact input column order expected by the MLP model.
+    Optional directory with a .npy weight bundle (see app.forecasting.weights), via
+    ML_AGENT_WEIGHTS_DIR. The numpy engine memory-maps it so worker processes share the weights.
     """
-    base_features = [
-        "torchserve_app_user",
-        "torchserve_node_cpu_src",
-        "torchserve_node_energy_src",
-        "torchserve_node_power_src",
-        "torchserve_app_cpu_src",
-        "torchserve_app_energy_src",
-        "torchserve_app_power_src",
-        "torchserve_app_latency_src",
-        "torchserve_app_qps_src",
-    ]
-    src_ohe = [f"node_id_src_{i}" for i in VALID_NODE_IDS]
-    tgt_ohe = [f"node_id_tgt_{i}" for i in VALID_NODE_IDS]
-    return base_features + src_ohe + tgt_ohe
+    return os.environ.get("ML_AGENT_WEIGHTS_DIR") or None
+
+
+def get_serving_settings() -> Dict[str, object]:
+    """
+    Process layout of the HTTP server, overridable via env vars:
+      ML_AGENT_WORKERS       number of worker processes (default 1)
+      ML_AGENT_CPU_AFFINITY  CPUs to run on, e.g. "0-3,6"; split evenly across workers
+      ML_AGENT_BLAS_THREADS  BLAS/OpenMP threads per worker
+                             (default: the worker's CPU share, so workers x threads <= CPUs)
+    """
+    workers = max(1, _env_number("ML_AGENT_WORKERS", 1, int))
+    cpus: List[int] = []
+    for token in os.environ.get("ML_AGENT_CPU_AFFINITY", "").split(","):
+        token = token.strip()
+        try:
+            if "-" in token:
+                lo, hi = token.split("-", 1)
+                cpus.extend(range(int(lo), int(hi) + 1))
+            elif token:
+                cpus.append(int(token))
+        except ValueError:
+            continue
+    available = len(cpus) or os.cpu_count() or 1
+    blas_threads = max(1, _env_number("ML_AGENT_BLAS_THREADS", available // workers, int))
+    return {"workers": workers, "cpu_affinity": cpus, "blas_threads": blas_threads}
+
+
+def get_inference_engine() -> str:
+    """
+    Inference backend for the loaded model, selected via ML_AGENT_INFERENCE_ENGINE:
+      sklearn (default) - the estimator's own predict()
+      numpy             - native forward pass, used only if it matches sklearn at startup
+    """
+    value = os.environ.get("ML_AGENT_INFERENCE_ENGINE", "sklearn").strip().lower()
+    return value if value in ("sklearn", "numpy") else "sklearn"
+
+
+def get_inference_dtype() -> str:
+    """
+    Float precision of the numpy engine, via ML_AGENT_INFERENCE_DTYPE (float64 or float32).
+    """
+    value = os.environ.get("ML_AGENT_INFERENCE_DTYPE", "float64").strip().lower()
+    return value if value in ("float64", "float32") else "float64"
+
+
+def get_prediction_cache_settings() -> Dict[str, float]:
+    """
+    Prediction cache bounds, overridable via env vars:
+      ML_AGENT_CACHE_MAX_ENTRIES  (default 1024; 0 disables the cache)
+      ML_AGENT_CACHE_TTL_SECONDS  (default 60; 0 disables the cache)
+      ML_AGENT_CACHE_QUANTUM      (default 0; >0 rounds scaled features to this step before keying)
+    """
+    return {
+        "max_entries": int(max(0.0, _env_number("ML_AGENT_CACHE_MAX_ENTRIES", 1024.0))),
+        "ttl_seconds": max(0.0, _env_number("ML_AGENT_CACHE_TTL_SECONDS", 60.0)),
+        "quantum": max(0.0, _env_number("ML_AGENT_CACHE_QUANTUM", 0.0)),
+    }
+
+
+def get_history_settings() -> Dict[str, float]:
+    """
+    Time-series history bounds, overridable via env vars:
+      ML_AGENT_HISTORY_SLOTS       (default 60 values per (host, metric) series; 0 disables history)
+      ML_AGENT_HISTORY_EWMA_ALPHA  (default 0.3)
+      ML_AGENT_HISTORY_MAX_SERIES  (default 4096)
+    """
+    alpha = _env_number("ML_AGENT_HISTORY_EWMA_ALPHA", 0.3)
+    return {
+        "slots": int(max(0.0, _env_number("ML_AGENT_HISTORY_SLOTS", 60.0))),
+        "ewma_alpha": alpha if 0.0 < alpha <= 1.0 else 0.3,
+        "max_series": int(max(0.0, _env_number("ML_AGENT_HISTORY_MAX_SERIES", 4096.0))),
+    }
+
+
+def get_forecast_settings() -> Dict[str, object]:
+    """
+    Holt-Winters forecaster settings, overridable via env vars:
+      ML_AGENT_FORECAST_METRICS          (JSON object forecast name -> Load Watcher metric;
+                                          default energy/throughput/latency of torchserve)
+      ML_AGENT_FORECAST_ALPHA / _BETA / _GAMMA  (smoothing factors, defaults 0.5 / 0.1 / 0.1)
+      ML_AGENT_FORECAST_PHI              (trend damping, default 1.0 = undamped)
+      ML_AGENT_FORECAST_SEASONAL_PERIOD  (observations per season, default 0 = no seasonality)
+      ML_AGENT_FORECAST_MAX_SERIES       (default 1024)
+      ML_AGENT_FORECAST_MAX_HORIZON      (largest horizon served by /forecast, default 60)
+    """
+    def _fraction(name: str, default: float) -> float:
+        value = _env_number(name, default)
+        return value if 0.0 <= value <= 1.0 else default
+
+    metrics: Optional[Dict[str, str]] = None
+    raw = os.environ.get("ML_AGENT_FORECAST_METRICS")
+    if raw:
+        try:
+            parsed = json.loads(raw)
+        except ValueError:
+            parsed = None
+        if isinstance(parsed, dict) and parsed:
+            metrics = {str(k): str(v) for k, v in parsed.items()}
+
+    return {
+        "metrics": metrics,
+        "alpha": _fraction("ML_AGENT_FORECAST_ALPHA", 0.5),
+        "beta": _fraction("ML_AGENT_FORECAST_BETA", 0.1),
+        "gamma": _fraction("ML_AGENT_FORECAST_GAMMA", 0.1),
+        "phi": _fraction("ML_AGENT_FORECAST_PHI", 1.0),
+        "seasonal_period": max(0, _env_number("ML_AGENT_FORECAST_SEASONAL_PERIOD", 0, int)),
+        "max_series": max(1, _env_number("ML_AGENT_FORECAST_MAX_SERIES", 1024, int)),
+        "max_horizon": max(1, _env_number("ML_AGENT_FORECAST_MAX_HORIZON", 60, int)),
+    }
+
+
+def get_collector_settings() -> Optional[Dict[str, object]]:
+    """
+    Direct Prometheus collection, enabled by ML_AGENT_PROMETHEUS_URL. Other env vars:
+      ML_AGENT_WATCH_POD_REGEX          (regex of the watched app pods, like Load Watcher's WATCH_POD_REGEX)
+      ML_AGENT_COLLECT_TS               (default true; TorchServe latency/throughput)
+      ML_AGENT_COLLECT_USERS            (default true; locust users)
+      ML_AGENT_COLLECT_REJECT_ZERO      (default false; treat 0 as an invalid sample)
+      ML_AGENT_COLLECT_TIMEOUT_SECONDS  (default 10)
+      ML_AGENT_COLLECT_MAX_ATTEMPTS     (default 3)
+    Returns None when collection is disabled.
+    """
+    url = os.environ.get("ML_AGENT_PROMETHEUS_URL")
+    if not url:
+        return None
+
+    return {
+        "base_url": url,
+        "pod_regex": os.environ.get("ML_AGENT_WATCH_POD_REGEX", ""),
+        "include_ts": _env_flag("ML_AGENT_COLLECT_TS", True),
+        "include_users": _env_flag("ML_AGENT_COLLECT_USERS", True),
+        "reject_zero": _env_flag("ML_AGENT_COLLECT_REJECT_ZERO", False),
+        "timeout_seconds": max(0.1, _env_number("ML_AGENT_COLLECT_TIMEOUT_SECONDS", 10.0)),
+        "max_attempts": max(1, _env_number("ML_AGENT_COLLECT_MAX_ATTEMPTS", 3, int)),
+    }
+
+
+def get_scheduler_settings() -> Dict[str, object]:
+    """
+    In-process collect-forecast-export scheduler (runs when ML_AGENT_PROMETHEUS_URL is set):
+      ML_AGENT_SCHEDULER_INTERVAL_SECONDS  (default 60)
+      ML_AGENT_SCHEDULER_<STAGE>_DEADLINE_SECONDS for COLLECT / FEATURES / PREDICT / EXPORT
+                                           (defaults 15 / 5 / 10 / 5)
+    """
+    defaults = {"collect": 15.0, "features": 5.0, "predict": 10.0, "export": 5.0}
+    return {
+        "interval_seconds": _env_positive("ML_AGENT_SCHEDULER_INTERVAL_SECONDS", 60.0),
+        "deadlines": {
+            stage: _env_positive(f"ML_AGENT_SCHEDULER_{stage.upper()}_DEADLINE_SECONDS", default)
+            for stage, default in defaults.items()
+        },
+    }
+
+
+def get_export_settings() -> Dict[str, float]:
+    """
+    Cardinality bounds of the Prometheus prediction exporter, overridable via env vars:
+      ML_AGENT_EXPORT_MAX_SOURCES    (default 16 source hosts)
+      ML_AGENT_EXPORT_MAX_TARGETS    (default 256 target nodes per source)
+      ML_AGENT_EXPORT_STALE_SECONDS  (default 600; sources not updated for this long are dropped, 0 keeps them)
+      ML_AGENT_EXPORT_STALE_CYCLES   (default 3; nodes missing from this many complete collections are dropped,
+                                      0 keeps them)
+    """
+    return {
+        "max_sources": int(max(0.0, _env_number("ML_AGENT_EXPORT_MAX_SOURCES", 16.0))),
+        "max_targets": int(max(0.0, _env_number("ML_AGENT_EXPORT_MAX_TARGETS", 256.0))),
+        "stale_seconds": max(0.0, _env_number("ML_AGENT_EXPORT_STALE_SECONDS", 600.0)),
+        "stale_cycles": int(max(0.0, _env_number("ML_AGENT_EXPORT_STALE_CYCLES", 3.0))),
+    }
+
+
+def get_batching_settings() -> Dict[str, float]:
+    """
+    Micro-batching of /predict requests, overridable via env vars:
+      ML_AGENT_BATCH_MAX_SIZE     (default 32) snapshots per model call
+      ML_AGENT_BATCH_MAX_WAIT_MS  (default 2) how long the first request waits for others
+    """
+    return {
+        "max_batch_size": max(1, _env_number("ML_AGENT_BATCH_MAX_SIZE", 32, int)),
+        "max_wait_ms": max(0.0, _env_number("ML_AGENT_BATCH_MAX_WAIT_MS", 2.0)),
+    }
+
+
+def get_stream_settings() -> Dict[str, int]:
+    """
+    /predict/stream WebSocket sessions, overridable via env vars:
+      ML_AGENT_STREAM_BUFFER  (default 4) snapshots buffered per session; the oldest is dropped when full
+    """
+    return {"buffer_size": max(1, _env_number("ML_AGENT_STREAM_BUFFER", 4, int))}
+
+
+def get_warmup_settings() -> Dict[str, int]:
+    """
+    Start-up warmup gating /readyz, overridable via env vars:
+      ML_AGENT_WARMUP_ROUNDS  (default 3) synthetic predictions per application; 0 is ready without warmup
+    """
+    return {"rounds": max(0, _env_number("ML_AGENT_WARMUP_ROUNDS", 3, int))}
+
+
+def get_logging_settings() -> Dict[str, object]:
+    """
+    Logging, overridable via env vars:
+      ML_AGENT_LOG_LEVEL        (default INFO)
+      ML_AGENT_SLOW_REQUEST_MS  (default 0 = off) log the stage timings of slower prediction requests
+    """
+    level = os.environ.get("ML_AGENT_LOG_LEVEL", "INFO").strip().upper() or "INFO"
+    return {"level": level, "slow_request_ms": max(0.0, _env_number("ML_AGENT_SLOW_REQUEST_MS", 0.0))}
+
+
+def get_profiler_settings() -> Dict[str, float]:
+    """
+    On-demand profiling through POST /admin/profile, overridable via env vars:
+      ML_AGENT_PROFILER_ENABLED      (default false)
+      ML_AGENT_PROFILER_MAX_SECONDS  (default 60) longest profile a request may ask for
+      ML_AGENT_PROFILER_INTERVAL_MS  (default 5) CPU sampling interval
+    """
+    return {
+        "enabled": _env_flag("ML_AGENT_PROFILER_ENABLED", False),
+        "max_seconds": _env_positive("ML_AGENT_PROFILER_MAX_SECONDS", 60.0),
+        "interval_seconds": _env_positive("ML_AGENT_PROFILER_INTERVAL_MS", 5.0) / 1000.0,
+    }
+
+
+def get_feature_order(node_ids: Optional[Sequence[int]] = None) -> List[str]:
+    """
+    Model input column order: the base features followed by source and target
+    one-hot columns for every node id (default: the packaged model's ids).
+    Used when neither the node registry nor the model carries its own feature names.
+    """
+    ids = sorted(node_ids) if node_ids is not None else sorted(NODE_NAME_TO_ID_DEFAULT.values())
+    src_ohe = [f"node_id_src_{i}" for i in ids]
+    tgt_ohe = [f"node_id_tgt_{i}" for i in ids]
+    return BASE_FEATURE_ORDER + src_ohe + tgt_ohe
+
+
+def get_app_schemas_path() -> Optional[str]:
+    """
+    Optional JSON file of per-application feature schemas (see app.preprocessing.schema),
+    via ML_AGENT_APP_SCHEMAS. Defaults to the single torchserve application.
+    """
+    return os.environ.get("ML_AGENT_APP_SCHEMAS") or None
+
+
+def get_node_registry_path() -> Optional[str]:
+    """
+    Optional JSON node registry (node ids, labels and model feature order, see
+    app.preprocessing.nodes), via ML_AGENT_NODE_REGISTRY. Takes precedence over ML_AGENT_NODE_MAP.
+    """
+    return os.environ.get("ML_AGENT_NODE_REGISTRY") or None
 
 
 def get_node_name_to_id_override() -> Dict[str, int]:
     """
     Optionally override node mapping via env vars:
-      ML_AGENT_NODE_MAP=name1:1,name2:2,name3:3,name4:4
+      ML_AGENT_NODE_MAP=name1:1,name2:2,...,nameN:N
+    Any positive id is accepted; nodes the model has no input columns for are
+    left out (with a warning) when the predictor is built.
     """
     raw = os.environ.get("ML_AGENT_NODE_MAP")
     if not raw:
@@ -96,8 +374,8 @@ def get_node_name_to_id_override() -> Dict[str, int]:
             node_id = int(id_str)
         except ValueError:
             continue
-        if node_id in VALID_NODE_IDS and name:
-            mapping[name] = node_id
+        if node_id > 0 and name:
+            mapping[name.strip()] = node_id
     # Fallback to defaults if parsing failed
     return mapping or NODE_NAME_TO_ID_DEFAULT
 
@@ -1,4 +1,175 @@
 """
 Prometheus exporter for collect-forecast-export.
 Exports the metrics to back to prometheus.
-"""
\ No newline at end of file
+
+Predictions are held as NumPy matrices (targets x outputs) per source host and only
+rendered into samples when /metrics is scraped, so an update is a reference swap
+instead of one Gauge.labels().set() per value.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from typing import Dict, Iterable, Iterator, Optional, Sequence
+
+import numpy as np
+from prometheus_client import REGISTRY
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.registry import Collector
+
+from app.config import get_export_settings, get_output_names
+from app.forecasting.run import PredictionResult
+
+PREDICTED_VALUE_NAME = "ml_agent_predicted_value"
+
+
+@dataclass
+class _SourcePredictions:
+    target_hosts: np.ndarray
+    columns: np.ndarray
+    values: np.ndarray
+    updated_at: float
+
+
+class PredictionCollector(Collector):
+    """
+    Scrape-time collector for the latest predictions of each source host.
+    Cardinality is bounded: at most max_sources sources (least recently updated
+    are dropped first) and max_targets target rows per source. Sources not
+    updated within stale_seconds stop being exported, and so do hosts missing
+    from stale_cycles consecutive retain_hosts() calls.
+    Entries are never modified once stored: a scrape reads them outside the lock.
+    """
+
+    def __init__(
+        self,
+        max_sources: int = 16,
+        max_targets: int = 256,
+        stale_seconds: float = 600.0,
+        stale_cycles: int = 3,
+    ):
+        self.max_sources = max(1, max_sources)
+        self.max_targets = max(1, max_targets)
+        self.stale_seconds = stale_seconds
+        self.stale_cycles = stale_cycles
+        self.default_columns = np.asarray(get_output_names(), dtype=object)
+        self._sources: "OrderedDict[str, _SourcePredictions]" = OrderedDict()
+        self._missing: Dict[str, int] = {}
+        self._dropped_series = 0
+        self._lock = threading.Lock()
+
+    def update(
+        self,
+        source_host: str,
+        target_hosts: Sequence[str],
+        values: np.ndarray,
+        columns: Optional[Sequence[str]] = None,
+    ) -> None:
+        values = np.asarray(values, dtype=np.float64)
+        if values.ndim != 2:
+            values = values.reshape(len(target_hosts), -1)
+        hosts = np.asarray(target_hosts, dtype=object)
+        if len(hosts) > self.max_targets:
+            self._dropped_series += (len(hosts) - self.max_targets) * values.shape[1]
+            hosts, values = hosts[: self.max_targets], values[: self.max_targets]
+        names = np.asarray(columns, dtype=object) if columns is not None else self.default_columns
+        if len(names) < values.shape[1]:
+            names = np.concatenate([names, [f"y_{idx}" for idx in range(len(names), values.shape[1])]])
+        entry = _SourcePredictions(hosts, names[: values.shape[1]], values, time.time())
+        with self._lock:
+            self._sources[source_host] = entry
+            self._sources.move_to_end(source_host)
+            while len(self._sources) > self.max_sources:
+                _, evicted = self._sources.popitem(last=False)
+                self._dropped_series += evicted.values.size
+
+    def retain_hosts(self, hosts: Iterable[str]) -> None:
+        """
+        Report the nodes of a complete collection. Sources and target rows of nodes
+        missing from stale_cycles consecutive calls have left the cluster and are
+        dropped; 0 never drops them.
+        """
+        if self.stale_cycles <= 0:
+            return
+        present = set(hosts)
+        with self._lock:
+            known = set(self._sources)
+            for entry in self._sources.values():
+                known.update(entry.target_hosts.tolist())
+            self._missing = {host: self._missing.get(host, 0) + 1 for host in known - present}
+            gone = {host for host, cycles in self._missing.items() if cycles >= self.stale_cycles}
+            if not gone:
+                return
+            for source in [source for source in self._sources if source in gone]:
+                del self._sources[source]
+            for source, entry in self._sources.items():
+                mask = np.fromiter(
+                    (host not in gone for host in entry.target_hosts), dtype=bool, count=len(entry.target_hosts)
+                )
+                if not mask.all():
+                    # Swap in a new entry; a running scrape keeps zipping the old one
+                    self._sources[source] = replace(
+                        entry, target_hosts=entry.target_hosts[mask], values=entry.values[mask]
+                    )
+            for host in gone:
+                del self._missing[host]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._sources.clear()
+            self._missing.clear()
+
+    def _expire(self, now: float) -> None:
+        if self.stale_seconds <= 0:
+            return
+        for source in [s for s, entry in self._sources.items() if now - entry.updated_at > self.stale_seconds]:
+            del self._sources[source]
+
+    def collect(self) -> Iterator[GaugeMetricFamily]:
+        with self._lock:
+            self._expire(time.time())
+            sources = list(self._sources.items())
+            dropped = self._dropped_series
+
+        predicted = GaugeMetricFamily(
+            PREDICTED_VALUE_NAME,
+            "Latest value predicted by ml-agent for a target node.",
+            labels=("source_host", "target_host", "feature"),
+        )
+        for source_host, entry in sources:
+            columns = entry.columns.tolist()
+            for target_host, row in zip(entry.target_hosts.tolist(), entry.values.tolist()):
+                for feature, value in zip(columns, row):
+                    predicted.add_metric((source_host, target_host, feature), value)
+        yield predicted
+
+        updated = GaugeMetricFamily(
+            "ml_agent_predictions_updated_timestamp_seconds",
+            "Unix time of the latest predictions exported for a source host.",
+            labels=("source_host",),
+        )
+        for source_host, entry in sources:
+            updated.add_metric((source_host,), entry.updated_at)
+        yield updated
+
+        yield CounterMetricFamily(
+            "ml_agent_exported_series_dropped",
+            "Prediction series dropped by the exporter's cardinality limits.",
+            value=dropped,
+        )
+
+
+PREDICTIONS = PredictionCollector(**get_export_settings())
+REGISTRY.register(PREDICTIONS)
+
+
+def export_predictions(result: PredictionResult, id_to_name: Dict[int, str], columns: Sequence[str]) -> None:
+    outputs = result.outputs if result.outputs is not None else np.zeros((len(result.target_ids), 0))
+    PREDICTIONS.update(
+        result.source_host,
+        [id_to_name.get(int(target_id), str(target_id)) for target_id in result.target_ids],
+        outputs,
+        columns=columns,
+    )
@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from typing import List, Optional, Tuple, Union
+
+from app import metrics
+from app.forecasting.run import ModelPredictor, PredictionResult
+from app.preprocessing.snapshot import SnapshotIndex
+
+LOGGER = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+@dataclass
+class _Pending:
+    snapshot: SnapshotIndex
+    future: asyncio.Future
+    loop: asyncio.AbstractEventLoop
+    target_ids: Optional[List[int]] = None
+    enqueued_at: float = 0.0
+
+
+def _resolve(future: asyncio.Future, outcome: Union[PredictionResult, BaseException]) -> None:
+    if future.cancelled():
+        return
+    if isinstance(outcome, BaseException):
+        future.set_exception(outcome)
+    else:
+        future.set_result(outcome)
+
+
+class MicroBatcher:
+    """
+    Dynamic batching in front of ModelPredictor.
+    Async handlers enqueue snapshots and await a future; a worker thread collects
+    up to max_batch_size requests or waits at most max_wait_ms after the first one,
+    predicts them with one vectorized model call and resolves each future. Inference
+    therefore never blocks the event loop. Once stop() is called, submissions are
+    rejected until the next start(), and requests still queued when the worker
+    exits (or is still busy after the timeout) are failed.
+    """
+
+    def __init__(self, predictor: ModelPredictor, max_batch_size: int = 32, max_wait_ms: float = 2.0):
+        self.predictor = predictor
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait_seconds = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue: "queue.Queue[object]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._stopping = False
+
+    def start(self) -> None:
+        with self._start_lock:
+            self._stopping = False
+            self._start_thread()
+
+    def _start_thread(self) -> None:
+        # Caller holds _start_lock
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name="ml-agent-batcher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        with self._start_lock:
+            self._stopping = True
+            thread, self._thread = self._thread, None
+            if thread is not None:
+                self._queue.put(_STOP)
+        if thread is not None:
+            thread.join(timeout)
+            if thread.is_alive():
+                LOGGER.warning("Batching worker did not stop within %.1fs.", timeout)
+        if self._fail_queued(RuntimeError("Prediction batcher stopped.")):
+            # The stuck worker still has to find its sentinel once its batch returns
+            self._queue.put(_STOP)
+
+    def _fail_queued(self, exc: BaseException) -> bool:
+        """Fail every queued request; returns whether a stop sentinel was drained too."""
+        drained_stop = False
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return drained_stop
+            if item is _STOP:
+                drained_stop = True
+            elif isinstance(item, _Pending):
+                try:
+                    item.loop.call_soon_threadsafe(_resolve, item.future, exc)
+                except RuntimeError:
+                    pass  # event loop already closed
+
+    async def submit(self, snapshot: SnapshotIndex, target_ids: Optional[List[int]] = None) -> PredictionResult:
+        loop = asyncio.get_running_loop()
+        future: asyncio.Future = loop.create_future()
+        pending = _Pending(
+            snapshot=snapshot,
+            future=future,
+            loop=loop,
+            target_ids=target_ids,
+            enqueued_at=time.perf_counter(),
+        )
+        # Checked and enqueued under the lock, so nothing lands behind stop()'s sentinel
+        with self._start_lock:
+            if self._stopping:
+                raise RuntimeError("Prediction batcher is stopped.")
+            self._start_thread()
+            self._queue.put(pending)
+        # Set explicitly rather than via set_function, which multiprocess metrics don't aggregate
+        metrics.BATCH_QUEUE_DEPTH.set(self._queue.qsize())
+        return await future
+
+    def _collect(self, first: _Pending) -> Tuple[List[_Pending], bool]:
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait_seconds
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)  # type: ignore[arg-type]
+        return batch, False
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            batch, stopping = self._collect(item)  # type: ignore[arg-type]
+            metrics.BATCH_QUEUE_DEPTH.set(self._queue.qsize())
+            self._process(batch)
+            if stopping:
+                return
+
+    def _process(self, batch: List[_Pending]) -> None:
+        metrics.BATCH_SIZE.observe(len(batch))
+        started = time.perf_counter()
+        try:
+            outcomes: List[Union[PredictionResult, BaseException]] = list(
+                self.predictor.predict_snapshots(
+                    [pending.snapshot for pending in batch],
+                    per_snapshot_targets=[pending.target_ids for pending in batch],
+                )
+            )
+        except BaseException as exc:  # model failure affects every request in the batch
+            LOGGER.exception("Micro-batch of %d snapshots failed.", len(batch))
+            outcomes = [exc] * len(batch)
+        for pending, outcome in zip(batch, outcomes):
+            if isinstance(outcome, PredictionResult):
+                outcome.timings["queue"] = started - pending.enqueued_at
+            pending.loop.call_soon_threadsafe(_resolve, pending.future, outcome)
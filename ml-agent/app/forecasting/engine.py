@@ -0,0 +1,232 @@
+from __future__ import annotations
+
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from numpy.typing import DTypeLike
+
+LOGGER = logging.getLogger(__name__)
+
+
+def _identity(x: np.ndarray) -> np.ndarray:
+    return x
+
+
+def _relu(x: np.ndarray) -> np.ndarray:
+    return np.maximum(x, 0, out=x)
+
+
+def _tanh(x: np.ndarray) -> np.ndarray:
+    return np.tanh(x, out=x)
+
+
+def _logistic(x: np.ndarray) -> np.ndarray:
+    np.negative(x, out=x)
+    np.exp(x, out=x)
+    x += 1
+    return np.reciprocal(x, out=x)
+
+
+# In-place activations matching sklearn.neural_network._base.ACTIVATIONS
+ACTIVATIONS: Dict[str, Callable[[np.ndarray], np.ndarray]] = {
+    "identity": _identity,
+    "relu": _relu,
+    "tanh": _tanh,
+    "logistic": _logistic,
+}
+
+
+class SklearnEngine:
+    """
+    Runs inference through the estimator's own predict().
+    """
+
+    name = "sklearn"
+
+    def __init__(self, model: Any, feature_columns: Sequence[str], dtype: DTypeLike = np.float64):
+        self.model = model
+        self.feature_columns = list(feature_columns)
+        self.dtype = np.dtype(dtype)
+
+    def predict(self, features: np.ndarray) -> np.ndarray:
+        # Estimators fitted on a DataFrame check feature names; give them one only when they do
+        model_input: Any = features
+        if getattr(self.model, "feature_names_in_", None) is not None:
+            import pandas as pd
+
+            model_input = pd.DataFrame(features, columns=self.feature_columns)
+        return np.asarray(self.model.predict(model_input))
+
+
+class NumpyMLPEngine:
+    """
+    Forward pass of a fitted sklearn MLP run directly on NumPy arrays.
+    Weights are copied out of the estimator (optionally as float32) and layer
+    activations are written into preallocated buffers that grow with the batch size.
+    """
+
+    name = "numpy"
+
+    def __init__(
+        self,
+        coefs: Sequence[np.ndarray],
+        intercepts: Sequence[np.ndarray],
+        activation: str,
+        out_activation: str = "identity",
+        dtype: DTypeLike = np.float64,
+        input_shift: Optional[np.ndarray] = None,
+        input_scale: Optional[np.ndarray] = None,
+    ):
+        if activation not in ACTIVATIONS or out_activation not in ACTIVATIONS:
+            raise ValueError(f"Unsupported activation pair ({activation}, {out_activation})")
+        self.dtype = np.dtype(dtype)
+        self.coefs: List[np.ndarray] = [np.ascontiguousarray(w, dtype=self.dtype) for w in coefs]
+        self.intercepts: List[np.ndarray] = [np.ascontiguousarray(b, dtype=self.dtype) for b in intercepts]
+        self.activation = activation
+        self.out_activation = out_activation
+        # Optional affine preprocessing folded in from a pipeline: x * scale + shift
+        self.input_shift = None if input_shift is None else np.asarray(input_shift, dtype=self.dtype)
+        self.input_scale = None if input_scale is None else np.asarray(input_scale, dtype=self.dtype)
+        self._buffers: List[np.ndarray] = []
+        self._capacity = 0
+        self._lock = threading.Lock()
+
+    @property
+    def n_features(self) -> int:
+        return int(self.coefs[0].shape[0])
+
+    @classmethod
+    def from_estimator(cls, model: Any, dtype: DTypeLike = np.float64) -> "NumpyMLPEngine":
+        """
+        Extract weights from a fitted MLP, or from a Pipeline ending in one whose
+        earlier steps are min-max/standard scalers or passthrough.
+        """
+        shift: Optional[np.ndarray] = None
+        scale: Optional[np.ndarray] = None
+        steps = getattr(model, "steps", None)
+        if steps is not None:
+            for _, step in steps[:-1]:
+                shift, scale = _fold_scaler(step, shift, scale)
+            model = steps[-1][1]
+        for attr in ("coefs_", "intercepts_", "activation", "out_activation_"):
+            if not hasattr(model, attr):
+                raise ValueError(f"Estimator {type(model).__name__} has no '{attr}'; not a fitted MLP")
+        return cls(
+            coefs=model.coefs_,
+            intercepts=model.intercepts_,
+            activation=model.activation,
+            out_activation=model.out_activation_,
+            dtype=dtype,
+            input_shift=shift,
+            input_scale=scale,
+        )
+
+    def _ensure_capacity(self, rows: int) -> None:
+        if rows <= self._capacity:
+            return
+        capacity = max(rows, 2 * self._capacity, 16)
+        self._buffers = [np.empty((capacity, w.shape[1]), dtype=self.dtype) for w in self.coefs]
+        self._capacity = capacity
+
+    def predict(self, features: np.ndarray) -> np.ndarray:
+        rows = features.shape[0]
+        x = np.asarray(features, dtype=self.dtype)
+        if self.input_scale is not None:
+            x = x * self.input_scale
+        if self.input_shift is not None:
+            x = x + self.input_shift
+        with self._lock:
+            self._ensure_capacity(rows)
+            last = len(self.coefs) - 1
+            activation = ACTIVATIONS[self.activation]
+            for i, (w, b) in enumerate(zip(self.coefs, self.intercepts)):
+                out = self._buffers[i][:rows]
+                np.matmul(x, w, out=out)
+                out += b
+                if i == last:
+                    ACTIVATIONS[self.out_activation](out)
+                else:
+                    activation(out)
+                x = out
+            return x.astype(np.float64, copy=True)
+
+
+def _fold_scaler(
+    step: Any, shift: Optional[np.ndarray], scale: Optional[np.ndarray]
+) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+    """
+    Compose a fitted scaler onto an accumulated affine transform x * scale + shift.
+    """
+    if step is None or step == "passthrough":
+        return shift, scale
+    name = type(step).__name__
+    if name == "MinMaxScaler" and not getattr(step, "clip", False):
+        step_scale, step_shift = np.asarray(step.scale_), np.asarray(step.min_)
+    elif name == "StandardScaler":
+        n_features = int(step.n_features_in_)
+        mean = step.mean_ if step.mean_ is not None else np.zeros(n_features)
+        std = step.scale_ if step.scale_ is not None else np.ones(n_features)
+        step_scale, step_shift = 1.0 / np.asarray(std), -np.asarray(mean) / np.asarray(std)
+    else:
+        raise ValueError(f"Pipeline step {name} cannot be folded into the NumPy engine")
+    if scale is None:
+        return step_shift, step_scale
+    return shift * step_scale + step_shift, scale * step_scale
+
+
+def check_parity(
+    engine: NumpyMLPEngine,
+    reference: SklearnEngine,
+    rows: int = 64,
+    seed: int = 0,
+) -> bool:
+    """
+    Compare the NumPy engine against sklearn on a seeded reference batch in [0, 1].
+    """
+    batch = np.random.default_rng(seed).random((rows, engine.n_features))
+    expected = reference.predict(batch)
+    if expected.ndim == 1:
+        expected = expected.reshape(-1, 1)
+    actual = engine.predict(batch)
+    if actual.shape != expected.shape:
+        return False
+    if engine.dtype == np.float32:
+        rtol, atol = 1e-3, 1e-4 * max(1.0, float(np.abs(expected).max()))
+    else:
+        rtol, atol = 1e-7, 1e-9
+    return bool(np.allclose(actual, expected, rtol=rtol, atol=atol))
+
+
+def build_engine(
+    model: Any,
+    feature_columns: Sequence[str],
+    engine_name: str = "sklearn",
+    dtype: DTypeLike = np.float64,
+    weights_dir: Optional[str] = None,
+) -> SklearnEngine | NumpyMLPEngine:
+    """
+    Select the inference engine for a loaded model.
+    The NumPy engine takes its weights from the memory-mappable bundle in weights_dir
+    when given, otherwise from the estimator. It is used only if it passes the parity
+    check against sklearn; otherwise inference falls back to sklearn.
+    """
+    reference = SklearnEngine(model, feature_columns)
+    if engine_name != "numpy":
+        return reference
+    try:
+        if weights_dir:
+            from app.forecasting.weights import load_engine_weights
+
+            engine = load_engine_weights(weights_dir, dtype=dtype)
+        else:
+            engine = NumpyMLPEngine.from_estimator(model, dtype=dtype)
+    except (OSError, KeyError, ValueError) as exc:
+        LOGGER.warning("NumPy engine unavailable, falling back to sklearn: %s", exc)
+        return reference
+    if not check_parity(engine, reference):
+        LOGGER.warning("NumPy engine output differs from sklearn, falling back to sklearn.")
+        return reference
+    LOGGER.info("Using NumPy inference engine (dtype=%s, weights_dir=%s).", engine.dtype, weights_dir or "-")
+    return engine
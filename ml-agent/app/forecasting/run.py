@@ -1,60 +1,546 @@
 from __future__ import annotations
 
-from typing import Dict, Iterable, List, Union
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple, Union
 
-import joblib
 import numpy as np
-import pandas as pd
 
-from app.config import get_model_path, get_node_name_to_id_override, VALID_NODE_IDS
+from app import metrics
+from app.config import (
+    get_feature_order,
+    get_inference_dtype,
+    get_inference_engine,
+    get_model_path,
+    get_model_weights_dir,
+    get_prediction_cache_settings,
+)
+from app.forecasting.engine import build_engine
+from app.forecasting.weights import WeightBundle, load_npz_bundle
+from app.preprocessing.nodes import NodeRegistry, load_node_registry
+from app.preprocessing.schema import TORCHSERVE_SCHEMA, AppSchema, load_app_schemas
 from app.preprocessing.transforms import (
-    build_feature_rows_from_payload,
-    detect_current_host_with_app_metrics,
+    FeatureLayout,
+    FeaturePlan,
+    build_feature_matrix,
+    compile_feature_layout,
+    compile_feature_plan,
+    get_feature_layout,
 )
+from app.preprocessing.snapshot import SnapshotIndex
+
+LOGGER = logging.getLogger(__name__)
+
+
+@dataclass
+class PredictionResult:
+    """
+    Everything a single /predict needs to build its response, computed from one SnapshotIndex.
+    timings holds the seconds spent in each stage (detect_host, features, predict, queue).
+    """
+
+    source_host: str
+    source_id: int
+    target_ids: List[int]
+    feature_columns: List[str]
+    features: np.ndarray
+    predictions: Dict[int, List[float]]
+    outputs: Optional[np.ndarray] = None
+    timings: Dict[str, float] = field(default_factory=dict)
+    app: str = ""
+
+
+CacheKey = Tuple[int, Tuple[int, ...], bytes]
+
+
+# Label children resolved once; PredictionCache.stats() keeps the per-cache counts
+_CACHE_HIT = metrics.PREDICTION_CACHE_EVENTS.labels("hit")
+_CACHE_MISS = metrics.PREDICTION_CACHE_EVENTS.labels("miss")
+_CACHE_EVICTION = metrics.PREDICTION_CACHE_EVENTS.labels("eviction")
+_CACHE_EXPIRATION = metrics.PREDICTION_CACHE_EVENTS.labels("expiration")
+_CACHE_COALESCED = metrics.PREDICTION_CACHE_EVENTS.labels("coalesced")
+
+
+@dataclass
+class _CacheEntry:
+    value: np.ndarray
+    expires_at: float
+
+
+class PredictionCache:
+    """
+    TTL + LRU cache of model outputs keyed on the scaled feature vector, the source
+    id and the target set. Concurrent lookups of a key that is being computed wait
+    for that single in-flight computation instead of running the model again.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl_seconds: float = 60.0,
+        quantum: float = 0.0,
+        clock: Callable[[], float] = time.monotonic,
+        layout: Optional[FeatureLayout] = None,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.quantum = quantum
+        self.layout = layout or get_feature_layout()
+        self._clock = clock
+        self._entries: "OrderedDict[CacheKey, _CacheEntry]" = OrderedDict()
+        self._inflight: Dict[CacheKey, Future] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.coalesced = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.ttl_seconds > 0
+
+    def key_for(self, result: PredictionResult) -> CacheKey:
+        # Every row shares the scaled base features; the one-hot part is implied by src/targets
+        base = result.features[:1, self.layout.base_columns].astype(np.float64)
+        if self.quantum > 0:
+            base = np.rint(base / self.quantum).astype(np.int64)
+        return result.source_id, tuple(result.target_ids), base.tobytes()
+
+    def get(self, key: CacheKey) -> Optional[np.ndarray]:
+        with self._lock:
+            return self._lookup(key)
+
+    def put(self, key: CacheKey, value: np.ndarray) -> None:
+        with self._lock:
+            self._store(key, value)
+
+    def get_or_compute(self, key: CacheKey, compute: Callable[[], np.ndarray]) -> np.ndarray:
+        cached, future = self.claim(key)
+        if cached is not None:
+            return cached
+        if future is not None:
+            return future.result()
+        try:
+            value = compute()
+        except BaseException as exc:
+            self.fail(key, exc)
+            raise
+        self.complete(key, value)
+        return value
+
+    def claim(self, key: CacheKey) -> Tuple[Optional[np.ndarray], Optional[Future]]:
+        """
+        Look a key up for a caller about to compute it. Returns (value, None) on a hit,
+        (None, future) when another caller is already computing it, and (None, None)
+        when the caller now owns the computation and must complete() or fail() it.
+        """
+        with self._lock:
+            cached = self._lookup(key)
+            if cached is not None:
+                return cached, None
+            future = self._inflight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                _CACHE_COALESCED.inc()
+                return None, future
+            self._inflight[key] = Future()
+            return None, None
+
+    def complete(self, key: CacheKey, value: np.ndarray) -> None:
+        with self._lock:
+            self._store(key, value)
+            future = self._inflight.pop(key, None)
+        if future is not None:
+            future.set_result(value)
+
+    def fail(self, key: CacheKey, exc: BaseException) -> None:
+        with self._lock:
+            future = self._inflight.pop(key, None)
+        if future is not None:
+            future.set_exception(exc)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "coalesced": self.coalesced,
+            }
+
+    def _lookup(self, key: CacheKey) -> Optional[np.ndarray]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry.expires_at > self._clock():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                _CACHE_HIT.inc()
+                return entry.value
+            del self._entries[key]
+            self.expirations += 1
+            _CACHE_EXPIRATION.inc()
+            metrics.PREDICTION_CACHE_ENTRIES.dec()
+        self.misses += 1
+        _CACHE_MISS.inc()
+        return None
+
+    def _store(self, key: CacheKey, value: np.ndarray) -> None:
+        value.setflags(write=False)
+        if key not in self._entries:
+            metrics.PREDICTION_CACHE_ENTRIES.inc()
+        self._entries[key] = _CacheEntry(value=value, expires_at=self._clock() + self.ttl_seconds)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+            _CACHE_EVICTION.inc()
+            metrics.PREDICTION_CACHE_ENTRIES.dec()
+
+
+def load_model(path: str) -> object:
+    """
+    Load a model file: a .npz weight bundle (app.forecasting.weights) directly, anything
+    else with joblib, which imports sklearn to unpickle the estimator.
+    """
+    if path.endswith(".npz"):
+        return load_npz_bundle(path, dtype=get_inference_dtype())
+    import joblib
+
+    return joblib.load(path)
+
+
+def resolve_feature_layout(model: object, registry: NodeRegistry) -> FeatureLayout:
+    """
+    Input layout of a loaded model: the registry's feature_order if given, else the
+    feature names the estimator was fitted with, else the base features plus one-hot
+    columns generated for the registry's node ids. The width must match the model.
+    """
+    feature_order = registry.feature_order
+    if feature_order is None:
+        names = getattr(model, "feature_names_in_", None)
+        feature_order = [str(name) for name in names] if names is not None else get_feature_order(registry.ids)
+    expected = getattr(model, "n_features_in_", None)
+    if expected is not None and int(expected) != len(feature_order):
+        raise ValueError(f"Model expects {expected} input features, the feature layout has {len(feature_order)}")
+    return compile_feature_layout(feature_order)
 
 
 class ModelPredictor:
-    def __init__(self, model_path: str | None = None):
+    """
+    One loaded model with its engine, prediction cache and a feature plan for each
+    application it serves (default: torchserve). The first application is the default.
+    """
+
+    def __init__(
+        self,
+        model_path: str | None = None,
+        registry: NodeRegistry | None = None,
+        schemas: Sequence[AppSchema] | None = None,
+    ):
         self.model_path = model_path or get_model_path()
-        self.model = joblib.load(self.model_path)
-        self.node_name_to_id = get_node_name_to_id_override()
+        self.model = load_model(self.model_path)
+        registry = registry or load_node_registry()
+        self.layout = resolve_feature_layout(self.model, registry)
+        encodable = [node_id for node_id in registry.ids if self.layout.encodes(node_id)]
+        if len(encodable) < len(registry):
+            skipped = sorted(set(registry.ids) - set(encodable))
+            LOGGER.warning("Model has no input columns for node ids %s; they are not predicted.", skipped)
+            registry = registry.restrict(encodable)
+        self.registry = registry
+        if isinstance(self.model, WeightBundle):
+            # Checked against sklearn when the bundle was written
+            self.engine = self.model.engine
+            LOGGER.info("Using NumPy inference engine from %s (dtype=%s).", self.model_path, self.engine.dtype)
+        else:
+            self.engine = build_engine(
+                self.model,
+                feature_columns=self.layout.columns,
+                engine_name=get_inference_engine(),
+                dtype=get_inference_dtype(),
+                weights_dir=get_model_weights_dir(),
+            )
+        self.cache = PredictionCache(**get_prediction_cache_settings(), layout=self.layout)
+        self.plans: Dict[str, FeaturePlan] = {}
+        for schema in schemas or [TORCHSERVE_SCHEMA]:
+            plan = compile_feature_plan(schema, self.layout)
+            if not plan.app_lookups and not plan.node_lookups:
+                LOGGER.warning("App '%s' maps no metric to an input of %s.", schema.name, self.model_path)
+            self.plans[schema.name] = plan
+        self.default_app = next(iter(self.plans))
 
-    def predict_for_all_targets(
+    @property
+    def node_name_to_id(self) -> Dict[str, int]:
+        return self.registry.name_to_id
+
+    def prepare_snapshot(
         self,
-        load_watcher_payload: Dict,
+        snapshot: SnapshotIndex,
         target_node_ids: Iterable[int] | None = None,
-    ) -> Dict[int, List[float]]:
+        app: str | None = None,
+    ) -> PredictionResult:
         """
-        Build features for the specified target node IDs and run model prediction.
-        Returns a mapping: target_node_id -> list of outputs (as floats).
+        Detect the host running `app` (default: the first application) and build
+        its feature rows for a parsed snapshot.
+        Targets default to every registered node; pass the ids from
+        registry.select(selector) to only score label-matching candidates.
+        The returned result has no predictions yet; see run_model / attach_predictions.
         """
+        plan = self.plans[app or self.default_app]
         # Determine current source host and ID
-        node_metrics_map = (load_watcher_payload or {}).get("data", {}).get("NodeMetricsMap", {}) or {}
-        host_name = detect_current_host_with_app_metrics(node_metrics_map)
+        started = time.perf_counter()
+        host_name = plan.detect_host(snapshot)
         if not host_name:
             raise ValueError("Unable to determine current_host from payload.")
-        src_id = self.node_name_to_id.get(host_name)
+        src_id = self.registry.name_to_id.get(host_name)
         if src_id is None:
             raise ValueError(f"Unknown current_host_name '{host_name}' for provided node_name_to_id mapping")
 
-        # Final target set: provided list or all valid ids, excluding the current src
-        target_ids_all = list(target_node_ids) if target_node_ids is not None else VALID_NODE_IDS
+        # Final target set: provided list or all registered ids, excluding the current src
+        target_ids_all = list(target_node_ids) if target_node_ids is not None else self.registry.ids
         target_ids = [int(tid) for tid in target_ids_all if int(tid) != int(src_id)]
+        detected = time.perf_counter()
 
-        features: pd.DataFrame = build_feature_rows_from_payload(
-            payload=load_watcher_payload,
-            node_name_to_id=self.node_name_to_id,
+        features = build_feature_matrix(
+            payload=snapshot,
+            node_name_to_id=self.registry.name_to_id,
             target_node_ids=target_ids,
+            current_host_name=host_name,
+            dtype=self.engine.dtype,
+            plan=plan,
+        )
+        return PredictionResult(
+            source_host=host_name,
+            source_id=int(src_id),
+            target_ids=target_ids,
+            feature_columns=list(self.layout.columns),
+            features=features,
+            predictions={},
+            timings={"detect_host": detected - started, "features": time.perf_counter() - detected},
+            app=plan.app,
         )
-        y_pred: Union[np.ndarray, List[List[float]]] = self.model.predict(features)  # type: ignore[attr-defined]
-        y_array: np.ndarray = np.asarray(y_pred)
+
+    def run_model(self, features: np.ndarray) -> np.ndarray:
+        """
+        Run the model over a (rows, features) matrix and return clamped (rows, outputs) predictions.
+        """
+        if features.shape[0] == 0:
+            return np.zeros((0, 0), dtype=np.float64)
+        y_array: np.ndarray = self.engine.predict(features)
         # Ensure 2D shape: (rows, outputs)
         if y_array.ndim == 1:
             y_array = y_array.reshape(-1, 1)
         # Clamp negatives to zero
-        y_array = np.maximum(y_array, 0.0)
-        results: Dict[int, List[float]] = {
-            int(tgt): [float(x) for x in y_array[idx].tolist()]
-            for idx, tgt in enumerate(target_ids)
+        return np.maximum(y_array, 0.0)
+
+    @staticmethod
+    def attach_predictions(result: PredictionResult, y_rows: np.ndarray) -> PredictionResult:
+        result.outputs = y_rows
+        result.predictions = {
+            int(tgt): row
+            for tgt, row in zip(result.target_ids, y_rows.tolist())
         }
-        return results
+        return result
+
+    def predict_snapshot(
+        self,
+        snapshot: SnapshotIndex,
+        target_node_ids: Iterable[int] | None = None,
+    ) -> PredictionResult:
+        """
+        Detect the source host, build features and run model prediction over a parsed snapshot.
+        """
+        return self.predict_prepared(self.prepare_snapshot(snapshot, target_node_ids=target_node_ids))
+
+    def predict_prepared(self, result: PredictionResult) -> PredictionResult:
+        """
+        Run the model (or the prediction cache) over a result from prepare_snapshot.
+        """
+        started = time.perf_counter()
+        if not self.cache.enabled:
+            y_rows = self.run_model(result.features)
+        else:
+            y_rows = self.cache.get_or_compute(
+                self.cache.key_for(result), lambda: self.run_model(result.features)
+            )
+        result.timings["predict"] = time.perf_counter() - started
+        return self.attach_predictions(result, y_rows)
+
+    def predict_snapshots(
+        self,
+        snapshots: Sequence[SnapshotIndex],
+        target_node_ids: Iterable[int] | None = None,
+        per_snapshot_targets: Sequence[Optional[Sequence[int]]] | None = None,
+    ) -> List[Union[PredictionResult, Exception]]:
+        """
+        Predict many snapshots with a single model call.
+        Feature rows of every snapshot are stacked into one matrix and the outputs are
+        split back in input order. Snapshots that cannot be prepared (e.g. host
+        detection fails) yield their exception in place of a result.
+        per_snapshot_targets, when given, overrides target_node_ids for each snapshot
+        whose entry is not None.
+        """
+        targets = list(target_node_ids) if target_node_ids is not None else None
+        prepared: List[Union[PredictionResult, Exception]] = []
+        for idx, snapshot in enumerate(snapshots):
+            own = per_snapshot_targets[idx] if per_snapshot_targets is not None else None
+            try:
+                prepared.append(self.prepare_snapshot(snapshot, target_node_ids=targets if own is None else own))
+            except Exception as exc:
+                prepared.append(exc)
+        return self.predict_prepared_batch(prepared)
+
+    def predict_prepared_batch(
+        self, prepared: List[Union[PredictionResult, Exception]]
+    ) -> List[Union[PredictionResult, Exception]]:
+        """
+        Run one model call over every prepared result (exceptions are passed through).
+        With the cache enabled, cached snapshots are served directly, identical
+        snapshots of the batch are computed once, and snapshots another caller is
+        already computing (a concurrent batch or /predict/batch) wait for that result.
+        """
+        # key (None without cache) -> results sharing one computation; the first one is computed
+        pending: List[Tuple[Optional[CacheKey], List[PredictionResult]]] = []
+        by_key: Dict[CacheKey, List[PredictionResult]] = {}
+        # key -> future of another caller's computation of it
+        followed: Dict[CacheKey, Future] = {}
+        waiting: List[Tuple[int, PredictionResult, Future]] = []
+        for idx, item in enumerate(prepared):
+            if not isinstance(item, PredictionResult):
+                continue
+            if not self.cache.enabled:
+                pending.append((None, [item]))
+                continue
+            key = self.cache.key_for(item)
+            if key in by_key:
+                by_key[key].append(item)
+                continue
+            if key in followed:
+                waiting.append((idx, item, followed[key]))
+                continue
+            cached, future = self.cache.claim(key)
+            if cached is not None:
+                self.attach_predictions(item, cached)
+            elif future is not None:
+                followed[key] = future
+                waiting.append((idx, item, future))
+            else:
+                by_key[key] = [item]
+                pending.append((key, by_key[key]))
+
+        started = time.perf_counter()
+        if pending:
+            try:
+                y_array = self.run_model(np.concatenate([group[0].features for _, group in pending], axis=0))
+            except BaseException as exc:
+                for key, _ in pending:
+                    if key is not None:
+                        self.cache.fail(key, exc)
+                raise
+            # Every snapshot of the batch waited for the whole model call
+            elapsed = time.perf_counter() - started
+            offset = 0
+            for key, group in pending:
+                rows = group[0].features.shape[0]
+                y_rows = y_array[offset:offset + rows].copy()
+                offset += rows
+                if key is not None:
+                    self.cache.complete(key, y_rows)
+                for item in group:
+                    item.timings["predict"] = elapsed
+                    self.attach_predictions(item, y_rows)
+        # Only wait for other callers once this batch's own computations are published
+        for idx, item, future in waiting:
+            try:
+                y_rows = future.result()
+            except Exception as exc:
+                prepared[idx] = exc
+                continue
+            item.timings["predict"] = time.perf_counter() - started
+            self.attach_predictions(item, y_rows)
+        return prepared
+
+    def warmup(self, rounds: int = 3) -> None:
+        """
+        Featurize and predict a synthetic snapshot of every application `rounds` times,
+        so the first real request does not pay for lazy imports, BLAS start-up and
+        engine buffer allocation. Bypasses the prediction cache.
+        """
+        hosts = [self.registry.id_to_name[node_id] for node_id in self.registry.ids]
+        if not hosts:
+            raise ValueError(f"No node of the registry can be encoded by {self.model_path}")
+        for app, plan in self.plans.items():
+            result = self.prepare_snapshot(plan.synthetic_snapshot(hosts[0], hosts), app=app)
+            for _ in range(rounds):
+                self.attach_predictions(result, self.run_model(result.features))
+
+    def predict_for_all_targets(
+        self,
+        load_watcher_payload: Dict,
+        target_node_ids: Iterable[int] | None = None,
+    ) -> Dict[int, List[float]]:
+        """
+        Build features for the specified target node IDs and run model prediction.
+        Returns a mapping: target_node_id -> list of outputs (as floats).
+        """
+        snapshot = SnapshotIndex.from_payload(load_watcher_payload)
+        return self.predict_snapshot(snapshot, target_node_ids=target_node_ids).predictions
+
+
+class AppPredictors:
+    """
+    Predictors for every configured application (see app.preprocessing.schema).
+    Applications whose schemas name the same model share one ModelPredictor, so the
+    model is loaded once and their feature rows go through a single model call.
+    """
+
+    def __init__(self, schemas: Sequence[AppSchema] | None = None, registry: NodeRegistry | None = None):
+        schemas = list(schemas or load_app_schemas())
+        registry = registry or load_node_registry()
+        grouped: Dict[str, List[AppSchema]] = {}
+        for schema in schemas:
+            grouped.setdefault(schema.model_path or get_model_path(), []).append(schema)
+        self.predictors: Dict[str, ModelPredictor] = {
+            path: ModelPredictor(path, registry=registry, schemas=group) for path, group in grouped.items()
+        }
+        self.by_app: Dict[str, ModelPredictor] = {
+            schema.name: self.predictors[schema.model_path or get_model_path()] for schema in schemas
+        }
+        # The first application is the one /predict and the scheduler serve
+        self.primary = self.by_app[schemas[0].name]
+
+    @property
+    def apps(self) -> List[str]:
+        return list(self.by_app)
+
+    def warmup(self, rounds: int = 3) -> None:
+        for predictor in self.predictors.values():
+            predictor.warmup(rounds)
+
+    def predict_apps(
+        self,
+        snapshot: SnapshotIndex,
+        selector: Mapping[str, str] | None = None,
+    ) -> Dict[str, Union[PredictionResult, Exception]]:
+        """
+        Detect and featurize every application in one snapshot, with one model call
+        per distinct model. Applications not running in the snapshot yield their
+        host detection error. A label selector restricts the targets of every app.
+        """
+        outcomes: Dict[str, Union[PredictionResult, Exception]] = {}
+        for predictor in self.predictors.values():
+            target_ids = predictor.registry.select(selector) if selector else None
+            prepared: List[Union[PredictionResult, Exception]] = []
+            for app in predictor.plans:
+                try:
+                    prepared.append(predictor.prepare_snapshot(snapshot, target_node_ids=target_ids, app=app))
+                except Exception as exc:
+                    prepared.append(exc)
+            outcomes.update(zip(predictor.plans, predictor.predict_prepared_batch(prepared)))
+        return {app: outcomes[app] for app in self.by_app}
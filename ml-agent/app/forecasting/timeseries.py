@@ -0,0 +1,172 @@
+"""
+Incremental Holt-Winters forecaster for Load Watcher series.
+State (level, trend and seasonal components) is kept per (host, metric) series in
+preallocated arrays and every snapshot updates all of its series in one vectorized
+step, so no series is refitted on a poll.
+"""
+from __future__ import annotations
+
+import threading
+from typing import Dict, List, Mapping, Optional, Tuple
+
+import numpy as np
+
+from app.preprocessing.snapshot import SnapshotIndex
+
+# Forecast name -> Load Watcher metric, matching the legacy forecast-arima-* annotations
+DEFAULT_FORECAST_METRICS: Dict[str, str] = {
+    "energy": "kepler:container_torchserve_joules:1m",
+    "throughput": "ts:throughput:1m:rps",
+    "latency": "ts:latency:1m:ms",
+}
+
+
+class HoltWintersForecaster:
+    """
+    Additive Holt-Winters (damped trend, optional seasonality) over many series at once.
+    Series are registered on first sight and occupy one row of the state arrays;
+    at most `max_series` rows are allocated, further series are ignored.
+    A seasonal_period of 0 or 1 disables the seasonal component (Holt's linear method).
+    """
+
+    def __init__(
+        self,
+        metrics: Optional[Mapping[str, str]] = None,
+        alpha: float = 0.5,
+        beta: float = 0.1,
+        gamma: float = 0.1,
+        phi: float = 1.0,
+        seasonal_period: int = 0,
+        max_series: int = 1024,
+        initial_capacity: int = 16,
+    ):
+        self.metrics = dict(metrics or DEFAULT_FORECAST_METRICS)
+        self._metric_kinds = {metric: kind for kind, metric in self.metrics.items()}
+        self.alpha = alpha
+        self.beta = beta
+        self.gamma = gamma
+        self.phi = phi
+        self.period = seasonal_period if seasonal_period > 1 else 0
+        self.max_series = max_series
+        self._rows: Dict[Tuple[str, str], int] = {}
+        self._keys: List[Tuple[str, str]] = []
+        capacity = max(1, min(initial_capacity, max_series))
+        self._level = np.zeros(capacity)
+        self._trend = np.zeros(capacity)
+        self._season = np.zeros((capacity, max(1, self.period)))
+        self._observations = np.zeros(capacity, dtype=np.int64)
+        # Per series, since snapshots of several clusters and callers interleave
+        self._last_timestamp = np.full(capacity, -np.inf)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def _grow(self, needed: int) -> None:
+        capacity = len(self._level)
+        if needed <= capacity:
+            return
+        capacity = min(self.max_series, max(needed, capacity * 2))
+        extra = capacity - len(self._level)
+        self._level = np.concatenate([self._level, np.zeros(extra)])
+        self._trend = np.concatenate([self._trend, np.zeros(extra)])
+        self._season = np.vstack([self._season, np.zeros((extra, self._season.shape[1]))])
+        self._observations = np.concatenate([self._observations, np.zeros(extra, dtype=np.int64)])
+        self._last_timestamp = np.concatenate([self._last_timestamp, np.full(extra, -np.inf)])
+
+    def _row_for(self, key: Tuple[str, str]) -> Optional[int]:
+        row = self._rows.get(key)
+        if row is None and len(self._keys) < self.max_series:
+            row = len(self._keys)
+            self._grow(row + 1)
+            self._rows[key] = row
+            self._keys.append(key)
+        return row
+
+    def observe(self, snapshot: SnapshotIndex) -> int:
+        """
+        Update every forecast series present in the snapshot; returns the number
+        of series updated. A series whose last timestamp is not older than the
+        snapshot's (a repeated or out-of-order snapshot) is left unchanged.
+        """
+        timestamp = snapshot.timestamp
+        rows: List[int] = []
+        values: List[float] = []
+        with self._lock:
+            for metric in self._metric_kinds:
+                for host in snapshot.hosts_by_metric.get(metric, ()):
+                    value = snapshot.values[host].get(metric)
+                    if value is None:
+                        continue
+                    row = self._row_for((host, metric))
+                    if row is not None:
+                        rows.append(row)
+                        values.append(value)
+            if not rows:
+                return 0
+            row_index = np.asarray(rows, dtype=np.intp)
+            y = np.asarray(values, dtype=np.float64)
+            if timestamp is not None:
+                newer = self._last_timestamp[row_index] < timestamp
+                row_index, y = row_index[newer], y[newer]
+                self._last_timestamp[row_index] = timestamp
+            if len(row_index):
+                self._update(row_index, y)
+        return len(row_index)
+
+    def _update(self, rows: np.ndarray, y: np.ndarray) -> None:
+        seen = self._observations[rows]
+        level = self._level[rows]
+        trend = self._trend[rows]
+        if self.period:
+            slot = seen % self.period
+            season = self._season[rows, slot]
+        else:
+            season = np.zeros_like(y)
+
+        damped = level + self.phi * trend
+        new_level = self.alpha * (y - season) + (1.0 - self.alpha) * damped
+        new_trend = self.beta * (new_level - level) + (1.0 - self.beta) * self.phi * trend
+        # First observation of a series initializes its level; the second its trend
+        first = seen == 0
+        second = seen == 1
+        new_level = np.where(first, y, new_level)
+        new_trend = np.where(first, 0.0, np.where(second, y - level, new_trend))
+
+        self._level[rows] = new_level
+        self._trend[rows] = new_trend
+        if self.period:
+            self._season[rows, slot] = np.where(
+                first, 0.0, self.gamma * (y - new_level) + (1.0 - self.gamma) * season
+            )
+        self._observations[rows] = seen + 1
+
+    def forecast(self, horizon: int) -> Tuple[List[Tuple[str, str]], np.ndarray]:
+        """
+        h-step-ahead forecasts for every series: returns the (host, metric) keys
+        and a (series, horizon) array, clamped to >= 0 like the metrics themselves.
+        """
+        steps = np.arange(1, horizon + 1, dtype=np.float64)
+        if self.phi == 1.0:
+            multipliers = steps
+        else:
+            multipliers = np.cumsum(self.phi ** steps)
+        with self._lock:
+            count = len(self._keys)
+            keys = list(self._keys)
+            values = self._level[:count, None] + self._trend[:count, None] * multipliers[None, :]
+            if self.period:
+                seen = self._observations[:count]
+                slots = (seen[:, None] + np.arange(horizon)[None, :]) % self.period
+                values += np.take_along_axis(self._season[:count], slots, axis=1)
+        return keys, np.maximum(values, 0.0)
+
+    def forecasts_by_kind(self, horizon: int) -> Dict[str, Dict[str, List[float]]]:
+        """
+        Forecasts grouped as kind (energy/throughput/latency) -> host -> values.
+        """
+        keys, values = self.forecast(horizon)
+        grouped: Dict[str, Dict[str, List[float]]] = {kind: {} for kind in self.metrics}
+        for (host, metric), row in zip(keys, values):
+            grouped[self._metric_kinds[metric]][host] = row.tolist()
+        return grouped
@@ -0,0 +1,153 @@
+"""
+Plain NumPy weight bundles for the NumPy inference engine.
+A directory bundle has one .npy file per weight array plus a meta.json, so every
+worker process can memory-map the same files and share their pages.
+A .npz bundle is a single file that also records the model's input feature names,
+so it can stand in for the .pkl as ML_AGENT_MODEL_PATH: it loads in milliseconds
+without importing sklearn or unpickling anything.
+
+Export from a packaged model (the output is checked against sklearn first):
+  python -m app.forecasting.weights --model path/to/model.pkl --out path/to/weights
+  python -m app.forecasting.weights --model path/to/model.pkl --out path/to/model.npz
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Sequence
+
+import numpy as np
+from numpy.typing import DTypeLike
+
+from app.forecasting.engine import NumpyMLPEngine, SklearnEngine, check_parity
+
+META_FILE = "meta.json"
+NPZ_META_KEY = "meta"
+NPZ_FEATURE_NAMES_KEY = "feature_names"
+
+
+@dataclass
+class WeightBundle:
+    """
+    A model loaded from a .npz bundle: its engine plus the input attributes that
+    resolve_feature_layout reads from a fitted estimator.
+    """
+
+    path: str
+    engine: NumpyMLPEngine
+    feature_names_in_: Optional[np.ndarray]
+    n_features_in_: int
+
+
+def _engine_meta(engine: NumpyMLPEngine) -> Dict[str, Any]:
+    return {
+        "activation": engine.activation,
+        "out_activation": engine.out_activation,
+        "layers": len(engine.coefs),
+        "has_input_shift": engine.input_shift is not None,
+        "has_input_scale": engine.input_scale is not None,
+    }
+
+
+def save_engine_weights(engine: NumpyMLPEngine, directory: str) -> None:
+    os.makedirs(directory, exist_ok=True)
+    meta = _engine_meta(engine)
+    for i, (w, b) in enumerate(zip(engine.coefs, engine.intercepts)):
+        np.save(os.path.join(directory, f"coef_{i}.npy"), np.ascontiguousarray(w, dtype=np.float64))
+        np.save(os.path.join(directory, f"intercept_{i}.npy"), np.ascontiguousarray(b, dtype=np.float64))
+    if engine.input_shift is not None:
+        np.save(os.path.join(directory, "input_shift.npy"), engine.input_shift.astype(np.float64))
+    if engine.input_scale is not None:
+        np.save(os.path.join(directory, "input_scale.npy"), engine.input_scale.astype(np.float64))
+    with open(os.path.join(directory, META_FILE), "w", encoding="utf-8") as handle:
+        json.dump(meta, handle)
+
+
+def load_engine_weights(directory: str, dtype: DTypeLike = np.float64, mmap: bool = True) -> NumpyMLPEngine:
+    """
+    Build a NumpyMLPEngine from a weight bundle.
+    With mmap and float64 the engine uses the memory-mapped arrays directly, so
+    processes loading the same bundle share the pages through the page cache;
+    float32 makes a private converted copy.
+    """
+    with open(os.path.join(directory, META_FILE), encoding="utf-8") as handle:
+        meta = json.load(handle)
+    mmap_mode = "r" if mmap else None
+
+    def _load(name: str) -> np.ndarray:
+        return np.load(os.path.join(directory, name), mmap_mode=mmap_mode)
+
+    layers = int(meta["layers"])
+    return NumpyMLPEngine(
+        coefs=[_load(f"coef_{i}.npy") for i in range(layers)],
+        intercepts=[_load(f"intercept_{i}.npy") for i in range(layers)],
+        activation=meta["activation"],
+        out_activation=meta["out_activation"],
+        dtype=dtype,
+        input_shift=_load("input_shift.npy") if meta.get("has_input_shift") else None,
+        input_scale=_load("input_scale.npy") if meta.get("has_input_scale") else None,
+    )
+
+
+def save_npz_bundle(engine: NumpyMLPEngine, path: str, feature_names: Optional[Sequence[str]] = None) -> None:
+    """
+    Write the engine's weights, its metadata and the model's input feature names
+    to one uncompressed .npz file.
+    """
+    arrays: Dict[str, np.ndarray] = {NPZ_META_KEY: np.array(json.dumps(_engine_meta(engine)))}
+    for i, (w, b) in enumerate(zip(engine.coefs, engine.intercepts)):
+        arrays[f"coef_{i}"] = np.ascontiguousarray(w, dtype=np.float64)
+        arrays[f"intercept_{i}"] = np.ascontiguousarray(b, dtype=np.float64)
+    if engine.input_shift is not None:
+        arrays["input_shift"] = engine.input_shift.astype(np.float64)
+    if engine.input_scale is not None:
+        arrays["input_scale"] = engine.input_scale.astype(np.float64)
+    if feature_names is not None:
+        arrays[NPZ_FEATURE_NAMES_KEY] = np.array([str(name) for name in feature_names], dtype=str)
+    with open(path, "wb") as handle:
+        np.savez(handle, **arrays)
+
+
+def load_npz_bundle(path: str, dtype: DTypeLike = np.float64) -> WeightBundle:
+    with np.load(path, allow_pickle=False) as data:
+        meta = json.loads(str(data[NPZ_META_KEY]))
+        layers = int(meta["layers"])
+        engine = NumpyMLPEngine(
+            coefs=[data[f"coef_{i}"] for i in range(layers)],
+            intercepts=[data[f"intercept_{i}"] for i in range(layers)],
+            activation=meta["activation"],
+            out_activation=meta["out_activation"],
+            dtype=dtype,
+            input_shift=data["input_shift"] if meta.get("has_input_shift") else None,
+            input_scale=data["input_scale"] if meta.get("has_input_scale") else None,
+        )
+        names = data[NPZ_FEATURE_NAMES_KEY] if NPZ_FEATURE_NAMES_KEY in data.files else None
+    return WeightBundle(path=path, engine=engine, feature_names_in_=names, n_features_in_=engine.n_features)
+
+
+def main() -> None:
+    import joblib
+
+    parser = argparse.ArgumentParser(description="Export an sklearn MLP model to a NumPy weight bundle.")
+    parser.add_argument("--model", required=True, help="Path to the sklearn .pkl model.")
+    parser.add_argument(
+        "--out", required=True, help="Output .npz file, or a directory for a memory-mappable .npy bundle."
+    )
+    args = parser.parse_args()
+    model = joblib.load(args.model)
+    names = getattr(model, "feature_names_in_", None)
+    engine = NumpyMLPEngine.from_estimator(model)
+    if not check_parity(engine, SklearnEngine(model, [str(name) for name in names] if names is not None else [])):
+        sys.exit(f"NumPy forward pass of {args.model} does not match sklearn; no bundle written.")
+    if args.out.endswith(".npz"):
+        save_npz_bundle(engine, args.out, feature_names=names)
+    else:
+        save_engine_weights(engine, args.out)
+    print(f"Wrote {len(engine.coefs)} layers to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
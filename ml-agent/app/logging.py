@@ -1,4 +1,32 @@
 """
 Logging for the ml-agent.
-Configures the logging for the ml-agent.
-"""
\ No newline at end of file
+Configures the logging for the ml-agent and reports the stage timings of slow
+prediction requests.
+"""
+from __future__ import annotations
+
+import logging
+from typing import Dict
+
+from app.config import get_logging_settings
+
+LOG_FORMAT = "%(asctime)s %(levelname)s [%(process)d] %(name)s: %(message)s"
+
+LOGGER = logging.getLogger("app.requests")
+
+_settings = get_logging_settings()
+SLOW_REQUEST_SECONDS = float(_settings["slow_request_ms"]) / 1000.0  # type: ignore[arg-type]
+
+
+def configure_logging() -> None:
+    logging.basicConfig(level=str(_settings["level"]), format=LOG_FORMAT)
+
+
+def log_slow_request(endpoint: str, total_seconds: float, timings: Dict[str, float]) -> None:
+    """
+    Log a request's per-stage breakdown when it took longer than ML_AGENT_SLOW_REQUEST_MS.
+    """
+    if not SLOW_REQUEST_SECONDS or total_seconds < SLOW_REQUEST_SECONDS:
+        return
+    stages = " ".join(f"{stage}={seconds * 1000:.2f}ms" for stage, seconds in timings.items())
+    LOGGER.warning("Slow %s request: %.2fms (%s)", endpoint, total_seconds * 1000, stages)
@@ -1,15 +1,182 @@
 from __future__ import annotations
 
+import gc
+import logging
 import os
+import shutil
+import signal
+import socket
+import tempfile
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
 
 import uvicorn
 
-from app.api import app
+from app.config import get_collector_settings, get_serving_settings
+from app.logging import configure_logging
+
+LOGGER = logging.getLogger(__name__)
+
+RESTART_BACKOFF_SECONDS = 1.0
+
+BLAS_THREAD_ENV_VARS = (
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "BLIS_NUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+)
+
+
+def _limit_blas_threads(threads: int) -> None:
+    # Must run before numpy is imported for the env vars to size the thread pools
+    for name in BLAS_THREAD_ENV_VARS:
+        os.environ[name] = str(threads)
+
+
+def _prepare_multiprocess_metrics() -> Optional[str]:
+    """
+    Point prometheus_client at a shared directory of per-process metric files, so
+    /metrics aggregates every worker instead of reporting whichever one answered.
+    Must run before prometheus_client is imported. Files of a previous run are
+    removed, as prometheus_client requires. Returns the directory if it was created
+    here, for removal on exit.
+    """
+    directory = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    created = None
+    if directory:
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory, exist_ok=True)
+    else:
+        directory = created = os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="ml-agent-metrics-")
+    LOGGER.info("Aggregating worker metrics in %s.", directory)
+    return created
+
+
+def _cpu_share(cpus: Sequence[int], workers: int, index: int) -> List[int]:
+    if not cpus:
+        return []
+    chunk = max(1, len(cpus) // workers)
+    share = list(cpus[index * chunk:(index + 1) * chunk])
+    return share or [cpus[index % len(cpus)]]
+
+
+def _pin(cpus: Sequence[int]) -> None:
+    if not cpus or not hasattr(os, "sched_setaffinity"):
+        return
+    allowed = set(cpus) & os.sched_getaffinity(0)
+    if not allowed:
+        LOGGER.warning("None of CPUs %s are available to this process; affinity left unchanged.", list(cpus))
+        return
+    os.sched_setaffinity(0, allowed)
+
+
+def _serve_worker(app: object, sock: socket.socket, host: str, port: int, cpus: Sequence[int], blas_threads: int) -> None:
+    from threadpoolctl import threadpool_limits
+
+    _pin(cpus)
+    # Pools inherited from the parent keep their size; clamp them explicitly
+    threadpool_limits(limits=blas_threads)
+    server = uvicorn.Server(uvicorn.Config(app, host=host, port=port))
+    server.run(sockets=[sock])
+
+
+def _serve_multiprocess(host: str, port: int, workers: int, cpus: Sequence[int], blas_threads: int) -> None:
+    """
+    Load the model once in this process, then fork the workers so they share its
+    pages copy-on-write. Workers accept on one inherited listening socket and are
+    restarted if they exit unexpectedly.
+    """
+    from prometheus_client import multiprocess
+
+    from app.api import app
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    # Keep the preloaded objects out of the collector so it doesn't dirty their pages
+    gc.freeze()
+
+    children: Dict[int, Tuple[int, float]] = {}
+    stopping = False
+
+    def _spawn(index: int) -> None:
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            code = 0
+            try:
+                _serve_worker(app, sock, host, port, _cpu_share(cpus, workers, index), blas_threads)
+            except BaseException:
+                LOGGER.exception("Worker %d failed.", index)
+                code = 1
+            finally:
+                os._exit(code)
+        children[pid] = (index, time.monotonic())
+
+    def _shutdown(signum: int, _frame: object) -> None:
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, _shutdown)
+    signal.signal(signal.SIGINT, _shutdown)
+    for index in range(workers):
+        _spawn(index)
+    LOGGER.info("Started %d ml-agent workers on %s:%d (blas_threads=%d).", workers, host, port, blas_threads)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        child = children.pop(pid, None)
+        # Drop the live gauges of the exited worker from the aggregate
+        multiprocess.mark_process_dead(pid)
+        if child is None or stopping:
+            continue
+        index, started = child
+        LOGGER.warning("Worker %d (pid %d) exited with status %d; restarting.", index, pid, status)
+        # Back off on a crash loop instead of forking continuously
+        if time.monotonic() - started < RESTART_BACKOFF_SECONDS:
+            time.sleep(RESTART_BACKOFF_SECONDS)
+        _spawn(index)
+    sock.close()
 
 
 def run() -> None:
+    configure_logging()
     host = "0.0.0.0"
     port = 8080
+    settings = get_serving_settings()
+    workers = int(settings["workers"])
+    cpus: List[int] = list(settings["cpu_affinity"])  # type: ignore[call-overload]
+    blas_threads = int(settings["blas_threads"])
+    _limit_blas_threads(blas_threads)
+
+    if workers > 1:
+        if get_collector_settings() is not None:
+            # Every worker would run its own collect-forecast-export loop and exporter
+            raise SystemExit("ML_AGENT_PROMETHEUS_URL (the in-process scheduler) requires ML_AGENT_WORKERS=1.")
+        metrics_dir = _prepare_multiprocess_metrics()
+        try:
+            _serve_multiprocess(host, port, workers, cpus, blas_threads)
+        finally:
+            if metrics_dir:
+                shutil.rmtree(metrics_dir, ignore_errors=True)
+        return
+
+    _pin(cpus)
+    from app.api import app
+
     uvicorn.run(app, host=host, port=port)
 
 
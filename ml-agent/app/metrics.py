@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import os
+from typing import Dict
+
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Gauge, Histogram
+from prometheus_client.multiprocess import MultiProcessCollector
+
+# Gauges set multiprocess_mode for when forked workers share PROMETHEUS_MULTIPROC_DIR (app.main)
+
+BATCH_QUEUE_DEPTH = Gauge(
+    "ml_agent_batch_queue_depth",
+    "Prediction requests waiting for the micro-batching worker.",
+    multiprocess_mode="livesum",
+)
+
+BATCH_SIZE = Histogram(
+    "ml_agent_batch_size",
+    "Number of snapshots predicted together in one micro-batch.",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+
+SCHEDULER_STAGE_SECONDS = Histogram(
+    "ml_agent_scheduler_stage_seconds",
+    "Duration of each collect-forecast-export scheduler stage.",
+    labelnames=("stage",),
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+
+SCHEDULER_STAGE_FAILURES = Counter(
+    "ml_agent_scheduler_stage_failures_total",
+    "Scheduler stage runs that failed or missed their deadline.",
+    labelnames=("stage",),
+)
+
+SCHEDULER_PARTIAL_COLLECTIONS = Counter(
+    "ml_agent_scheduler_partial_collections_total",
+    "Scheduler collections in which some Prometheus queries failed after every attempt.",
+)
+
+SCHEDULER_TICKS_DROPPED = Counter(
+    "ml_agent_scheduler_ticks_dropped_total",
+    "Scheduler ticks dropped because a stage was still busy with an earlier tick.",
+    labelnames=("stage",),
+)
+
+# Stages of a /predict request; detect_host/features/predict run on the batching worker
+PREDICT_STAGES = ("parse", "observe", "queue", "detect_host", "features", "predict", "response", "serialize")
+
+PREDICT_STAGE_SECONDS = Histogram(
+    "ml_agent_predict_stage_seconds",
+    "Duration of each stage of a prediction request.",
+    labelnames=("stage",),
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+
+REQUEST_PAYLOAD_BYTES = Histogram(
+    "ml_agent_request_payload_bytes",
+    "Size of prediction request bodies.",
+    labelnames=("endpoint",),
+    buckets=(1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216),
+)
+
+REQUEST_BATCH_ITEMS = Histogram(
+    "ml_agent_request_batch_items",
+    "Number of payloads in one /predict/batch request.",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024),
+)
+
+STREAM_SESSIONS = Gauge(
+    "ml_agent_stream_sessions",
+    "Open /predict/stream WebSocket sessions.",
+    multiprocess_mode="livesum",
+)
+
+STREAM_SNAPSHOTS = Counter(
+    "ml_agent_stream_snapshots_total",
+    "Snapshots received on /predict/stream, by outcome (predicted, failed, dropped).",
+    labelnames=("outcome",),
+)
+
+PREDICTION_CACHE_EVENTS = Counter(
+    "ml_agent_prediction_cache_events_total",
+    "Prediction cache lookups and removals, by event (hit, miss, eviction, expiration, coalesced).",
+    labelnames=("event",),
+)
+
+PREDICTION_CACHE_ENTRIES = Gauge(
+    "ml_agent_prediction_cache_entries",
+    "Model outputs held in the prediction caches.",
+    multiprocess_mode="livesum",
+)
+
+STARTUP_SECONDS = Gauge(
+    "ml_agent_startup_seconds",
+    "Time spent in each start-up phase (load: models and feature plans, warmup: synthetic predictions).",
+    labelnames=("phase",),
+    multiprocess_mode="max",
+)
+
+# Label children resolved once instead of on every observation
+_STAGE_SECONDS = {stage: PREDICT_STAGE_SECONDS.labels(stage) for stage in PREDICT_STAGES}
+
+
+def scrape_registry() -> CollectorRegistry:
+    """
+    Registry served on /metrics: the default one, or, with PROMETHEUS_MULTIPROC_DIR
+    set, one aggregating the metric files of every worker process.
+    """
+    if not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        return REGISTRY
+    registry = CollectorRegistry()
+    MultiProcessCollector(registry)
+    return registry
+
+
+def record_stage_timings(timings: Dict[str, float]) -> None:
+    for stage, seconds in timings.items():
+        child = _STAGE_SECONDS.get(stage)
+        if child is not None:
+            child.observe(seconds)
@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+import threading
+from array import array
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+
+from app.preprocessing.snapshot import SnapshotIndex
+
+# Rolling statistics exposed per series, in the order they are appended as extra features
+ROLLING_STATS: Tuple[str, ...] = ("mean", "ewma", "min", "max", "delta")
+
+
+@dataclass(frozen=True)
+class RollingStats:
+    count: int
+    last: float
+    mean: float
+    ewma: float
+    min: float
+    max: float
+    delta: float
+
+    def as_dict(self) -> Dict[str, float]:
+        return {name: getattr(self, name) for name in ROLLING_STATS}
+
+
+class RollingSeries:
+    """
+    Fixed-size ring of the last `slots` values of one (host, metric) series.
+    Sum, EWMA and last delta are updated in O(1); window min/max use monotonic
+    deques, so each update is amortized O(1) as well.
+    """
+
+    __slots__ = ("slots", "alpha", "values", "head", "count", "total", "ewma", "last", "delta",
+                 "last_timestamp", "seq", "_mins", "_maxs")
+
+    def __init__(self, slots: int, alpha: float):
+        self.slots = slots
+        self.alpha = alpha
+        self.values = array("d", bytes(8 * slots))
+        self.head = 0
+        self.count = 0
+        self.total = 0.0
+        self.ewma = 0.0
+        self.last = 0.0
+        self.delta = 0.0
+        self.last_timestamp: Optional[int] = None
+        self.seq = 0
+        self._mins: Deque[Tuple[int, float]] = deque()
+        self._maxs: Deque[Tuple[int, float]] = deque()
+
+    def update(self, value: float, timestamp: Optional[int] = None) -> bool:
+        """
+        Append a value; returns False when its timestamp is not newer than the last
+        one (a repeated or out-of-order snapshot) and it is ignored. A value without
+        a timestamp is appended and keeps the last one.
+        """
+        if timestamp is not None and self.last_timestamp is not None and timestamp <= self.last_timestamp:
+            return False
+        if timestamp is not None:
+            self.last_timestamp = timestamp
+
+        if self.count == self.slots:
+            self.total -= self.values[self.head]
+        else:
+            self.count += 1
+        self.values[self.head] = value
+        self.total += value
+        self.head = (self.head + 1) % self.slots
+        if self.head == 0:
+            # Re-sum once per lap so floating-point drift in the running total stays bounded
+            self.total = sum(self.values[: self.count])
+
+        if self.count == 1:
+            self.ewma = value
+            self.delta = 0.0
+        else:
+            self.ewma += self.alpha * (value - self.ewma)
+            self.delta = value - self.last
+        self.last = value
+
+        seq = self.seq
+        self.seq += 1
+        oldest = seq - self.slots
+        while self._mins and self._mins[-1][1] >= value:
+            self._mins.pop()
+        self._mins.append((seq, value))
+        while self._mins[0][0] <= oldest:
+            self._mins.popleft()
+        while self._maxs and self._maxs[-1][1] <= value:
+            self._maxs.pop()
+        self._maxs.append((seq, value))
+        while self._maxs[0][0] <= oldest:
+            self._maxs.popleft()
+        return True
+
+    def stats(self) -> RollingStats:
+        return RollingStats(
+            count=self.count,
+            last=self.last,
+            mean=self.total / self.count if self.count else 0.0,
+            ewma=self.ewma,
+            min=self._mins[0][1] if self._mins else 0.0,
+            max=self._maxs[0][1] if self._maxs else 0.0,
+            delta=self.delta,
+        )
+
+    def window(self) -> List[float]:
+        """
+        Values currently in the ring, oldest first.
+        """
+        if self.count < self.slots:
+            return list(self.values[: self.count])
+        return list(self.values[self.head:]) + list(self.values[: self.head])
+
+
+class TimeSeriesHistory:
+    """
+    In-memory history of Load Watcher snapshots keyed by (host, metric name).
+    Each series keeps at most `slots` values and at most `max_series` series are
+    tracked (least recently updated are dropped first), so memory is bounded
+    regardless of uptime. Snapshots not newer than a series' last timestamp are ignored.
+    """
+
+    def __init__(self, slots: int = 60, ewma_alpha: float = 0.3, max_series: int = 4096):
+        self.slots = max(1, int(slots))
+        self.ewma_alpha = ewma_alpha
+        self.max_series = max(1, int(max_series))
+        self._series: "OrderedDict[Tuple[str, str], RollingSeries]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._series)
+
+    def observe(self, snapshot: SnapshotIndex) -> int:
+        """
+        Feed every metric of a snapshot into its series; returns the number of values appended.
+        """
+        timestamp = snapshot.timestamp
+        appended = 0
+        with self._lock:
+            for host, host_values in snapshot.values.items():
+                for name, value in host_values.items():
+                    appended += self._update_locked(host, name, value, timestamp)
+        return appended
+
+    def update(self, host: str, name: str, value: float, timestamp: Optional[int] = None) -> bool:
+        with self._lock:
+            return self._update_locked(host, name, value, timestamp)
+
+    def _update_locked(self, host: str, name: str, value: float, timestamp: Optional[int]) -> bool:
+        key = (host, name)
+        series = self._series.get(key)
+        if series is None:
+            if len(self._series) >= self.max_series:
+                self._series.popitem(last=False)
+            series = self._series[key] = RollingSeries(self.slots, self.ewma_alpha)
+        else:
+            self._series.move_to_end(key)
+        return series.update(value, timestamp)
+
+    def stats(self, host: str, name: str) -> Optional[RollingStats]:
+        with self._lock:
+            series = self._series.get((host, name))
+            return series.stats() if series is not None else None
+
+    def window(self, host: str, name: str) -> List[float]:
+        with self._lock:
+            series = self._series.get((host, name))
+            return series.window() if series is not None else []
+
+    def rolling_features(self, sources: Iterable[Tuple[str, str, str]]) -> Dict[str, float]:
+        """
+        Rolling statistics for (host, metric name, feature name) triples, as
+        "<feature>_<stat>" -> value. Series without history contribute zeros.
+        """
+        features: Dict[str, float] = {}
+        with self._lock:
+            for host, name, feature in sources:
+                series = self._series.get((host, name))
+                stats = series.stats().as_dict() if series is not None else None
+                for stat in ROLLING_STATS:
+                    features[f"{feature}_{stat}"] = stats[stat] if stats else 0.0
+        return features
+
@@ -0,0 +1,129 @@
+"""
+Node registry: the cluster's node name <-> id mapping, node labels and the model's
+expected feature layout, loaded from ML_AGENT_NODE_REGISTRY (JSON):
+
+  {
+    "nodes": [
+      {"name": "worker-1.novalocal", "id": 1, "labels": {"zone": "edge", "gpu": "false"}},
+      {"name": "worker-2.novalocal", "labels": {"zone": "cloud"}}
+    ],
+    "feature_order": ["torchserve_app_user", ..., "node_id_src_1", ..., "node_id_tgt_1", ...]
+  }
+
+Ids default to the node's position (1-based) and feature_order to the model's own
+feature names. Without a file, ML_AGENT_NODE_MAP or the packaged defaults are used.
+"""
+from __future__ import annotations
+
+import json
+from typing import Dict, FrozenSet, Iterable, List, Mapping, Optional, Sequence, Set, Tuple
+
+from app.config import get_node_name_to_id_override, get_node_registry_path
+
+
+def parse_selector(raw: Optional[str]) -> Dict[str, str]:
+    """
+    Parse a "key=value,key2=value2" label selector; every pair must match.
+    """
+    selector: Dict[str, str] = {}
+    for token in (raw or "").split(","):
+        token = token.strip()
+        if not token:
+            continue
+        key, sep, value = token.partition("=")
+        if not sep or not key.strip():
+            raise ValueError(f"Invalid label selector term '{token}', expected key=value")
+        selector[key.strip()] = value.strip()
+    return selector
+
+
+class NodeRegistry:
+    """
+    Node name <-> id mapping plus per-node labels.
+    Labels are kept in an inverted (key, value) -> ids index, so selecting targets
+    costs in proportion to the matching nodes rather than to the cluster size.
+    """
+
+    def __init__(
+        self,
+        name_to_id: Mapping[str, int],
+        labels: Optional[Mapping[str, Mapping[str, str]]] = None,
+        feature_order: Optional[Sequence[str]] = None,
+    ):
+        self.name_to_id: Dict[str, int] = {str(name): int(node_id) for name, node_id in name_to_id.items()}
+        self.id_to_name: Dict[int, str] = {node_id: name for name, node_id in self.name_to_id.items()}
+        if len(self.id_to_name) != len(self.name_to_id):
+            raise ValueError("Node registry assigns the same id to more than one node")
+        self.ids: List[int] = sorted(self.id_to_name)
+        self.feature_order: Optional[List[str]] = list(feature_order) if feature_order else None
+        self.labels: Dict[int, Dict[str, str]] = {}
+        self._by_label: Dict[Tuple[str, str], Set[int]] = {}
+        for name, node_labels in (labels or {}).items():
+            node_id = self.name_to_id.get(name)
+            if node_id is None:
+                continue
+            self.labels[node_id] = {str(k): str(v) for k, v in node_labels.items()}
+            for item in self.labels[node_id].items():
+                self._by_label.setdefault(item, set()).add(node_id)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def from_file(cls, path: str) -> "NodeRegistry":
+        with open(path, "r", encoding="utf-8") as handle:
+            document = json.load(handle)
+        entries = document.get("nodes") if isinstance(document, dict) else None
+        if not isinstance(entries, list) or not entries:
+            raise ValueError(f"Node registry {path} has no 'nodes' list")
+        name_to_id: Dict[str, int] = {}
+        labels: Dict[str, Dict[str, str]] = {}
+        for position, entry in enumerate(entries, start=1):
+            if not isinstance(entry, dict) or not entry.get("name"):
+                raise ValueError(f"Node registry {path}: entry {position} has no 'name'")
+            name = str(entry["name"])
+            node_id = int(entry.get("id", position))
+            if node_id < 1:
+                raise ValueError(f"Node registry {path}: node '{name}' has non-positive id {node_id}")
+            name_to_id[name] = node_id
+            if entry.get("labels"):
+                labels[name] = entry["labels"]
+        return cls(name_to_id, labels=labels, feature_order=document.get("feature_order"))
+
+    def restrict(self, node_ids: Iterable[int]) -> "NodeRegistry":
+        """
+        Registry limited to the given ids (e.g. the ones the model can encode).
+        """
+        keep = set(node_ids)
+        names = {name: node_id for name, node_id in self.name_to_id.items() if node_id in keep}
+        return NodeRegistry(
+            names,
+            labels={self.id_to_name[node_id]: labels for node_id, labels in self.labels.items() if node_id in keep},
+            feature_order=self.feature_order,
+        )
+
+    def select(self, selector: Optional[Mapping[str, str]] = None) -> List[int]:
+        """
+        Ids of the nodes whose labels match every selector pair, in id order.
+        An empty selector selects every node.
+        """
+        if not selector:
+            return list(self.ids)
+        candidates: Optional[FrozenSet[int]] = None
+        # Intersect starting from the smallest posting set
+        postings = sorted((self._by_label.get(item, set()) for item in selector.items()), key=len)
+        for posting in postings:
+            candidates = frozenset(posting) if candidates is None else candidates & posting
+            if not candidates:
+                return []
+        return sorted(candidates or ())
+
+
+def load_node_registry() -> NodeRegistry:
+    """
+    Registry from ML_AGENT_NODE_REGISTRY if set, else from ML_AGENT_NODE_MAP / the packaged defaults.
+    """
+    path = get_node_registry_path()
+    if path:
+        return NodeRegistry.from_file(path)
+    return NodeRegistry(get_node_name_to_id_override())
@@ -0,0 +1,126 @@
+"""
+Declarative per-application feature schemas.
+
+A schema says which Load Watcher metrics mark the host running an application,
+which metrics feed which model features (from the app's bucket and from its
+host's node bucket), the value used when a metric is missing, optional scaler
+ranges and the model serving the app. Schemas are compiled into FeaturePlans
+(app.preprocessing.transforms) against each model's input layout at startup.
+
+Several applications are configured with ML_AGENT_APP_SCHEMAS, a JSON file:
+
+  {
+    "apps": [
+      {
+        "name": "torchserve",
+        "model_path": "/app/app/models/A1/MLP/mlp_multioutput_scoredpairs_scaled_onehotencoded.pkl",
+        "detect_metrics": ["ts:latency:1m:ms", ...],
+        "app_metrics": {"kepler:container_torchserve_cpu_rate:1m": "torchserve_app_cpu_src", ...},
+        "node_metrics": {"kepler:cpu_rate:1m:by_node": "torchserve_node_cpu_src", ...},
+        "defaults": {"torchserve_app_user": 1.0},
+        "ranges": {"torchserve_app_user": [1.0, 55.0]}
+      }
+    ]
+  }
+
+detect_metrics defaults to the app_metrics names, model_path to ML_AGENT_MODEL_PATH,
+missing defaults to 0 and ranges to FEATURE_RANGES. The first app is the one
+served by /predict.
+"""
+from __future__ import annotations
+
+import json
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, List, Optional
+
+from app.config import FeatureScaleRange, get_app_schemas_path
+
+# Load Watcher metric name -> feature name for the torchserve application
+APP_METRIC_FEATURES: Dict[str, str] = {
+    "kepler:container_torchserve_cpu_rate:1m": "torchserve_app_cpu_src",
+    "kepler:container_torchserve_watt:1m": "torchserve_app_power_src",
+    "kepler:container_torchserve_joules:1m": "torchserve_app_energy_src",
+    "ts:latency:1m:ms": "torchserve_app_latency_src",
+    "ts:throughput:1m:rps": "torchserve_app_qps_src",
+    "locust_current_users": "torchserve_app_user",
+}
+
+# Load Watcher metric name -> feature name for the node hosting the app
+NODE_METRIC_FEATURES: Dict[str, str] = {
+    "kepler:cpu_rate:1m:by_node": "torchserve_node_cpu_src",
+    "kepler:node_platform_watt:1m:by_node": "torchserve_node_power_src",
+    "kepler:node_platform_joules:1m:by_node": "torchserve_node_energy_src",
+}
+
+# Metrics whose presence marks the node bucket currently running torchserve
+TORCHSERVE_METRIC_NAMES: FrozenSet[str] = frozenset({
+    "kepler:container_torchserve_cpu_rate:1m",
+    "kepler:container_torchserve_watt:1m",
+    "kepler:container_torchserve_joules:1m",
+    "ts:latency:1m:ms",
+    "ts:throughput:1m:rps",
+})
+
+
+@dataclass(frozen=True)
+class AppSchema:
+    name: str
+    detect_metrics: FrozenSet[str]
+    app_metrics: Dict[str, str]
+    node_metrics: Dict[str, str]
+    defaults: Dict[str, float] = field(default_factory=dict)
+    ranges: Dict[str, FeatureScaleRange] = field(default_factory=dict)
+    model_path: Optional[str] = None
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "AppSchema":
+        name = str(data.get("name") or "")
+        if not name:
+            raise ValueError("App schema has no 'name'")
+        app_metrics = {str(k): str(v) for k, v in (data.get("app_metrics") or {}).items()}
+        node_metrics = {str(k): str(v) for k, v in (data.get("node_metrics") or {}).items()}
+        if not app_metrics and not node_metrics:
+            raise ValueError(f"App schema '{name}' maps no metrics")
+        detect = frozenset(str(m) for m in (data.get("detect_metrics") or app_metrics))
+        if not detect:
+            raise ValueError(f"App schema '{name}' has no metrics to detect its host by")
+        ranges: Dict[str, FeatureScaleRange] = {}
+        for feature, bounds in (data.get("ranges") or {}).items():
+            minimum, maximum = bounds
+            ranges[str(feature)] = FeatureScaleRange(float(minimum), float(maximum))
+        return cls(
+            name=name,
+            detect_metrics=detect,
+            app_metrics=app_metrics,
+            node_metrics=node_metrics,
+            defaults={str(k): float(v) for k, v in (data.get("defaults") or {}).items()},
+            ranges=ranges,
+            model_path=data.get("model_path") or None,
+        )
+
+
+TORCHSERVE_SCHEMA = AppSchema(
+    name="torchserve",
+    detect_metrics=TORCHSERVE_METRIC_NAMES,
+    app_metrics=APP_METRIC_FEATURES,
+    node_metrics=NODE_METRIC_FEATURES,
+)
+
+
+def load_app_schemas() -> List[AppSchema]:
+    """
+    Schemas from ML_AGENT_APP_SCHEMAS if set, else the single torchserve schema.
+    """
+    path = get_app_schemas_path()
+    if not path:
+        return [TORCHSERVE_SCHEMA]
+    with open(path, "r", encoding="utf-8") as handle:
+        document = json.load(handle)
+    entries = document.get("apps") if isinstance(document, dict) else None
+    if not isinstance(entries, list) or not entries:
+        raise ValueError(f"App schema file {path} has no 'apps' list")
+    schemas = [AppSchema.from_dict(entry) for entry in entries]
+    names = [schema.name for schema in schemas]
+    if len(set(names)) != len(names):
+        raise ValueError(f"App schema file {path} repeats an app name: {names}")
+    return schemas
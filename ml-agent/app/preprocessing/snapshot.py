@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional
+
+
+@dataclass
+class SnapshotIndex:
+    """
+    Parsed view of a Load Watcher payload, built once per request.
+    Holds host -> metric name -> value (numeric values only) and metric name -> hosts
+    (every reported name) indexes so every stage of /predict can look values up
+    without re-walking the NodeMetricsMap.
+    """
+
+    payload: Dict
+    hosts: List[str] = field(default_factory=list)
+    values: Dict[str, Dict[str, float]] = field(default_factory=dict)
+    hosts_by_metric: Dict[str, List[str]] = field(default_factory=dict)
+
+    @classmethod
+    def from_payload(cls, payload: Dict) -> "SnapshotIndex":
+        node_metrics_map = (payload or {}).get("data", {}).get("NodeMetricsMap", {}) or {}
+        return cls.from_node_metrics_map(node_metrics_map, payload=payload)
+
+    @classmethod
+    def from_node_metrics_map(cls, node_metrics_map: Dict, payload: Optional[Dict] = None) -> "SnapshotIndex":
+        index = cls(payload=payload or {"data": {"NodeMetricsMap": node_metrics_map}})
+        for host_name, bucket in node_metrics_map.items():
+            metrics_list = (bucket or {}).get("metrics", []) or []
+            host_values: Dict[str, float] = {}
+            seen = set()
+            for entry in metrics_list:
+                if not isinstance(entry, dict):
+                    continue
+                name = entry.get("name")
+                # First occurrence wins, matching the previous linear scan
+                if name is None or name in seen:
+                    continue
+                seen.add(name)
+                # Host detection goes by metric name alone, whatever the value
+                index.hosts_by_metric.setdefault(name, []).append(host_name)
+                try:
+                    host_values[name] = float(entry.get("value", 0.0))
+                except (TypeError, ValueError):
+                    # Unusable values (e.g. null) read as missing features, like an absent metric
+                    continue
+            index.hosts.append(host_name)
+            index.values[host_name] = host_values
+        return index
+
+    @property
+    def timestamp(self) -> Optional[int]:
+        return self.payload.get("timestamp")
+
+    @property
+    def partial(self) -> bool:
+        """True when the collector could not run every query (see PrometheusCollector)."""
+        return bool(self.payload.get("partial", False))
+
+    def value(self, host_name: str, metric_name: str, default: float = 0.0) -> float:
+        return self.values.get(host_name, {}).get(metric_name, default)
+
+    def has_any(self, host_name: str, metric_names: Iterable[str]) -> bool:
+        return any(host_name in self.hosts_by_metric.get(name, ()) for name in metric_names)
+
+    def first_host_with_any(self, metric_names: Iterable[str], exclude: Iterable[str] = ("",)) -> Optional[str]:
+        """
+        Return the first host (in payload order) reporting any of the given metrics.
+        """
+        excluded = set(exclude)
+        candidates = {
+            host
+            for name in metric_names
+            for host in self.hosts_by_metric.get(name, ())
+            if host not in excluded
+        }
+        if not candidates:
+            return None
+        if len(candidates) == 1:
+            return next(iter(candidates))
+        position = {host: idx for idx, host in enumerate(self.hosts)}
+        return min(candidates, key=position.__getitem__)
@@ -1,156 +1,354 @@
-
 from __future__ import annotations
 
-from typing import Dict, Iterable, List, Tuple, Optional
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import TYPE_CHECKING, Dict, FrozenSet, Iterable, List, Mapping, Optional, Sequence, Tuple, Union
 
-import pandas as pd
+import numpy as np
+from numpy.typing import DTypeLike
 
 from app.config import (
     FEATURE_RANGES,
-    VALID_NODE_IDS,
+    FeatureScaleRange,
     get_feature_order,
 )
+from app.preprocessing.history import TimeSeriesHistory
+from app.preprocessing.schema import (
+    TORCHSERVE_METRIC_NAMES,
+    TORCHSERVE_SCHEMA,
+    AppSchema,
+)
+from app.preprocessing.snapshot import SnapshotIndex
 
+if TYPE_CHECKING:
+    import pandas as pd
 
-def _metric_value_from_list(metrics: List[Dict], metric_name: str) -> float:
-    for entry in metrics:
-        if entry.get("name") == metric_name:
-            return float(entry.get("value", 0.0))
-    return 0.0
 
+def _as_snapshot(snapshot: Union[SnapshotIndex, Dict]) -> SnapshotIndex:
+    if isinstance(snapshot, SnapshotIndex):
+        return snapshot
+    return SnapshotIndex.from_node_metrics_map(snapshot)
 
-def _extract_app_metrics(node_metrics_map: Dict, current_host_name: str) -> Dict[str, float]:
+
+@dataclass(frozen=True)
+class FeatureLayout:
     """
-    Prefer extracting torchserve app metrics from the current host's node bucket.
-    Fallback to the empty key bucket "" if present.
+    Model input layout compiled once from a feature order: the positions of the
+    base feature columns and of the node columns.
+    Nodes are encoded either one-hot (node_id_src_<id> / node_id_tgt_<id> columns,
+    located through id -> column lookup arrays) or, for models trained on large
+    clusters, index-based (a single node_id_src / node_id_tgt column holding the id).
     """
-    # Try node-specific bucket first
-    node_bucket = node_metrics_map.get(current_host_name, {}) or {}
-    node_metrics_list = node_bucket.get("metrics", []) or []
-    node_vals = {
-        "torchserve_app_cpu_src": _metric_value_from_list(node_metrics_list, "kepler:container_torchserve_cpu_rate:1m"),
-        "torchserve_app_power_src": _metric_value_from_list(node_metrics_list, "kepler:container_torchserve_watt:1m"),
-        "torchserve_app_energy_src": _metric_value_from_list(node_metrics_list, "kepler:container_torchserve_joules:1m"),
-        "torchserve_app_latency_src": _metric_value_from_list(node_metrics_list, "ts:latency:1m:ms"),
-        "torchserve_app_qps_src": _metric_value_from_list(node_metrics_list, "ts:throughput:1m:rps"),
-        "torchserve_app_user": _metric_value_from_list(node_metrics_list, "locust_current_users"),
-    }
-    # If node bucket didn't contain any TS-specific metrics, fallback to app-level bucket
-    has_any_ts = any([
-        node_vals["torchserve_app_cpu_src"],
-        node_vals["torchserve_app_power_src"],
-        node_vals["torchserve_app_energy_src"],
-        node_vals["torchserve_app_latency_src"],
-        node_vals["torchserve_app_qps_src"],
-        node_vals["torchserve_app_user"],
-    ])
-    if has_any_ts:
-        return node_vals
-
-    app_bucket = node_metrics_map.get("", {}) or {}
-    metrics_list = app_bucket.get("metrics", []) or []
-    return {
-        "torchserve_app_cpu_src": _metric_value_from_list(metrics_list, "kepler:container_torchserve_cpu_rate:1m"),
-        "torchserve_app_power_src": _metric_value_from_list(metrics_list, "kepler:container_torchserve_watt:1m"),
-        "torchserve_app_energy_src": _metric_value_from_list(metrics_list, "kepler:container_torchserve_joules:1m"),
-        "torchserve_app_latency_src": _metric_value_from_list(metrics_list, "ts:latency:1m:ms"),
-        "torchserve_app_qps_src": _metric_value_from_list(metrics_list, "ts:throughput:1m:rps"),
-        "torchserve_app_user": _metric_value_from_list(metrics_list, "locust_current_users"),
-    }
-
-
-def _extract_node_metrics_for(node_metrics_map: Dict, node_name: str) -> Dict[str, float]:
-    node_bucket = node_metrics_map.get(node_name, {}) or {}
-    metrics_list = node_bucket.get("metrics", []) or []
-    return {
-        "torchserve_node_cpu_src": _metric_value_from_list(metrics_list, "kepler:cpu_rate:1m:by_node"),
-        "torchserve_node_power_src": _metric_value_from_list(metrics_list, "kepler:node_platform_watt:1m:by_node"),
-        "torchserve_node_energy_src": _metric_value_from_list(metrics_list, "kepler:node_platform_joules:1m:by_node"),
-    }
-
-
-def _minmax_scale_features(raw_features: Dict[str, float]) -> Dict[str, float]:
-    scaled: Dict[str, float] = {}
-    for name, value in raw_features.items():
-        scaler = FEATURE_RANGES.get(name)
+
+    columns: Tuple[str, ...]
+    base_features: Tuple[str, ...]
+    base_columns: np.ndarray
+    src_columns: Dict[int, int]
+    tgt_columns: Dict[int, int]
+    src_lookup: np.ndarray
+    tgt_lookup: np.ndarray
+    src_id_column: Optional[int] = None
+    tgt_id_column: Optional[int] = None
+
+    @property
+    def width(self) -> int:
+        return len(self.columns)
+
+    def encodes(self, node_id: int) -> bool:
+        """
+        Whether a node id can be fed to the model as both source and target.
+        """
+        src_ok = self.src_id_column is not None or not self.src_columns or node_id in self.src_columns
+        tgt_ok = self.tgt_id_column is not None or not self.tgt_columns or node_id in self.tgt_columns
+        return src_ok and tgt_ok
+
+    @staticmethod
+    def lookup_columns(lookup: np.ndarray, node_ids: np.ndarray) -> np.ndarray:
+        """
+        One-hot column of every id in node_ids, -1 where the layout has none.
+        """
+        columns = np.full(node_ids.shape, -1, dtype=np.intp)
+        in_range = (node_ids >= 0) & (node_ids < len(lookup))
+        columns[in_range] = lookup[node_ids[in_range]]
+        return columns
+
+
+def _lookup_array(columns: Dict[int, int]) -> np.ndarray:
+    lookup = np.full(max(columns, default=-1) + 1, -1, dtype=np.intp)
+    for node_id, col in columns.items():
+        if node_id >= 0:
+            lookup[node_id] = col
+    return lookup
+
+
+def compile_feature_layout(feature_order: Sequence[str]) -> FeatureLayout:
+    columns = tuple(feature_order)
+    src_prefix, tgt_prefix = "node_id_src_", "node_id_tgt_"
+    src_columns: Dict[int, int] = {}
+    tgt_columns: Dict[int, int] = {}
+    id_columns: Dict[str, int] = {}
+    base_features: List[str] = []
+    base_columns: List[int] = []
+    for idx, col in enumerate(columns):
+        if col in ("node_id_src", "node_id_tgt"):
+            id_columns[col] = idx
+        elif col.startswith(src_prefix):
+            src_columns[int(col[len(src_prefix):])] = idx
+        elif col.startswith(tgt_prefix):
+            tgt_columns[int(col[len(tgt_prefix):])] = idx
+        else:
+            base_features.append(col)
+            base_columns.append(idx)
+
+    return FeatureLayout(
+        columns=columns,
+        base_features=tuple(base_features),
+        base_columns=np.asarray(base_columns, dtype=np.intp),
+        src_columns=src_columns,
+        tgt_columns=tgt_columns,
+        src_lookup=_lookup_array(src_columns),
+        tgt_lookup=_lookup_array(tgt_columns),
+        src_id_column=id_columns.get("node_id_src"),
+        tgt_id_column=id_columns.get("node_id_tgt"),
+    )
+
+
+@lru_cache(maxsize=1)
+def get_feature_layout() -> FeatureLayout:
+    return compile_feature_layout(get_feature_order())
+
+
+@dataclass(frozen=True)
+class FeaturePlan:
+    """
+    An AppSchema compiled against one model's FeatureLayout: for every mapped metric
+    its position among the base features, plus the default value and min-max scaler
+    of every base feature, so featurizing a snapshot is a few dict lookups and one
+    vectorized scale.
+    """
+
+    app: str
+    layout: FeatureLayout
+    detect_metrics: FrozenSet[str]
+    app_lookups: Tuple[Tuple[str, int], ...]
+    node_lookups: Tuple[Tuple[str, int], ...]
+    defaults: np.ndarray
+    minimums: np.ndarray
+    denominators: np.ndarray
+    scaled_mask: np.ndarray
+    history_metrics: Tuple[Tuple[bool, str, str], ...]
+
+    def detect_host(self, snapshot: SnapshotIndex) -> Optional[str]:
+        """
+        First host (in payload order) reporting any of the app's detection metrics.
+        """
+        return snapshot.first_host_with_any(self.detect_metrics)
+
+    def app_host(self, snapshot: SnapshotIndex, host_name: str) -> str:
+        """
+        Bucket holding the app metrics: the host's own bucket if it reports any of
+        them with a non-zero value, else the app-level "" bucket.
+        """
+        host_values = snapshot.values.get(host_name, {})
+        if any(host_values.get(metric_name) for metric_name, _ in self.app_lookups):
+            return host_name
+        return ""
+
+    def raw_base(self, snapshot: SnapshotIndex, host_name: str) -> np.ndarray:
+        """
+        Unscaled base feature values (in layout.base_features order); node metrics
+        win over app metrics mapped to the same feature.
+        """
+        raw = self.defaults.copy()
+        app_values = snapshot.values.get(self.app_host(snapshot, host_name), {})
+        for metric_name, pos in self.app_lookups:
+            value = app_values.get(metric_name)
+            if value is not None:
+                raw[pos] = value
+        node_values = snapshot.values.get(host_name, {})
+        for metric_name, pos in self.node_lookups:
+            value = node_values.get(metric_name)
+            if value is not None:
+                raw[pos] = value
+        return raw
+
+    def scale(self, raw_base: np.ndarray) -> np.ndarray:
+        """
+        Min-max scale base feature values, clamped to [0, 1].
+        Degenerate ranges scale to 0 and features without a range pass through.
+        """
+        with np.errstate(divide="ignore", invalid="ignore"):
+            scaled = np.clip((raw_base - self.minimums) / self.denominators, 0.0, 1.0)
+        return np.where(self.scaled_mask, scaled, raw_base)
+
+    def synthetic_snapshot(self, source_host: str, hosts: Sequence[str]) -> SnapshotIndex:
+        """
+        A snapshot in which source_host runs the app and every host reports each
+        mapped metric, used to warm up the prediction path before serving.
+        """
+        app_metrics = {name: 1.0 for name in self.detect_metrics}
+        app_metrics.update((metric_name, 1.0) for metric_name, _ in self.app_lookups)
+        node_metrics = {metric_name: 1.0 for metric_name, _ in self.node_lookups}
+        node_metrics_map: Dict[str, Dict] = {}
+        for host in dict.fromkeys([source_host, *hosts]):
+            values = {**node_metrics, **app_metrics} if host == source_host else node_metrics
+            node_metrics_map[host] = {"metrics": [{"name": name, "value": value} for name, value in values.items()]}
+        return SnapshotIndex.from_node_metrics_map(node_metrics_map)
+
+    def history_sources(self, snapshot: SnapshotIndex, host_name: str) -> List[Tuple[str, str, str]]:
+        """
+        (host, metric name, feature name) of every mapped metric, resolving the app
+        bucket the same way as raw_base.
+        """
+        app_host = self.app_host(snapshot, host_name)
+        return [
+            (app_host if from_app else host_name, metric_name, feature)
+            for from_app, metric_name, feature in self.history_metrics
+        ]
+
+
+def compile_feature_plan(schema: AppSchema, layout: FeatureLayout) -> FeaturePlan:
+    positions = {name: pos for pos, name in enumerate(layout.base_features)}
+    ranges: Mapping[str, FeatureScaleRange] = {**FEATURE_RANGES, **schema.ranges}
+
+    defaults = np.zeros(len(layout.base_features), dtype=np.float64)
+    minimums = np.zeros(len(layout.base_features), dtype=np.float64)
+    # Degenerate ranges divide by +inf so they scale to 0, like FeatureScaleRange.scale
+    denominators = np.ones(len(layout.base_features), dtype=np.float64)
+    scaled_mask = np.zeros(len(layout.base_features), dtype=bool)
+    for pos, name in enumerate(layout.base_features):
+        defaults[pos] = schema.defaults.get(name, 0.0)
+        scaler = ranges.get(name)
         if scaler is None:
-            # Unknown feature: pass-through without scaling
-            scaled[name] = float(value)
             continue
-        scaled[name] = scaler.scale(float(value))
-    return scaled
+        denom = scaler.maximum - scaler.minimum
+        minimums[pos] = scaler.minimum
+        denominators[pos] = denom if denom != 0 else np.inf
+        scaled_mask[pos] = True
 
+    return FeaturePlan(
+        app=schema.name,
+        layout=layout,
+        detect_metrics=schema.detect_metrics,
+        app_lookups=tuple((m, positions[f]) for m, f in schema.app_metrics.items() if f in positions),
+        node_lookups=tuple((m, positions[f]) for m, f in schema.node_metrics.items() if f in positions),
+        defaults=defaults,
+        minimums=minimums,
+        denominators=denominators,
+        scaled_mask=scaled_mask,
+        history_metrics=tuple(
+            [(True, m, f) for m, f in schema.app_metrics.items()]
+            + [(False, m, f) for m, f in schema.node_metrics.items()]
+        ),
+    )
 
-def _one_hot(prefix: str, hot_index: int) -> Dict[str, int]:
-    ohe: Dict[str, int] = {}
-    for node_id in VALID_NODE_IDS:
-        key = f"{prefix}_{node_id}"
-        ohe[key] = 1 if node_id == hot_index else 0
-    return ohe
+
+@lru_cache(maxsize=1)
+def get_feature_plan() -> FeaturePlan:
+    """
+    The torchserve plan over the default layout.
+    """
+    return compile_feature_plan(TORCHSERVE_SCHEMA, get_feature_layout())
 
 
-def detect_current_host_with_app_metrics(node_metrics_map: Dict) -> Optional[str]:
+def detect_current_host_with_app_metrics(snapshot: Union[SnapshotIndex, Dict]) -> Optional[str]:
     """
     Infer the current host by finding the node bucket that contains torchserve metrics.
+    Accepts a SnapshotIndex or a raw NodeMetricsMap.
     Returns the node name, or None if not found.
     """
-    torchserve_metric_names = {
-        "kepler:container_torchserve_cpu_rate:1m",
-        "kepler:container_torchserve_watt:1m",
-        "kepler:container_torchserve_joules:1m",
-        "ts:latency:1m:ms",
-        "ts:throughput:1m:rps",
-    }
-    for node_name, bucket in node_metrics_map.items():
-        if node_name == "":
-            continue
-        metrics_list = (bucket or {}).get("metrics", []) or []
-        names_in_bucket = {m.get("name") for m in metrics_list if isinstance(m, dict)}
-        if torchserve_metric_names & names_in_bucket:
-            return node_name
-    return None
+    return _as_snapshot(snapshot).first_host_with_any(TORCHSERVE_METRIC_NAMES)
 
 
-def build_feature_rows_from_payload(
-    payload: Dict,
+def build_feature_matrix(
+    payload: Union[SnapshotIndex, Dict],
     node_name_to_id: Dict[str, int],
     target_node_ids: Iterable[int] | None = None,
-) -> pd.DataFrame:
+    current_host_name: Optional[str] = None,
+    dtype: DTypeLike = np.float64,
+    layout: Optional[FeatureLayout] = None,
+    plan: Optional[FeaturePlan] = None,
+) -> np.ndarray:
     """
-    Convert a Load Watcher payload into a feature matrix with one row per target node.
+    Convert a Load Watcher payload (or its SnapshotIndex) into a (targets, features)
+    matrix in model column order, one row per target node.
+    The plan selects the application (default: torchserve over the default layout);
+    a layout without a plan is featurized with the torchserve schema.
     """
-    node_metrics_map = payload.get("data", {}).get("NodeMetricsMap", {}) or {}
+    snapshot = payload if isinstance(payload, SnapshotIndex) else SnapshotIndex.from_payload(payload)
+    if plan is None:
+        plan = get_feature_plan() if layout is None else compile_feature_plan(TORCHSERVE_SCHEMA, layout)
+    layout = plan.layout
 
     # Determine current host if not provided
-    host_name = detect_current_host_with_app_metrics(node_metrics_map)
+    host_name = current_host_name or plan.detect_host(snapshot)
     if not host_name:
         raise ValueError("Unable to determine current_host from payload.")
 
-    # Base features from app-level metrics and the selected source node
-    base_app = _extract_app_metrics(node_metrics_map, host_name)
-    base_node = _extract_node_metrics_for(node_metrics_map, host_name)
-    raw_base = {**base_app, **base_node}
-    scaled_base = _minmax_scale_features(raw_base)
-
-    # One-hot of source id
     src_id = node_name_to_id.get(host_name)
     if src_id is None:
         raise ValueError(f"Unknown current_host_name '{host_name}' for provided node_name_to_id mapping")
-    src_ohe = _one_hot("node_id_src", src_id)
-
-    # Build one row per target candidate
-    rows: List[Dict[str, float]] = []
-    for tgt_id in (target_node_ids or VALID_NODE_IDS):
-        tgt_ohe = _one_hot("node_id_tgt", int(tgt_id))
-        row = {**scaled_base, **src_ohe, **tgt_ohe}
-        rows.append(row)
-
-    df = pd.DataFrame(rows)
-    # Reorder columns to match model training
-    feature_order = get_feature_order()
-    # Ensure any missing columns are added as zeros (defensive)
-    for col in feature_order:
-        if col not in df.columns:
-            df[col] = 0
-    df = df[feature_order]
-    return df
+
+    # Base features from app-level metrics and the selected source node
+    raw_base = plan.raw_base(snapshot, host_name)
+
+    target_ids = np.fromiter(
+        sorted(node_name_to_id.values()) if target_node_ids is None else target_node_ids, dtype=np.intp
+    )
+    matrix = np.zeros((len(target_ids), layout.width), dtype=dtype)
+    matrix[:, layout.base_columns] = plan.scale(raw_base)
+
+    # Source id (shared by every row) and each row's target id, one-hot or as the id itself
+    if layout.src_id_column is not None:
+        matrix[:, layout.src_id_column] = src_id
+    else:
+        src_col = layout.src_columns.get(int(src_id))
+        if src_col is not None:
+            matrix[:, src_col] = 1
+    if layout.tgt_id_column is not None:
+        matrix[:, layout.tgt_id_column] = target_ids
+    else:
+        tgt_cols = layout.lookup_columns(layout.tgt_lookup, target_ids)
+        rows = np.flatnonzero(tgt_cols >= 0)
+        matrix[rows, tgt_cols[rows]] = 1
+    return matrix
+
+
+def build_feature_rows_from_payload(
+    payload: Union[SnapshotIndex, Dict],
+    node_name_to_id: Dict[str, int],
+    target_node_ids: Iterable[int] | None = None,
+    current_host_name: Optional[str] = None,
+    history: Optional[TimeSeriesHistory] = None,
+    layout: Optional[FeatureLayout] = None,
+    plan: Optional[FeaturePlan] = None,
+) -> pd.DataFrame:
+    """
+    DataFrame adapter over build_feature_matrix for callers that need named columns.
+    With a history, unscaled rolling statistics of every base feature's series are
+    appended as extra "<feature>_<stat>" columns (the model inputs are unchanged).
+    """
+    # pandas is only needed here, so serving does not pay for importing it
+    import pandas as pd
+
+    snapshot = payload if isinstance(payload, SnapshotIndex) else SnapshotIndex.from_payload(payload)
+    if plan is None:
+        plan = get_feature_plan() if layout is None else compile_feature_plan(TORCHSERVE_SCHEMA, layout)
+    host_name = current_host_name or plan.detect_host(snapshot)
+    matrix = build_feature_matrix(
+        snapshot,
+        node_name_to_id=node_name_to_id,
+        target_node_ids=target_node_ids,
+        current_host_name=host_name,
+        plan=plan,
+    )
+    frame = pd.DataFrame(matrix, columns=list(plan.layout.columns))
+    if history is None:
+        return frame
+    rolling = history.rolling_features(plan.history_sources(snapshot, host_name or ""))
+    extra = pd.DataFrame(
+        np.tile(np.fromiter(rolling.values(), dtype=np.float64, count=len(rolling)), (len(frame), 1)),
+        columns=list(rolling),
+        index=frame.index,
+    )
+    return pd.concat([frame, extra], axis=1)
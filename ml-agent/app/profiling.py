@@ -0,0 +1,177 @@
+"""
+On-demand profiling of a running ml-agent, served by POST /admin/profile.
+
+cpu     statistical profiler: a daemon thread samples the Python stack of every
+        other thread (sys._current_frames) at a fixed interval. Unlike cProfile it
+        has no per-call hooks, so it is cheap enough to run on a loaded server, and
+        it also sees the batching worker and threadpool threads.
+memory  tracemalloc snapshots taken at the start and the end of the window, diffed
+        by allocating line.
+
+Both reports aggregate per function and per top-level package (app, numpy, pandas,
+sklearn, pydantic, ...), so latency can be attributed to a library at a glance.
+"""
+from __future__ import annotations
+
+import os
+import sys
+import sysconfig
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from types import FrameType
+from typing import Dict, List, Optional, Tuple
+
+PROFILE_MODES = ("cpu", "memory")
+
+# (file name, function) of leaf frames that mean a thread is blocked waiting
+IDLE_LEAVES = frozenset({
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("selectors.py", "select"),
+    ("socket.py", "accept"),
+})
+
+_STDLIB_DIR = os.path.normcase(sysconfig.get_paths()["stdlib"])
+_APP_DIR = os.path.normcase(os.path.dirname(os.path.abspath(__file__)))
+
+
+def package_of(filename: str) -> str:
+    """
+    Top-level package of a source file: the directory under site-packages, "app"
+    for ml-agent itself, "stdlib" for the standard library.
+    """
+    path = os.path.normcase(filename)
+    for marker in ("site-packages", "dist-packages"):
+        _, sep, rest = path.partition(marker + os.sep)
+        if sep:
+            top = rest.split(os.sep, 1)[0]
+            return top[:-3] if top.endswith(".py") else top
+    if path.startswith(_APP_DIR):
+        return "app"
+    if path.startswith(_STDLIB_DIR):
+        return "stdlib"
+    return "other"
+
+
+def _label(frame: FrameType) -> str:
+    code = frame.f_code
+    return f"{code.co_filename}:{code.co_firstlineno}({code.co_name})"
+
+
+def _ranked(counts: Counter, total: int, top: int) -> List[Dict[str, object]]:
+    return [
+        {"name": name, "samples": count, "percent": round(100.0 * count / total, 2) if total else 0.0}
+        for name, count in counts.most_common(top)
+    ]
+
+
+class SamplingProfiler:
+    """
+    Samples every thread's stack each interval_seconds for the requested duration.
+    Only one profile runs at a time; run() raises RuntimeError while one is active.
+    """
+
+    def __init__(self, interval_seconds: float = 0.005, max_depth: int = 128):
+        self.interval_seconds = interval_seconds
+        self.max_depth = max_depth
+        self._busy = threading.Lock()
+
+    def run(self, mode: str, seconds: float, top: int = 30, include_idle: bool = False) -> Dict[str, object]:
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"mode must be one of {PROFILE_MODES}, got '{mode}'")
+        if not self._busy.acquire(blocking=False):
+            raise RuntimeError("A profile is already running")
+        try:
+            if mode == "memory":
+                return self._memory(seconds, top)
+            return self._cpu(seconds, top, include_idle)
+        finally:
+            self._busy.release()
+
+    def _stack(self, frame: Optional[FrameType]) -> List[FrameType]:
+        stack: List[FrameType] = []
+        while frame is not None and len(stack) < self.max_depth:
+            stack.append(frame)
+            frame = frame.f_back
+        return stack
+
+    def _cpu(self, seconds: float, top: int, include_idle: bool) -> Dict[str, object]:
+        own = threading.get_ident()
+        self_counts: Counter = Counter()
+        total_counts: Counter = Counter()
+        package_counts: Counter = Counter()
+        collapsed: Counter = Counter()
+        samples = idle = ticks = 0
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            ticks += 1
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = self._stack(frame)
+                if not stack:
+                    continue
+                leaf = stack[0].f_code
+                if not include_idle and (os.path.basename(leaf.co_filename), leaf.co_name) in IDLE_LEAVES:
+                    idle += 1
+                    continue
+                samples += 1
+                labels = [_label(f) for f in stack]
+                self_counts[labels[0]] += 1
+                package_counts[package_of(leaf.co_filename)] += 1
+                # A recursive function counts once per sample in the inclusive totals
+                total_counts.update(set(labels))
+                collapsed[";".join(reversed(labels))] += 1
+            time.sleep(self.interval_seconds)
+        return {
+            "mode": "cpu",
+            "seconds": seconds,
+            "interval_seconds": self.interval_seconds,
+            "ticks": ticks,
+            "samples": samples,
+            "idle_samples": idle,
+            "packages": _ranked(package_counts, samples, top),
+            "self": _ranked(self_counts, samples, top),
+            "total": _ranked(total_counts, samples, top),
+            "collapsed": [f"{stack} {count}" for stack, count in collapsed.most_common()],
+        }
+
+    def _memory(self, seconds: float, top: int) -> Dict[str, object]:
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start(25)
+        try:
+            before = tracemalloc.take_snapshot()
+            time.sleep(seconds)
+            after = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+        finally:
+            if started:
+                tracemalloc.stop()
+        diff = after.compare_to(before, "lineno")
+        package_bytes: Dict[str, int] = {}
+        for stat in diff:
+            frame = stat.traceback[0]
+            package = package_of(frame.filename)
+            package_bytes[package] = package_bytes.get(package, 0) + stat.size_diff
+        lines: List[Tuple[str, int, int, int]] = [
+            (f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}", stat.size_diff, stat.count_diff, stat.size)
+            for stat in diff[:top]
+        ]
+        return {
+            "mode": "memory",
+            "seconds": seconds,
+            "traced_bytes": current,
+            "peak_bytes": peak,
+            "packages": [
+                {"name": name, "size_diff": size}
+                for name, size in sorted(package_bytes.items(), key=lambda item: -abs(item[1]))[:top]
+            ],
+            "lines": [
+                {"name": name, "size_diff": size_diff, "count_diff": count_diff, "size": size}
+                for name, size_diff, count_diff, size in lines
+            ],
+        }
@@ -1,4 +1,152 @@
 """
 Scheduler agent for collect-forecast-export.
 Collects metrics from the nodes, preprocesses them and exports them to the exporter plugin (back to prometheus).
-""" 
\ No newline at end of file
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, TypeVar
+
+from app.collector.prom_client import PrometheusCollector
+from app.forecasting.run import ModelPredictor, PredictionResult
+from app.metrics import (
+    SCHEDULER_PARTIAL_COLLECTIONS,
+    SCHEDULER_STAGE_FAILURES,
+    SCHEDULER_STAGE_SECONDS,
+    SCHEDULER_TICKS_DROPPED,
+)
+from app.preprocessing.snapshot import SnapshotIndex
+
+LOGGER = logging.getLogger(__name__)
+
+STAGES = ("collect", "features", "predict", "export")
+
+T = TypeVar("T")
+
+
+def _offer(queue: "asyncio.Queue[T]", item: T, stage: str) -> None:
+    # Newest work wins: a stage that is still busy loses its oldest pending tick
+    if queue.full():
+        queue.get_nowait()
+        SCHEDULER_TICKS_DROPPED.labels(stage=stage).inc()
+        LOGGER.warning("Scheduler stage %s is behind; dropped its oldest pending tick.", stage)
+    queue.put_nowait(item)
+
+
+class Scheduler:
+    """
+    In-process collect -> features -> predict -> export loop.
+    Collection starts on ticks aligned to interval_seconds and the later stages run
+    as separate tasks fed through one-slot queues, so tick N+1 is collected while
+    tick N is still being predicted or exported. A tick whose collection would
+    start while the previous one is still running, or that was missed entirely,
+    is dropped rather than queued. Every stage has its own deadline and its
+    duration is recorded in ml_agent_scheduler_stage_seconds.
+
+    A collection in which every query failed counts as a failed collect stage and
+    the tick is skipped. A partial one (snapshot.partial) is counted in
+    ml_agent_scheduler_partial_collections_total and still predicted, since the
+    source host may be in it; observers must not read absent nodes as gone then.
+    """
+
+    def __init__(
+        self,
+        collector: PrometheusCollector,
+        predictor: ModelPredictor,
+        export: Callable[[PredictionResult], None],
+        interval_seconds: float = 60.0,
+        deadlines: Optional[Dict[str, float]] = None,
+        observers: Sequence[Callable[[SnapshotIndex], object]] = (),
+    ):
+        self.collector = collector
+        self.predictor = predictor
+        self.export = export
+        self.interval_seconds = interval_seconds
+        self.deadlines = {stage: 10.0 for stage in STAGES}
+        self.deadlines.update(deadlines or {})
+        self.observers = list(observers)
+        self.last_timings: Dict[str, float] = {}
+        self._features_queue: "asyncio.Queue[SnapshotIndex]" = asyncio.Queue(maxsize=1)
+        self._export_queue: "asyncio.Queue[PredictionResult]" = asyncio.Queue(maxsize=1)
+        self._tasks: List[asyncio.Task] = []
+        self._collecting: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._tasks = [
+            asyncio.create_task(self._tick_loop(), name="scheduler-ticks"),
+            asyncio.create_task(self._predict_loop(), name="scheduler-predict"),
+            asyncio.create_task(self._export_loop(), name="scheduler-export"),
+        ]
+        LOGGER.info("Scheduler started with %ss interval.", self.interval_seconds)
+
+    async def stop(self) -> None:
+        tasks = self._tasks + ([self._collecting] if self._collecting else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+        await self.collector.aclose()
+
+    async def _timed(self, stage: str, awaitable: Awaitable[T]) -> T:
+        start = time.perf_counter()
+        try:
+            return await asyncio.wait_for(awaitable, timeout=self.deadlines[stage])
+        except Exception:
+            SCHEDULER_STAGE_FAILURES.labels(stage=stage).inc()
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            self.last_timings[stage] = elapsed
+            SCHEDULER_STAGE_SECONDS.labels(stage=stage).observe(elapsed)
+
+    async def _tick_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        interval = float(self.interval_seconds)
+        next_tick = loop.time()
+        while True:
+            if self._collecting is not None and not self._collecting.done():
+                SCHEDULER_TICKS_DROPPED.labels(stage="collect").inc()
+                LOGGER.warning("Collection of the previous tick is still running; dropped this tick.")
+            else:
+                self._collecting = asyncio.create_task(self._collect())
+
+            next_tick += interval
+            now = loop.time()
+            if next_tick < now:
+                missed = math.ceil((now - next_tick) / interval)
+                SCHEDULER_TICKS_DROPPED.labels(stage="collect").inc(missed)
+                next_tick += missed * interval
+            await asyncio.sleep(next_tick - now)
+
+    async def _collect(self) -> None:
+        try:
+            payload = await self._timed("collect", self.collector.collect())
+            snapshot = SnapshotIndex.from_payload(payload)
+            if snapshot.partial:
+                SCHEDULER_PARTIAL_COLLECTIONS.inc()
+            for observe in self.observers:
+                observe(snapshot)
+            _offer(self._features_queue, snapshot, "features")
+        except Exception:
+            LOGGER.exception("Scheduler collect stage failed.")
+
+    async def _predict_loop(self) -> None:
+        while True:
+            snapshot = await self._features_queue.get()
+            try:
+                result = await self._timed("features", asyncio.to_thread(self.predictor.prepare_snapshot, snapshot))
+                result = await self._timed("predict", asyncio.to_thread(self.predictor.predict_prepared, result))
+                _offer(self._export_queue, result, "export")
+            except Exception:
+                LOGGER.exception("Scheduler predict stage failed.")
+
+    async def _export_loop(self) -> None:
+        while True:
+            result = await self._export_queue.get()
+            try:
+                await self._timed("export", asyncio.to_thread(self.export, result))
+            except Exception:
+                LOGGER.exception("Scheduler export stage failed.")
@@ -0,0 +1,106 @@
+"""
+Persistent prediction stream served on the /predict/stream WebSocket.
+
+A client sends one Load Watcher payload per message (text or binary JSON) and
+gets back one message per predicted snapshot, tagged with the snapshot's
+`timestamp` and the `seq` of the message it answers (messages are numbered from
+0 in arrival order). Incoming messages are read into a bounded buffer as soon as
+they arrive; when prediction falls behind, the oldest buffered snapshot is
+dropped, so replies track the freshest state instead of a growing backlog.
+Every reply carries `dropped`, the number of snapshots dropped so far in the
+session, and a snapshot that cannot be predicted is answered with `error`.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from fastapi import WebSocket
+from starlette.websockets import WebSocketDisconnect
+
+from app.metrics import STREAM_SESSIONS, STREAM_SNAPSHOTS
+
+LOGGER = logging.getLogger(__name__)
+
+# (seq, perf_counter at arrival, raw message)
+StreamFrame = Tuple[int, float, bytes]
+
+# Predicts one raw message: returns (snapshot timestamp, reply body); failures
+# are reported with an "error" body or by raising
+StreamHandler = Callable[[bytes, float], Awaitable[Tuple[Optional[int], Dict[str, Any]]]]
+
+# Encodes a tagged reply body: returns (frame payload, send as binary frame)
+StreamEncoder = Callable[[Dict[str, Any]], Tuple[bytes, bool]]
+
+_PREDICTED = STREAM_SNAPSHOTS.labels("predicted")
+_FAILED = STREAM_SNAPSHOTS.labels("failed")
+_DROPPED = STREAM_SNAPSHOTS.labels("dropped")
+
+
+class StreamSession:
+    """
+    One WebSocket session: a receive task fills the drop-oldest buffer and a
+    predict task answers buffered snapshots in order. The session ends when the
+    client disconnects; snapshots still buffered at that point are discarded.
+    """
+
+    def __init__(self, websocket: WebSocket, handler: StreamHandler, encoder: StreamEncoder, buffer_size: int):
+        self.websocket = websocket
+        self.handler = handler
+        self.encoder = encoder
+        self.dropped = 0
+        self._buffer: "asyncio.Queue[StreamFrame]" = asyncio.Queue(maxsize=max(1, buffer_size))
+
+    async def run(self) -> None:
+        STREAM_SESSIONS.inc()
+        tasks = [asyncio.create_task(self._receive_loop()), asyncio.create_task(self._predict_loop())]
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                exc = task.exception()
+                if exc is not None and not isinstance(exc, WebSocketDisconnect):
+                    LOGGER.warning("Prediction stream closed after an error: %s", exc)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            STREAM_SESSIONS.dec()
+
+    def _offer(self, frame: StreamFrame) -> None:
+        # Newest snapshot wins: a full buffer loses its oldest snapshot
+        if self._buffer.full():
+            self._buffer.get_nowait()
+            self.dropped += 1
+            _DROPPED.inc()
+        self._buffer.put_nowait(frame)
+
+    async def _receive_loop(self) -> None:
+        seq = 0
+        while True:
+            message = await self.websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            raw = message.get("bytes")
+            if raw is None:
+                raw = (message.get("text") or "").encode()
+            self._offer((seq, time.perf_counter(), raw))
+            seq += 1
+
+    async def _predict_loop(self) -> None:
+        while True:
+            seq, received, raw = await self._buffer.get()
+            try:
+                timestamp, body = await self.handler(raw, received)
+            except Exception as exc:
+                timestamp, body = None, {"error": str(exc)}
+            (_FAILED if "error" in body else _PREDICTED).inc()
+            body["seq"] = seq
+            body["timestamp"] = timestamp
+            body["dropped"] = self.dropped
+            content, binary = self.encoder(body)
+            if binary:
+                await self.websocket.send_bytes(content)
+            else:
+                await self.websocket.send_text(content.decode())
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Tests import the service as `app`, like uvicorn does from the ml-agent directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
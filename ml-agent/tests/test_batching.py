@@ -0,0 +1,81 @@
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+
+from app.forecasting.batching import MicroBatcher
+from app.forecasting.run import PredictionResult
+from app.preprocessing.snapshot import SnapshotIndex
+
+
+class BlockingPredictor:
+    """Stands in for ModelPredictor; predict_snapshots blocks until released."""
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.batches = []
+
+    def predict_snapshots(self, snapshots, per_snapshot_targets=None):
+        self.batches.append(len(snapshots))
+        self.started.set()
+        self.release.wait(5.0)
+        return [
+            PredictionResult(
+                source_host="a",
+                source_id=0,
+                target_ids=[],
+                feature_columns=[],
+                features=np.zeros((0, 0)),
+                predictions={},
+            )
+            for _ in snapshots
+        ]
+
+
+def snapshot():
+    return SnapshotIndex.from_payload({"data": {"NodeMetricsMap": {}}})
+
+
+def test_stop_fails_queued_requests_while_the_worker_is_busy():
+    async def scenario():
+        predictor = BlockingPredictor()
+        batcher = MicroBatcher(predictor, max_batch_size=1, max_wait_ms=0)
+        batcher.start()
+        running = asyncio.ensure_future(batcher.submit(snapshot()))
+        await asyncio.to_thread(predictor.started.wait, 5.0)
+        queued = [asyncio.ensure_future(batcher.submit(snapshot())) for _ in range(3)]
+        await asyncio.sleep(0.01)
+
+        await asyncio.to_thread(batcher.stop, 0.05)
+        for future in queued:
+            with pytest.raises(RuntimeError, match="stopped"):
+                await asyncio.wait_for(future, 1.0)
+        with pytest.raises(RuntimeError, match="stopped"):
+            await batcher.submit(snapshot())
+
+        # The batch already running still completes
+        predictor.release.set()
+        result = await asyncio.wait_for(running, 5.0)
+        assert result.source_host == "a"
+        assert predictor.batches == [1]
+
+    asyncio.run(scenario())
+
+
+def test_stop_then_start_serves_again():
+    async def scenario():
+        predictor = BlockingPredictor()
+        predictor.release.set()
+        batcher = MicroBatcher(predictor, max_batch_size=4, max_wait_ms=1)
+        batcher.start()
+        assert (await asyncio.wait_for(batcher.submit(snapshot()), 5.0)).source_host == "a"
+        await asyncio.to_thread(batcher.stop)
+        with pytest.raises(RuntimeError):
+            await batcher.submit(snapshot())
+        batcher.start()
+        assert (await asyncio.wait_for(batcher.submit(snapshot()), 5.0)).source_host == "a"
+        await asyncio.to_thread(batcher.stop)
+
+    asyncio.run(scenario())
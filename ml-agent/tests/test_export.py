@@ -0,0 +1,53 @@
+import numpy as np
+
+from app.export.prometheus import PREDICTED_VALUE_NAME, PredictionCollector
+
+
+def exported(collector):
+    family = next(family for family in collector.collect() if family.name == PREDICTED_VALUE_NAME)
+    return {
+        (sample.labels["source_host"], sample.labels["target_host"], sample.labels["feature"]): sample.value
+        for sample in family.samples
+    }
+
+
+def collector_with_predictions(stale_cycles=2):
+    collector = PredictionCollector(stale_seconds=0, stale_cycles=stale_cycles)
+    collector.update("a", ["a", "b", "c"], np.array([[1.0], [2.0], [3.0]]), columns=["cpu"])
+    return collector
+
+
+def test_hosts_are_dropped_after_stale_cycles_missing_collections():
+    collector = collector_with_predictions(stale_cycles=2)
+    collector.retain_hosts(["a", "c"])
+    assert len(exported(collector)) == 3
+    collector.retain_hosts(["a", "b", "c"])  # back: the count starts over
+    collector.retain_hosts(["a", "c"])
+    assert len(exported(collector)) == 3
+    collector.retain_hosts(["a", "c"])
+    assert exported(collector) == {("a", "a", "cpu"): 1.0, ("a", "c", "cpu"): 3.0}
+
+
+def test_missing_source_is_dropped_with_its_series():
+    collector = collector_with_predictions(stale_cycles=1)
+    collector.retain_hosts(["b", "c"])
+    assert exported(collector) == {}
+
+
+def test_pruning_never_mutates_an_entry_a_scrape_may_hold():
+    collector = collector_with_predictions(stale_cycles=1)
+    scraped = collector._sources["a"]
+    hosts, values = scraped.target_hosts, scraped.values
+    collector.retain_hosts(["a", "c"])
+    assert collector._sources["a"] is not scraped
+    assert scraped.target_hosts is hosts and scraped.values is values
+    assert list(zip(scraped.target_hosts.tolist(), scraped.values[:, 0].tolist())) == [
+        ("a", 1.0), ("b", 2.0), ("c", 3.0)
+    ]
+
+
+def test_zero_stale_cycles_keeps_every_host():
+    collector = collector_with_predictions(stale_cycles=0)
+    for _ in range(5):
+        collector.retain_hosts([])
+    assert len(exported(collector)) == 3
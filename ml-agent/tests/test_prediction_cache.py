@@ -0,0 +1,130 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from app.forecasting.run import PredictionCache
+
+KEY = (0, (1, 2), b"features")
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_concurrent_claims_compute_once():
+    cache = PredictionCache(max_entries=8, ttl_seconds=60.0)
+    calls = []
+    started = threading.Event()
+
+    def compute():
+        calls.append(1)
+        started.set()
+        time.sleep(0.05)
+        return np.array([[1.0, 2.0]])
+
+    results = []
+
+    def lookup():
+        results.append(cache.get_or_compute(KEY, compute))
+
+    owner = threading.Thread(target=lookup)
+    owner.start()
+    started.wait(1.0)
+    waiters = [threading.Thread(target=lookup) for _ in range(4)]
+    for thread in waiters:
+        thread.start()
+    for thread in [owner, *waiters]:
+        thread.join(5.0)
+
+    assert len(calls) == 1
+    assert len(results) == 5
+    assert all(result.tolist() == [[1.0, 2.0]] for result in results)
+    stats = cache.stats()
+    assert stats["coalesced"] == 4
+    assert stats["misses"] == 5
+    assert stats["entries"] == 1
+    assert cache.get_or_compute(KEY, compute).tolist() == [[1.0, 2.0]]
+    assert len(calls) == 1
+    assert cache.stats()["hits"] == 1
+
+
+def test_fail_wakes_waiters_with_the_exception():
+    cache = PredictionCache(max_entries=8, ttl_seconds=60.0)
+    assert cache.claim(KEY) == (None, None)
+    cached, future = cache.claim(KEY)
+    assert cached is None and future is not None
+
+    error = ValueError("model failed")
+    cache.fail(KEY, error)
+    assert future.exception(timeout=1.0) is error
+    assert cache.stats()["entries"] == 0
+    # The failure is not cached: the next caller owns a fresh computation
+    assert cache.claim(KEY) == (None, None)
+
+
+def test_get_or_compute_propagates_failures_to_waiters():
+    cache = PredictionCache(max_entries=8, ttl_seconds=60.0)
+    started = threading.Event()
+    release = threading.Event()
+
+    def compute():
+        started.set()
+        release.wait(1.0)
+        raise RuntimeError("boom")
+
+    errors = []
+
+    def lookup():
+        try:
+            cache.get_or_compute(KEY, compute)
+        except RuntimeError as exc:
+            errors.append(exc)
+
+    owner = threading.Thread(target=lookup)
+    owner.start()
+    started.wait(1.0)
+    waiter = threading.Thread(target=lookup)
+    waiter.start()
+    while cache.stats()["coalesced"] == 0:
+        time.sleep(0.001)
+    release.set()
+    owner.join(5.0)
+    waiter.join(5.0)
+    assert [str(exc) for exc in errors] == ["boom", "boom"]
+
+
+def test_ttl_expiration_counters():
+    clock = FakeClock()
+    cache = PredictionCache(max_entries=8, ttl_seconds=10.0, clock=clock)
+    cache.put(KEY, np.zeros(2))
+    clock.now = 9.0
+    assert cache.get(KEY) is not None
+    clock.now = 10.0
+    assert cache.get(KEY) is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["expirations"], stats["entries"]) == (1, 1, 1, 0)
+
+
+def test_lru_eviction_counters():
+    cache = PredictionCache(max_entries=2, ttl_seconds=60.0)
+    keys = [(source, (1,), b"") for source in range(3)]
+    cache.put(keys[0], np.zeros(1))
+    cache.put(keys[1], np.zeros(1))
+    assert cache.get(keys[0]) is not None  # keys[1] is now the least recently used
+    cache.put(keys[2], np.zeros(1))
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) is not None
+    assert cache.get(keys[2]) is not None
+    stats = cache.stats()
+    assert (stats["evictions"], stats["entries"], stats["hits"], stats["misses"]) == (1, 2, 3, 1)
+
+
+@pytest.mark.parametrize("max_entries, ttl_seconds", [(0, 60.0), (8, 0.0)])
+def test_zero_size_or_ttl_disables_the_cache(max_entries, ttl_seconds):
+    assert not PredictionCache(max_entries=max_entries, ttl_seconds=ttl_seconds).enabled
@@ -0,0 +1,143 @@
+import asyncio
+import json
+from urllib.parse import parse_qs
+
+import httpx
+import pytest
+
+from app.collector import prom_client
+from app.collector.prom_client import APP_METRICS, NODE_METRICS, USERS_METRIC, CollectError, PrometheusCollector
+
+
+def vector(*samples):
+    return {
+        "status": "success",
+        "data": {
+            "resultType": "vector",
+            "result": [{"metric": labels, "value": [0, str(value)]} for labels, value in samples],
+        },
+    }
+
+
+class StubPrometheus:
+    """
+    Minimal /api/v1/query endpoint: answers each query with the next response
+    queued for the first of its metrics (an int is an HTTP status, a dict a body).
+    """
+
+    def __init__(self, responses):
+        self.responses = {metric: list(queue) for metric, queue in responses.items()}
+        self.queries = []
+
+    def _metric_for(self, expr):
+        for metric in self.responses:
+            if metric in expr:
+                return metric
+        raise AssertionError(f"unexpected query {expr}")
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        assert request.url.path == "/api/v1/query"
+        expr = parse_qs(request.url.query.decode())["query"][0]
+        self.queries.append(expr)
+        queue = self.responses[self._metric_for(expr)]
+        response = queue.pop(0) if len(queue) > 1 else queue[0]
+        if isinstance(response, int):
+            return httpx.Response(response, json={"status": "error", "error": "unavailable"})
+        return httpx.Response(200, content=json.dumps(response))
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Backoff delays requested by the collector, without sleeping."""
+    delays = []
+
+    async def fake_sleep(delay):
+        delays.append(delay)
+
+    monkeypatch.setattr(prom_client.asyncio, "sleep", fake_sleep)
+    monkeypatch.setattr(prom_client.random, "uniform", lambda low, high: high)
+    return delays
+
+
+def collect(stub, **kwargs):
+    async def run():
+        async with PrometheusCollector(
+            "http://prometheus", transport=httpx.MockTransport(stub), include_ts=False, **kwargs
+        ) as collector:
+            return await collector.collect(), collector.last_stats
+
+    return asyncio.run(run())
+
+
+def metrics_of(snapshot):
+    return {
+        host: {entry["name"]: entry["value"] for entry in bucket["metrics"]}
+        for host, bucket in snapshot["data"]["NodeMetricsMap"].items()
+    }
+
+
+NODES = vector(
+    ({"__name__": NODE_METRICS[0], "instance": "node-a"}, 1500),
+    ({"__name__": NODE_METRICS[1], "instance": "node-a"}, 80),
+    ({"__name__": NODE_METRICS[0], "instance": "node-b"}, 0),
+)
+APPS = vector(({"__name__": APP_METRICS[1], "node": "node-a"}, 12))
+USERS = vector(({}, 20))
+
+
+def test_grouped_queries_build_one_snapshot(sleeps):
+    stub = StubPrometheus({NODE_METRICS[0]: [NODES], APP_METRICS[0]: [APPS], USERS_METRIC: [USERS]})
+    snapshot, stats = collect(stub)
+    assert len(stub.queries) == 3
+    assert metrics_of(snapshot) == {
+        "node-a": {NODE_METRICS[0]: 1500.0, NODE_METRICS[1]: 80.0, APP_METRICS[1]: 12.0},
+        "node-b": {NODE_METRICS[0]: 0.0},  # idle nodes report 0, kept unless reject_zero
+        "": {USERS_METRIC: 20.0},
+    }
+    assert "partial" not in snapshot
+    assert stats.complete and stats.retries == 0 and sleeps == []
+
+
+def test_failed_queries_are_retried_with_capped_backoff(sleeps):
+    stub = StubPrometheus({NODE_METRICS[0]: [503, 503, NODES], APP_METRICS[0]: [APPS], USERS_METRIC: [USERS]})
+    snapshot, stats = collect(stub, max_attempts=4, backoff_seconds=0.5, max_backoff_seconds=0.75)
+    assert "node-b" in metrics_of(snapshot)
+    assert stats.retries == 2 and stats.complete
+    assert sleeps == [0.5, 0.75]
+
+
+def test_rejected_samples_are_counted_without_a_retry(sleeps):
+    glitches = vector(
+        ({"__name__": NODE_METRICS[1], "instance": "node-a"}, 9000),  # above the legacy limit
+        ({"__name__": NODE_METRICS[0], "instance": "node-a"}, "NaN"),
+        ({"__name__": NODE_METRICS[0], "instance": "node-b"}, 0),
+        ({"__name__": NODE_METRICS[0], "instance": "node-c"}, 10),
+    )
+    stub = StubPrometheus({NODE_METRICS[0]: [glitches], APP_METRICS[0]: [APPS], USERS_METRIC: [USERS]})
+    snapshot, stats = collect(stub, reject_zero=True)
+    nodes = metrics_of(snapshot)
+    assert nodes["node-c"] == {NODE_METRICS[0]: 10.0}
+    assert "node-b" not in nodes and NODE_METRICS[1] not in nodes["node-a"]
+    assert stats.rejected == 3 and stats.retries == 0
+
+
+def test_query_without_valid_samples_is_retried_but_not_failed(sleeps):
+    empty = vector()
+    stub = StubPrometheus({NODE_METRICS[0]: [NODES], APP_METRICS[0]: [empty], USERS_METRIC: [USERS]})
+    snapshot, stats = collect(stub, max_attempts=3)
+    assert stats.retries == 2 and stats.complete
+    assert "partial" not in snapshot
+
+
+def test_query_failing_every_attempt_marks_the_snapshot_partial(sleeps):
+    stub = StubPrometheus({NODE_METRICS[0]: [NODES], APP_METRICS[0]: [500], USERS_METRIC: [USERS]})
+    snapshot, stats = collect(stub, max_attempts=2)
+    assert snapshot["partial"] is True
+    assert not stats.complete and len(stats.failed_queries) == 1
+    assert APP_METRICS[1] not in metrics_of(snapshot)["node-a"]
+
+
+def test_every_query_failing_raises(sleeps):
+    stub = StubPrometheus({NODE_METRICS[0]: [500], APP_METRICS[0]: [500], USERS_METRIC: [500]})
+    with pytest.raises(CollectError):
+        collect(stub, max_attempts=2)
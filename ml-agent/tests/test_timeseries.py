@@ -0,0 +1,54 @@
+from app.forecasting.timeseries import HoltWintersForecaster
+from app.preprocessing.snapshot import SnapshotIndex
+
+LATENCY = "ts:latency:1m:ms"
+
+
+def snapshot(timestamp, **latency_by_host):
+    node_metrics_map = {
+        host: {"metrics": [{"name": LATENCY, "value": value}]} for host, value in latency_by_host.items()
+    }
+    return SnapshotIndex.from_payload({"timestamp": timestamp, "data": {"NodeMetricsMap": node_metrics_map}})
+
+
+def test_repeated_and_out_of_order_snapshots_are_ignored():
+    forecaster = HoltWintersForecaster(metrics={"latency": LATENCY})
+    assert forecaster.observe(snapshot(10, a=1.0)) == 1
+    assert forecaster.observe(snapshot(10, a=5.0)) == 0
+    assert forecaster.observe(snapshot(9, a=5.0)) == 0
+    assert forecaster.observe(snapshot(11, a=2.0)) == 1
+    reference = HoltWintersForecaster(metrics={"latency": LATENCY})
+    reference.observe(snapshot(10, a=1.0))
+    reference.observe(snapshot(11, a=2.0))
+    assert forecaster.forecast(3)[1].tolist() == reference.forecast(3)[1].tolist()
+
+
+def test_interleaved_sources_keep_their_own_timestamps():
+    forecaster = HoltWintersForecaster(metrics={"latency": LATENCY})
+    # Two clusters (or the scheduler and /predict) whose clocks interleave
+    assert forecaster.observe(snapshot(100, a=1.0)) == 1
+    assert forecaster.observe(snapshot(50, b=10.0)) == 1
+    assert forecaster.observe(snapshot(101, a=2.0)) == 1
+    assert forecaster.observe(snapshot(51, b=20.0)) == 1
+    assert forecaster.observe(snapshot(51, b=99.0)) == 0
+    reference = HoltWintersForecaster(metrics={"latency": LATENCY})
+    reference.observe(snapshot(1, a=1.0, b=10.0))
+    reference.observe(snapshot(2, a=2.0, b=20.0))
+    keys, values = forecaster.forecast(3)
+    expected_keys, expected = reference.forecast(3)
+    assert sorted(keys) == sorted(expected_keys)
+    assert dict(zip(keys, values.tolist())) == dict(zip(expected_keys, expected.tolist()))
+
+
+def test_snapshot_without_timestamp_keeps_the_last_one():
+    forecaster = HoltWintersForecaster(metrics={"latency": LATENCY})
+    assert forecaster.observe(snapshot(10, a=1.0)) == 1
+    assert forecaster.observe(snapshot(None, a=2.0)) == 1
+    assert forecaster.observe(snapshot(9, a=3.0)) == 0
+
+
+def test_null_values_do_not_update_a_series():
+    forecaster = HoltWintersForecaster(metrics={"latency": LATENCY})
+    assert forecaster.observe(snapshot(10, a=None, b=1.0)) == 1
+    keys, _ = forecaster.forecast(1)
+    assert keys == [("b", LATENCY)]
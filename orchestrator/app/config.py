@@ -1,10 +1,13 @@
 from __future__ import annotations
 
+from typing import Dict, List, Optional
 from urllib.parse import urlparse
 
-from pydantic import Field, PositiveInt, field_validator
+from pydantic import Field, PositiveFloat, PositiveInt, ValidationInfo, field_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
+PREDICTION_FORMATS = {"json", "compact", "msgpack"}
+
 
 class Settings(BaseSettings):
     """Runtime configuration loaded from environment variables."""
@@ -17,13 +20,133 @@ class Settings(BaseSettings):
         default="http://ml-agent:8080/predict",
         description="Endpoint used to request predictions for a snapshot.",
     )
-    poll_interval_seconds: PositiveInt = Field(
+    load_watchers: Dict[str, str] = Field(
+        default_factory=dict,
+        description="Cluster name -> load-watcher URL (JSON object), fetched concurrently; replaces load_watcher_url.",
+    )
+    cluster_name: str = Field(
+        default="",
+        description="Cluster label of load_watcher_url's predictions when load_watchers is not set.",
+    )
+    ml_agent_urls: List[str] = Field(
+        default_factory=list,
+        description="ml-agent replicas (JSON array) sharing the prediction load; replaces ml_agent_url.",
+    )
+    eject_after_failures: PositiveInt = Field(
+        default=3, description="Consecutive failures after which an endpoint is ejected."
+    )
+    eject_seconds: PositiveFloat = Field(
+        default=30.0, description="How long an ejected endpoint is skipped before it is tried again."
+    )
+    poll_interval_seconds: PositiveFloat = Field(
         default=60,
-        description="How often (in seconds) to run the orchestrator pipeline.",
+        description="How often (in seconds) to run the orchestrator pipeline; may be below 1 in stream mode.",
+    )
+    adaptive_polling: bool = Field(
+        default=False,
+        description="Adapt the poll interval to how fast metrics change and align fetches to load-watcher's window.",
+    )
+    poll_min_interval_seconds: PositiveFloat = Field(
+        default=5.0, description="Adaptive polling: interval while observed metrics or predictions change quickly."
+    )
+    poll_max_interval_seconds: PositiveFloat = Field(
+        default=300.0, description="Adaptive polling: interval the back-off stops at while metrics are stable."
+    )
+    poll_backoff_factor: float = Field(
+        default=2.0, gt=1.0, description="Adaptive polling: factor the interval grows by per stable poll."
+    )
+    poll_change_threshold: PositiveFloat = Field(
+        default=0.05,
+        description="Adaptive polling: relative change of a metric or prediction between polls that counts as fast.",
+    )
+    poll_align_to_window: bool = Field(
+        default=True, description="Adaptive polling: fetch just after load-watcher's expected window refreshes."
+    )
+    poll_align_grace_seconds: float = Field(
+        default=1.0, ge=0.0, description="Adaptive polling: delay after an expected window refresh before fetching."
     )
     request_timeout_seconds: PositiveInt = Field(
         default=15, description="HTTP timeout for both fetch and predict requests."
     )
+    async_mode: bool = Field(
+        default=False,
+        description="Run the pipelined asyncio loop (prefetching snapshots) instead of the serial one.",
+    )
+    stream_mode: bool = Field(
+        default=False,
+        description="Push snapshots to ml-agent over one persistent WebSocket instead of a request per cycle.",
+    )
+    ml_agent_stream_url: Optional[str] = Field(
+        default=None,
+        description="Stream mode: ml-agent WebSocket endpoint; defaults to ml_agent_url with a ws scheme and /stream.",
+    )
+    stream_reconnect_seconds: PositiveFloat = Field(
+        default=1.0, description="Stream mode: delay before reconnecting a closed or failed stream."
+    )
+    fetch_deadline_seconds: PositiveFloat = Field(
+        default=10.0, description="Async and stream modes: deadline for fetching one snapshot."
+    )
+    predict_deadline_seconds: PositiveFloat = Field(
+        default=15.0, description="Async mode: deadline for one ml-agent prediction."
+    )
+    pipeline_queue_size: PositiveInt = Field(
+        default=2,
+        description="Async and stream modes: snapshots buffered between fetch and predict; the oldest is dropped when full.",
+    )
+    skip_unchanged_snapshots: bool = Field(
+        default=True,
+        description="Re-publish the last predictions instead of calling ml-agent when the snapshot is unchanged.",
+    )
+    fingerprint_tolerances: Dict[str, float] = Field(
+        default_factory=dict,
+        description="Per-metric-name quantization step used when fingerprinting snapshots (JSON object).",
+    )
+    fingerprint_default_tolerance: float = Field(
+        default=0.0,
+        ge=0.0,
+        description="Quantization step for metrics without an explicit tolerance; 0 compares exact values.",
+    )
+    snapshot_dir: Optional[str] = Field(
+        default=None,
+        description="Directory (e.g. a shared volume) for the Parquet snapshot store; unset disables it.",
+    )
+    snapshot_batch_rows: PositiveInt = Field(
+        default=4096, description="Rows buffered per table before a Parquet row group is written."
+    )
+    snapshot_flush_interval_seconds: PositiveFloat = Field(
+        default=300.0, description="Maximum time buffered rows wait before being written."
+    )
+    snapshot_rotate_bytes: PositiveInt = Field(
+        default=64 * 1024 * 1024, description="Start a new snapshot file once the current one reaches this size."
+    )
+    snapshot_rotate_seconds: float = Field(
+        default=0.0,
+        ge=0.0,
+        description=(
+            "Start a new snapshot file once the current one is this old; 0 closes it on every flush, "
+            "so a crash loses at most the rows buffered since the last flush."
+        ),
+    )
+    snapshot_retention_bytes: PositiveInt = Field(
+        default=10 * 1024 * 1024 * 1024,
+        description="Total size of closed snapshot files to keep; the oldest are deleted beyond it.",
+    )
+    snapshot_compression: str = Field(
+        default="zstd", description="Parquet compression codec (zstd, snappy, gzip, none)."
+    )
+    stale_series_cycles: int = Field(
+        default=10,
+        ge=0,
+        description="Remove predicted series not refreshed within this many cycles; 0 keeps them forever.",
+    )
+    target_selector: Optional[str] = Field(
+        default=None,
+        description="Label selector (key=value,...) limiting the candidate target nodes ml-agent scores.",
+    )
+    prediction_format: str = Field(
+        default="msgpack",
+        description="Response format requested from ml-agent: json, compact (orjson) or msgpack.",
+    )
     metrics_port: PositiveInt = Field(
         default=9105,
         description="Port exposed by the Prometheus exporter server.",
@@ -47,3 +170,69 @@ class Settings(BaseSettings):
             raise ValueError(msg)
         return value
 
+    @field_validator("poll_max_interval_seconds")
+    @classmethod
+    def _validate_poll_max_interval(cls, value: float, info: ValidationInfo) -> float:
+        minimum = info.data.get("poll_min_interval_seconds")
+        if minimum is not None and value < minimum:
+            msg = f"poll_max_interval_seconds ({value}) must not be below poll_min_interval_seconds ({minimum})."
+            raise ValueError(msg)
+        return value
+
+    @field_validator("load_watchers")
+    @classmethod
+    def _validate_load_watchers(cls, value: Dict[str, str]) -> Dict[str, str]:
+        for url in value.values():
+            cls._validate_url(url)
+        return value
+
+    @field_validator("ml_agent_urls")
+    @classmethod
+    def _validate_ml_agent_urls(cls, value: List[str]) -> List[str]:
+        for url in value:
+            cls._validate_url(url)
+        return value
+
+    @property
+    def clusters(self) -> Dict[str, str]:
+        """Cluster name -> load-watcher URL of every cluster driven by this orchestrator."""
+        return dict(self.load_watchers) or {self.cluster_name: self.load_watcher_url}
+
+    @property
+    def prediction_urls(self) -> List[str]:
+        """Every ml-agent replica's prediction endpoint."""
+        return list(self.ml_agent_urls) or [self.ml_agent_url]
+
+    @property
+    def fans_out(self) -> bool:
+        """Several clusters or replicas, which only the async loop drives."""
+        return len(self.clusters) > 1 or len(self.prediction_urls) > 1
+
+    @field_validator("ml_agent_stream_url")
+    @classmethod
+    def _validate_stream_url(cls, value: Optional[str]) -> Optional[str]:
+        if not value:
+            return None
+        parsed = urlparse(value)
+        if parsed.scheme not in ("ws", "wss") or not parsed.netloc:
+            msg = f"Stream URL must use ws:// or wss:// and include a host, got '{value}'."
+            raise ValueError(msg)
+        return value
+
+    @property
+    def stream_url(self) -> str:
+        """WebSocket URL of ml-agent's prediction stream."""
+        if self.ml_agent_stream_url:
+            return self.ml_agent_stream_url
+        parsed = urlparse(self.ml_agent_url)
+        scheme = "wss" if parsed.scheme == "https" else "ws"
+        return parsed._replace(scheme=scheme, path=parsed.path.rstrip("/") + "/stream").geturl()
+
+    @field_validator("prediction_format")
+    @classmethod
+    def _validate_prediction_format(cls, value: str) -> str:
+        normalized = value.strip().lower()
+        if normalized not in PREDICTION_FORMATS:
+            msg = f"prediction_format must be one of {sorted(PREDICTION_FORMATS)}, got '{value}'."
+            raise ValueError(msg)
+        return normalized
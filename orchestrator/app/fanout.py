@@ -0,0 +1,146 @@
+"""
+Endpoints shared by the per-cluster pipelines of the async orchestrator: health
+tracking with ejection, a least-outstanding-requests pool of ml-agent replicas and
+one pooled HTTP client per host.
+"""
+from __future__ import annotations
+
+import logging
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+from urllib.parse import urlparse
+
+import httpx
+
+from app import metrics
+
+LOGGER = logging.getLogger(__name__)
+
+
+class Endpoint:
+    """
+    One load-watcher or ml-agent URL with its in-flight request count and health.
+    After eject_after_failures consecutive failures the endpoint is ejected for
+    eject_seconds. Once that expires it gets traffic again, and it is ejected again
+    on its next failure until a success resets the count.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        eject_after_failures: int = 3,
+        eject_seconds: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.url = url
+        self.eject_after_failures = eject_after_failures
+        self.eject_seconds = eject_seconds
+        self.outstanding = 0
+        self.failures = 0
+        self.ejected_until = 0.0
+        self._clock = clock
+
+    @property
+    def ejected(self) -> bool:
+        return self.ejected_until > self._clock()
+
+    def record_success(self) -> None:
+        if self.ejected_until:
+            LOGGER.info("Endpoint %s recovered.", self.url)
+            metrics.record_endpoint_ejected(self.url, False)
+        self.failures = 0
+        self.ejected_until = 0.0
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.failures < self.eject_after_failures:
+            return
+        # Requests already in flight when it was ejected only extend the ejection
+        newly_ejected = not self.ejected
+        self.ejected_until = self._clock() + self.eject_seconds
+        if newly_ejected:
+            metrics.record_endpoint_ejected(self.url, True)
+            LOGGER.warning(
+                "Ejecting endpoint %s for %ss after %d consecutive failures.",
+                self.url,
+                self.eject_seconds,
+                self.failures,
+            )
+
+
+class EndpointPool:
+    """
+    Interchangeable endpoints (ml-agent replicas) picked by least outstanding
+    requests, skipping ejected ones. Ties rotate so idle replicas share the load.
+    When every endpoint is ejected, the one whose ejection ends first is used
+    rather than failing outright.
+    """
+
+    def __init__(
+        self,
+        urls: Iterable[str],
+        eject_after_failures: int = 3,
+        eject_seconds: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.endpoints: List[Endpoint] = [
+            Endpoint(url, eject_after_failures, eject_seconds, clock) for url in dict.fromkeys(urls)
+        ]
+        if not self.endpoints:
+            raise ValueError("EndpointPool needs at least one URL")
+        self._turn = 0
+
+    def __len__(self) -> int:
+        return len(self.endpoints)
+
+    def acquire(self, exclude: Iterable[Endpoint] = ()) -> Endpoint:
+        """
+        Pick an endpoint (other than `exclude`, if possible) and count a request on it;
+        hand it back with release().
+        """
+        excluded = set(map(id, exclude))
+        candidates = [e for e in self.endpoints if id(e) not in excluded] or self.endpoints
+        healthy = [e for e in candidates if not e.ejected]
+        self._turn = (self._turn + 1) % len(self.endpoints)
+        if healthy:
+            offset = self._turn % len(healthy)
+            rotated = healthy[offset:] + healthy[:offset]
+            chosen = min(rotated, key=lambda e: e.outstanding)
+        else:
+            chosen = min(candidates, key=lambda e: e.ejected_until)
+        chosen.outstanding += 1
+        metrics.record_endpoint_outstanding(chosen.url, chosen.outstanding)
+        return chosen
+
+    def release(self, endpoint: Endpoint, ok: bool) -> None:
+        endpoint.outstanding -= 1
+        metrics.record_endpoint_outstanding(endpoint.url, endpoint.outstanding)
+        if ok:
+            endpoint.record_success()
+        else:
+            endpoint.record_failure()
+
+
+class HostClients:
+    """
+    One pooled httpx.AsyncClient per scheme and host, created on first use, so the
+    endpoints of one host share keep-alive connections and hosts don't share limits.
+    """
+
+    def __init__(self, timeout: float, limits: Optional[httpx.Limits] = None):
+        self.timeout = timeout
+        self.limits = limits or httpx.Limits(max_connections=10, max_keepalive_connections=4)
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+
+    def for_url(self, url: str) -> httpx.AsyncClient:
+        parsed = urlparse(url)
+        key = f"{parsed.scheme}://{parsed.netloc}"
+        client = self._clients.get(key)
+        if client is None:
+            client = self._clients[key] = httpx.AsyncClient(timeout=self.timeout, limits=self.limits)
+        return client
+
+    async def aclose(self) -> None:
+        for client in self._clients.values():
+            await client.aclose()
+        self._clients.clear()
@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+from typing import Dict, Iterator, List, Mapping, Optional, Tuple
+
+
+def iter_node_metrics(snapshot: Mapping[str, object]) -> Iterator[Tuple[str, str, float]]:
+    """
+    Yield (host, metric name, value) for every numeric metric in a snapshot's
+    NodeMetricsMap.
+    """
+    data = snapshot.get("data") or {}
+    node_metrics_map = (data.get("NodeMetricsMap") if isinstance(data, dict) else None) or {}
+    for host, bucket in node_metrics_map.items():
+        for metric in (bucket or {}).get("metrics", []) or []:
+            try:
+                value = float(metric.get("value", 0.0))
+            except (TypeError, ValueError):
+                continue
+            yield host, str(metric.get("name", "")), value
+
+
+class SnapshotFingerprinter:
+    """
+    Cheap content fingerprint of a load-watcher snapshot: a hash over the sorted
+    (host, metric name, value) tuples of its NodeMetricsMap. Values can be
+    quantized per metric name so changes below a tolerance don't alter it.
+    """
+
+    def __init__(self, tolerances: Optional[Mapping[str, float]] = None, default_tolerance: float = 0.0):
+        self.tolerances = dict(tolerances or {})
+        self.default_tolerance = default_tolerance
+
+    def _quantize(self, name: str, value: float) -> float:
+        tolerance = self.tolerances.get(name, self.default_tolerance)
+        if tolerance > 0:
+            return float(round(value / tolerance))
+        return value
+
+    def fingerprint(self, snapshot: Mapping[str, object]) -> int:
+        entries: List[Tuple[str, str, float]] = [
+            (host, name, self._quantize(name, value)) for host, name, value in iter_node_metrics(snapshot)
+        ]
+        entries.sort()
+        return hash(tuple(entries))
+
+
+class UnchangedSnapshotFilter:
+    """
+    Remembers the last snapshot that was successfully predicted, and its response,
+    so an identical follow-up snapshot can reuse the predictions instead of
+    calling ml-agent. A snapshot counts as unchanged when it carries the same
+    timestamp/window.end or the same metrics fingerprint.
+    """
+
+    def __init__(self, fingerprinter: SnapshotFingerprinter):
+        self.fingerprinter = fingerprinter
+        self._window: Optional[Tuple[object, object]] = None
+        self._fingerprint: Optional[int] = None
+        self._response: Optional[Dict[str, object]] = None
+
+    @staticmethod
+    def _window_key(snapshot: Mapping[str, object]) -> Optional[Tuple[object, object]]:
+        window = snapshot.get("window") or {}
+        end = window.get("end") if isinstance(window, dict) else None
+        timestamp = snapshot.get("timestamp")
+        if timestamp is None and end is None:
+            return None
+        return timestamp, end
+
+    def lookup(self, snapshot: Mapping[str, object]) -> Tuple[int, Optional[Dict[str, object]]]:
+        """
+        Return the snapshot's fingerprint and the cached response if it is unchanged.
+        """
+        window = self._window_key(snapshot)
+        if self._response is not None and window is not None and window == self._window:
+            return self._fingerprint or 0, self._response
+        fingerprint = self.fingerprinter.fingerprint(snapshot)
+        if self._response is not None and fingerprint == self._fingerprint:
+            return fingerprint, self._response
+        return fingerprint, None
+
+    def store(self, snapshot: Mapping[str, object], fingerprint: int, response: Dict[str, object]) -> None:
+        self._window = self._window_key(snapshot)
+        self._fingerprint = fingerprint
+        self._response = response
@@ -1,10 +1,13 @@
 from __future__ import annotations
 
+import asyncio
 import logging
+import signal
 import sys
+from typing import Awaitable
 
 from app.config import Settings
-from app.orchestrator import run
+from app.orchestrator import run, run_async, run_stream
 
 
 def configure_logging(level: str) -> None:
@@ -14,11 +17,56 @@ def configure_logging(level: str) -> None:
     )
 
 
+def _exit_on_sigterm(signum: int, _frame: object) -> None:
+    logging.getLogger(__name__).info("Received SIGTERM; stopping.")
+    # Unwinds run() through its finally blocks, which flush the snapshot sink
+    raise SystemExit(0)
+
+
+async def _until_sigterm(main: Awaitable[None]) -> None:
+    """
+    Run an async orchestrator loop, cancelling it on SIGTERM so its finally blocks
+    stop the snapshot sink (flushing and closing its files) before the process exits.
+    Python's default SIGTERM action would exit without running them.
+    """
+    loop = asyncio.get_running_loop()
+    task = asyncio.ensure_future(main)
+    terminated = False
+
+    def _terminate() -> None:
+        nonlocal terminated
+        terminated = True
+        logging.getLogger(__name__).info("Received SIGTERM; stopping.")
+        task.cancel()
+
+    loop.add_signal_handler(signal.SIGTERM, _terminate)
+    try:
+        await task
+    except asyncio.CancelledError:
+        if not terminated:
+            raise
+    finally:
+        loop.remove_signal_handler(signal.SIGTERM)
+
+
 def main() -> None:
     settings = Settings()
     configure_logging(settings.log_level)
     logging.getLogger(__name__).info("Loaded orchestrator settings: %s", settings.model_dump())
-    run(settings)
+    if settings.stream_mode:
+        if settings.fans_out:
+            logging.getLogger(__name__).warning(
+                "Stream mode ignores ORCH_LOAD_WATCHERS and ORCH_ML_AGENT_URLS; streaming %s to %s.",
+                settings.load_watcher_url,
+                settings.stream_url,
+            )
+        asyncio.run(_until_sigterm(run_stream(settings)))
+    elif settings.async_mode or settings.fans_out:
+        # Several clusters or replicas are only driven by the async loop
+        asyncio.run(_until_sigterm(run_async(settings)))
+    else:
+        signal.signal(signal.SIGTERM, _exit_on_sigterm)
+        run(settings)
 
 
 if __name__ == "__main__":
@@ -1,24 +1,96 @@
 from __future__ import annotations
 
 import time
-from typing import Dict, List, Sequence
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
 
-from prometheus_client import Counter, Gauge, start_http_server
+from prometheus_client import Counter, Enum, Gauge, start_http_server
 
 PREDICTED_GAUGE = Gauge(
     "loadwatcher_predicted_value",
     "Predicted metric produced by ml-agent.",
-    labelnames=("metric", "source_host"),
+    labelnames=("cluster", "source_host", "target_host", "feature"),
 )
 
 CYCLE_FAILURES = Counter(
     "orchestrator_cycle_failures_total",
     "Number of orchestrator cycles that ended in failure.",
+    labelnames=("cluster",),
+)
+
+CYCLES_SKIPPED = Counter(
+    "orchestrator_cycles_skipped_total",
+    "Number of cycles whose snapshot was unchanged, so the last predictions were re-published.",
+    labelnames=("cluster",),
+)
+
+SNAPSHOT_ROWS_WRITTEN = Counter(
+    "orchestrator_snapshot_rows_written_total",
+    "Rows persisted to the snapshot store.",
+    labelnames=("table",),
+)
+
+SNAPSHOT_DROPPED = Counter(
+    "orchestrator_snapshot_dropped_total",
+    "Cycles not persisted because the snapshot writer queue was full.",
+)
+
+STREAM_DROPPED = Counter(
+    "orchestrator_stream_dropped_total",
+    "Snapshots streamed to ml-agent that it dropped unpredicted because it was behind.",
 )
 
 LAST_SUCCESS = Gauge(
     "orchestrator_last_success_timestamp_seconds",
     "Unix epoch timestamp for the most recent successful cycle.",
+    labelnames=("cluster",),
+)
+
+ENDPOINT_OUTSTANDING = Gauge(
+    "orchestrator_endpoint_outstanding_requests",
+    "Prediction requests in flight per ml-agent endpoint.",
+    labelnames=("endpoint",),
+)
+
+ENDPOINT_EJECTED = Gauge(
+    "orchestrator_endpoint_ejected",
+    "1 while an endpoint is ejected after consecutive failures, else 0.",
+    labelnames=("endpoint",),
+)
+
+ENDPOINT_EJECTIONS = Counter(
+    "orchestrator_endpoint_ejections_total",
+    "Times an endpoint was ejected after consecutive failures.",
+    labelnames=("endpoint",),
+)
+
+POLL_INTERVAL_REASONS = (
+    "fixed",
+    "initial",
+    "observed_changing",
+    "predictions_changing",
+    "stable",
+    "window_pending",
+    "failed",
+)
+
+POLL_INTERVAL = Gauge(
+    "orchestrator_poll_interval_seconds",
+    "Delay until the next load-watcher fetch, as last scheduled.",
+    labelnames=("cluster",),
+)
+
+POLL_INTERVAL_REASON = Enum(
+    "orchestrator_poll_interval_reason",
+    "Why the current poll interval was chosen.",
+    labelnames=("cluster",),
+    states=list(POLL_INTERVAL_REASONS),
+)
+
+WATCHER_REFRESH_PERIOD = Gauge(
+    "orchestrator_watcher_refresh_period_seconds",
+    "Refresh period of load-watcher's snapshot window, inferred from successive window ends.",
+    labelnames=("cluster",),
 )
 
 
@@ -26,12 +98,151 @@ def start_metrics_server(bind_address: str, port: int) -> None:
     start_http_server(port, addr=bind_address)
 
 
-def record_cycle_success() -> None:
-    LAST_SUCCESS.set(time.time())
+def record_cycle_success(cluster: str = "") -> None:
+    LAST_SUCCESS.labels(cluster=cluster).set(time.time())
+
+
+def record_cycle_failure(cluster: str = "") -> None:
+    CYCLE_FAILURES.labels(cluster=cluster).inc()
+
+
+def record_cycle_skipped(cluster: str = "") -> None:
+    CYCLES_SKIPPED.labels(cluster=cluster).inc()
+
+
+def record_endpoint_outstanding(endpoint: str, outstanding: int) -> None:
+    ENDPOINT_OUTSTANDING.labels(endpoint=endpoint).set(outstanding)
+
 
+def record_endpoint_ejected(endpoint: str, ejected: bool) -> None:
+    ENDPOINT_EJECTED.labels(endpoint=endpoint).set(1 if ejected else 0)
+    if ejected:
+        ENDPOINT_EJECTIONS.labels(endpoint=endpoint).inc()
 
-def record_cycle_failure() -> None:
-    CYCLE_FAILURES.inc()
+
+def record_poll_interval(cluster: str, interval: float, reason: str) -> None:
+    POLL_INTERVAL.labels(cluster=cluster).set(interval)
+    POLL_INTERVAL_REASON.labels(cluster=cluster).state(reason)
+
+
+def record_watcher_refresh_period(cluster: str, period: float) -> None:
+    WATCHER_REFRESH_PERIOD.labels(cluster=cluster).set(period)
+
+
+def record_snapshot_rows_written(table: str, rows: int) -> None:
+    SNAPSHOT_ROWS_WRITTEN.labels(table=table).inc(rows)
+
+
+def record_snapshot_dropped() -> None:
+    SNAPSHOT_DROPPED.inc()
+
+
+def record_stream_dropped(count: int) -> None:
+    if count > 0:
+        STREAM_DROPPED.inc(count)
+
+
+@dataclass
+class _Child:
+    labels: Tuple[str, str, str, str]
+    gauge: Gauge
+    last_cycle: int
+
+
+class PredictionPublisher:
+    """
+    Publishes one cluster's predictions through cached gauge children keyed by
+    (target_id, column index, source_host), so a cycle does not rebuild label
+    values or look children up by label. Children not refreshed within
+    stale_cycles publishes are removed from the gauge, so series of hosts or
+    sources that disappear stop being exported.
+    """
+
+    def __init__(self, gauge: Gauge, stale_cycles: int = 10, cluster: str = ""):
+        self.gauge = gauge
+        self.cluster = cluster
+        self.stale_cycles = stale_cycles
+        self._children: Dict[Tuple[int, int, str], _Child] = {}
+        self._cycle = 0
+
+    def publish(
+        self,
+        source_host: str,
+        target_map: Dict[int, str],
+        columns: Sequence[str],
+        predictions: Dict[int, List[float]],
+    ) -> None:
+        self._cycle += 1
+        cycle = self._cycle
+        children = self._children
+        column_count = len(columns)
+        for target_id, values in predictions.items():
+            target_id = int(target_id)
+            target_host = target_map.get(target_id, str(target_id))
+            for idx, value in enumerate(values):
+                key = (target_id, idx, source_host)
+                child = children.get(key)
+                if child is None or child.labels[1] != target_host or (
+                    idx < column_count and child.labels[2] != columns[idx]
+                ):
+                    child = self._replace_child(key, child, target_host, columns, idx)
+                child.gauge.set(value)
+                child.last_cycle = cycle
+        self._collect_garbage()
+
+    def _replace_child(
+        self,
+        key: Tuple[int, int, str],
+        previous: Optional[_Child],
+        target_host: str,
+        columns: Sequence[str],
+        idx: int,
+    ) -> _Child:
+        if previous is not None:
+            self.gauge.remove(*previous.labels)
+        feature = columns[idx] if idx < len(columns) else f"y_{idx}"
+        labels = (self.cluster, key[2], target_host, feature)
+        child = _Child(labels=labels, gauge=self.gauge.labels(*labels), last_cycle=self._cycle)
+        self._children[key] = child
+        return child
+
+    def _collect_garbage(self) -> None:
+        if self.stale_cycles <= 0:
+            return
+        oldest = self._cycle - self.stale_cycles
+        stale = [key for key, child in self._children.items() if child.last_cycle <= oldest]
+        for key in stale:
+            self.gauge.remove(*self._children.pop(key).labels)
+
+
+class ClusterPublishers:
+    """
+    One PredictionPublisher per cluster, created on first publish, so staleness is
+    counted in each cluster's own cycles.
+    """
+
+    def __init__(self, gauge: Gauge, stale_cycles: int = 10):
+        self.gauge = gauge
+        self.stale_cycles = stale_cycles
+        self._publishers: Dict[str, PredictionPublisher] = {}
+
+    def configure(self, stale_cycles: int) -> None:
+        self.stale_cycles = stale_cycles
+        for publisher in self._publishers.values():
+            publisher.stale_cycles = stale_cycles
+
+    def publisher(self, cluster: str) -> PredictionPublisher:
+        publisher = self._publishers.get(cluster)
+        if publisher is None:
+            publisher = self._publishers[cluster] = PredictionPublisher(self.gauge, self.stale_cycles, cluster)
+        return publisher
+
+
+PUBLISHERS = ClusterPublishers(PREDICTED_GAUGE)
+
+
+def configure_stale_series(stale_cycles: int) -> None:
+    PUBLISHERS.configure(stale_cycles)
 
 
 def publish_predictions(
@@ -40,12 +251,6 @@ def publish_predictions(
     target_map: Dict[int, str],
     columns: Sequence[str],
     predictions: Dict[int, List[float]],
+    cluster: str = "",
 ) -> None:
-    for target_id, values in predictions.items():
-        column_count = len(columns)
-        target_host = target_map.get(int(target_id), str(target_id))
-        for idx, value in enumerate(values):
-            column_name = columns[idx] if idx < column_count else f"y_{idx}"
-            metric_label = f"{target_host}:{column_name}"
-            PREDICTED_GAUGE.labels(metric=metric_label, source_host=source_host).set(value)
-
+    PUBLISHERS.publisher(cluster).publish(source_host, target_map, columns, predictions)
@@ -1,17 +1,42 @@
 from __future__ import annotations
 
+import asyncio
 import logging
 import json
-import time
-from typing import Dict, List, Tuple
+import sys
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple, Union
+from urllib.parse import urlencode
 
 import httpx
+import msgpack
+import orjson
+from websockets.asyncio.client import ClientConnection, connect
 
 from app import metrics
 from app.config import Settings
+from app.fanout import Endpoint, EndpointPool, HostClients
+from app.fingerprint import SnapshotFingerprinter, UnchangedSnapshotFilter
+from app.scheduler import AdaptivePollSchedule, PollSchedule
+from app.snapshot_store import SnapshotSink
 
 LOGGER = logging.getLogger(__name__)
 
+# (columns, target id -> host, target id -> predicted values, source host)
+ParsedPredictions = Tuple[List[str], Dict[int, str], Dict[int, List[float]], str]
+
+COMPACT_JSON_MEDIA_TYPE = "application/vnd.ml-agent.compact+json"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+ACCEPT_HEADERS: Dict[str, str] = {
+    "json": "application/json",
+    "compact": f"{COMPACT_JSON_MEDIA_TYPE}, application/json;q=0.5",
+    "msgpack": f"{MSGPACK_MEDIA_TYPE}, application/json;q=0.5",
+}
+
+# Streamed snapshots awaiting a reply, beyond which the oldest are forgotten
+MAX_PENDING_STREAM_SNAPSHOTS = 1024
+
 
 def fetch_snapshot(client: httpx.Client, url: str) -> Dict[str, object]:
     response = client.get(url)
@@ -20,66 +45,543 @@ def fetch_snapshot(client: httpx.Client, url: str) -> Dict[str, object]:
     return data
 
 
-def request_predictions(client: httpx.Client, url: str, payload: Dict[str, object]) -> Dict[str, object]:
-    response = client.post(url, json=payload)
+def request_predictions(
+    client: httpx.Client,
+    url: str,
+    payload: Dict[str, object],
+    response_format: str = "json",
+    target_selector: Optional[str] = None,
+) -> Dict[str, object]:
+    response = client.post(url, **_prediction_request(payload, response_format, target_selector))
+    response.raise_for_status()
+    return decode_prediction_response(response)
+
+
+async def fetch_snapshot_async(client: httpx.AsyncClient, url: str) -> Dict[str, object]:
+    response = await client.get(url)
     response.raise_for_status()
     data: Dict[str, object] = response.json()
     return data
 
 
-def parse_predictions(
-    response: Dict[str, object]
-) -> Tuple[List[str], Dict[int, str], Dict[int, List[float]], str]:
+async def request_predictions_async(
+    client: httpx.AsyncClient,
+    url: str,
+    payload: Dict[str, object],
+    response_format: str = "json",
+    target_selector: Optional[str] = None,
+) -> Dict[str, object]:
+    response = await client.post(url, **_prediction_request(payload, response_format, target_selector))
+    response.raise_for_status()
+    return decode_prediction_response(response)
+
+
+def _prediction_request(
+    payload: Dict[str, object], response_format: str, target_selector: Optional[str] = None
+) -> Dict[str, object]:
+    request: Dict[str, object] = {
+        "content": orjson.dumps(payload),
+        "headers": {
+            "Content-Type": "application/json",
+            "Accept": ACCEPT_HEADERS.get(response_format, ACCEPT_HEADERS["json"]),
+        },
+    }
+    if target_selector:
+        request["params"] = {"target_selector": target_selector}
+    return request
+
+
+def decode_prediction_response(response: httpx.Response) -> Dict[str, object]:
+    """
+    Decode an ml-agent response by its content type; older agents answer plain JSON
+    whatever was requested.
+    """
+    content_type = response.headers.get("content-type", "").split(";", 1)[0].strip().lower()
+    if content_type in (MSGPACK_MEDIA_TYPE, "application/x-msgpack"):
+        return _decode_msgpack(response.content)
+    return orjson.loads(response.content)
+
+
+def decode_stream_message(message: Union[str, bytes]) -> Dict[str, object]:
+    """
+    Decode one /predict/stream reply: binary frames are msgpack, text frames compact JSON.
+    """
+    if isinstance(message, (bytes, bytearray)):
+        return _decode_msgpack(message)
+    return orjson.loads(message)
+
+
+def _decode_msgpack(content: bytes) -> Dict[str, object]:
+    data: Dict[str, object] = msgpack.unpackb(content, raw=False)
+    for key in ("features", "predictions"):
+        raw = data.get(key)
+        if isinstance(raw, (bytes, bytearray)):
+            data[key] = _float64_le(raw)
+    return data
+
+
+def _float64_le(raw: bytes) -> List[float]:
+    values = array("d")
+    values.frombytes(raw)
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values.tolist()
+
+
+def parse_predictions(response: Dict[str, object]) -> ParsedPredictions:
     columns = [str(col) for col in response.get("columns", [])]  # type: ignore[arg-type]
+    source_host = str(response.get("source_host", ""))
+    if "target_ids" in response:
+        target_map, predictions = _parse_compact_predictions(response, len(columns))
+        return columns, target_map, predictions, source_host
     target_map_raw = response.get("target_map", {}) or {}
-    target_map: Dict[int, str] = {int(k): str(v) for k, v in target_map_raw.items()}
+    target_map = {int(k): str(v) for k, v in target_map_raw.items()}
     predictions_raw = response.get("predictions", {}) or {}
-    predictions: Dict[int, List[float]] = {
+    predictions = {
         int(k): [float(x) for x in v] for k, v in predictions_raw.items()
     }
-    source_host = str(response.get("source_host", ""))
     return columns, target_map, predictions, source_host
 
 
+def _parse_compact_predictions(
+    response: Dict[str, object], width: int
+) -> Tuple[Dict[int, str], Dict[int, List[float]]]:
+    # Compact format: target ids once, predictions as one row-major array of floats
+    target_ids: List[int] = list(response.get("target_ids", []) or [])  # type: ignore[call-overload]
+    target_hosts: List[str] = list(response.get("target_hosts", []) or [])  # type: ignore[call-overload]
+    flat: List[float] = list(response.get("predictions", []) or [])  # type: ignore[call-overload]
+    if target_ids and not width:
+        width = len(flat) // len(target_ids)
+    target_map = dict(zip(target_ids, target_hosts))
+    predictions = {
+        tid: flat[row * width:(row + 1) * width] for row, tid in enumerate(target_ids)
+    }
+    return target_map, predictions
+
+
 def run(settings: Settings) -> None:
     LOGGER.info("Starting orchestrator with %ss interval.", settings.poll_interval_seconds)
     metrics.start_metrics_server(
         bind_address=settings.metrics_bind_address,
         port=settings.metrics_port,
     )
+    metrics.configure_stale_series(settings.stale_series_cycles)
+
+    snapshot_filter = _build_snapshot_filter(settings)
+    sink = _build_snapshot_sink(settings)
+    schedule = _build_poll_schedule(settings, settings.cluster_name)
+    try:
+        with httpx.Client(timeout=settings.request_timeout_seconds) as client:
+            while True:
+                try:
+                    run_cycle(client, settings, snapshot_filter, sink, schedule)
+                except Exception:
+                    schedule.record_failure()
+                    metrics.record_cycle_failure(settings.cluster_name)
+                    LOGGER.exception("Cycle failed.")
+
+                schedule.schedule()
+                schedule.sleep()
+    finally:
+        if sink:
+            sink.stop()
+
+
+def run_cycle(
+    client: httpx.Client,
+    settings: Settings,
+    snapshot_filter: Optional[UnchangedSnapshotFilter] = None,
+    sink: Optional[SnapshotSink] = None,
+    schedule: Optional[PollSchedule] = None,
+) -> ParsedPredictions:
+    """
+    One fetch -> predict -> publish -> persist pass of the synchronous loop.
+    """
+    snapshot = fetch_snapshot(client, settings.load_watcher_url)
+    _log_snapshot(snapshot)
+    if schedule:
+        schedule.observe_snapshot(snapshot)
+
+    fingerprint, reused = snapshot_filter.lookup(snapshot) if snapshot_filter else (0, None)
+    if reused is not None:
+        parsed = _publish(reused, reused_snapshot=True, cluster=settings.cluster_name)
+    else:
+        prediction_response = request_predictions(
+            client, settings.ml_agent_url, snapshot, settings.prediction_format, settings.target_selector
+        )
+        parsed = _publish(prediction_response, cluster=settings.cluster_name)
+        _observe_predictions(schedule, parsed)
+        if snapshot_filter:
+            snapshot_filter.store(snapshot, fingerprint, prediction_response)
+    _persist(sink, snapshot, parsed, settings.cluster_name)
+    return parsed
+
+
+async def run_async(settings: Settings) -> None:
+    """
+    Pipelined variant of run(), driving every configured cluster concurrently.
+    Per cluster, a fetch stage polls its load-watcher on its poll schedule (ticks
+    aligned to poll_interval_seconds, or adaptive) and hands snapshots to a predict stage through a bounded
+    queue, so the next snapshot is prefetched while a prediction is still in flight.
+    Predict stages share the pool of ml-agent replicas, picked by least outstanding
+    requests with ejection of failing ones, and one pooled HTTP client per host.
+    Each HTTP request has its own deadline; when a queue is full the oldest snapshot
+    is dropped in favour of the fresh one.
+    """
+    clusters = settings.clusters
+    LOGGER.info(
+        "Starting async orchestrator with %ss interval for %d cluster(s) and %d ml-agent replica(s).",
+        settings.poll_interval_seconds,
+        len(clusters),
+        len(settings.prediction_urls),
+    )
+    metrics.start_metrics_server(
+        bind_address=settings.metrics_bind_address,
+        port=settings.metrics_port,
+    )
+    metrics.configure_stale_series(settings.stale_series_cycles)
+
+    pool = EndpointPool(settings.prediction_urls, settings.eject_after_failures, settings.eject_seconds)
+    clients = HostClients(settings.request_timeout_seconds)
+    sink = _build_snapshot_sink(settings)
+    stages = []
+    for cluster, url in clusters.items():
+        queue: asyncio.Queue[Dict[str, object]] = asyncio.Queue(maxsize=settings.pipeline_queue_size)
+        watcher = Endpoint(url, settings.eject_after_failures, settings.eject_seconds)
+        schedule = _build_poll_schedule(settings, cluster)
+        stages.append(_fetch_stage(clients.for_url(url), settings, queue, watcher, schedule, cluster))
+        stages.append(_predict_stage(clients, settings, queue, pool, schedule, sink, cluster))
+    try:
+        await asyncio.gather(*stages)
+    finally:
+        await clients.aclose()
+        if sink:
+            sink.stop()
+
 
-    with httpx.Client(timeout=settings.request_timeout_seconds) as client:
-        while True:
-            cycle_start = time.perf_counter()
+async def _fetch_stage(
+    client: httpx.AsyncClient,
+    settings: Settings,
+    queue: asyncio.Queue[Dict[str, object]],
+    watcher: Endpoint,
+    schedule: PollSchedule,
+    cluster: str = "",
+) -> None:
+    while True:
+        # An ejected load-watcher is not polled until its ejection expires
+        if not watcher.ejected:
             try:
-                snapshot = fetch_snapshot(client, settings.load_watcher_url)
-                _log_snapshot(snapshot)
-                # TODO: Persist snapshots to shared storage once long-term retention is required.
-
-                prediction_response = request_predictions(client, settings.ml_agent_url, snapshot)
-                columns, target_map, predictions, source_host = parse_predictions(prediction_response)
-                metrics.publish_predictions(
-                    source_host=source_host,
-                    target_map=target_map,
-                    columns=columns,
-                    predictions=predictions,
-                )
-                metrics.record_cycle_success()
-                LOGGER.info(
-                    "Published %d predictions (source_host=%s).",
-                    len(predictions),
-                    source_host or "unknown",
+                snapshot = await asyncio.wait_for(
+                    fetch_snapshot_async(client, watcher.url),
+                    timeout=settings.fetch_deadline_seconds,
                 )
+                watcher.record_success()
+                _log_snapshot(snapshot)
+                schedule.observe_snapshot(snapshot)
+                if queue.full():
+                    queue.get_nowait()
+                    LOGGER.warning("Predict stage of cluster '%s' is behind; dropped the oldest queued snapshot.", cluster)
+                queue.put_nowait(snapshot)
             except Exception:
-                metrics.record_cycle_failure()
-                LOGGER.exception("Cycle failed.")
+                watcher.record_failure()
+                schedule.record_failure()
+                metrics.record_cycle_failure(cluster)
+                LOGGER.exception("Fetch stage of cluster '%s' failed.", cluster)
+
+        schedule.schedule()
+        await schedule.wait()
+
+
+async def _predict_stage(
+    clients: HostClients,
+    settings: Settings,
+    queue: asyncio.Queue[Dict[str, object]],
+    pool: EndpointPool,
+    schedule: Optional[PollSchedule] = None,
+    sink: Optional[SnapshotSink] = None,
+    cluster: str = "",
+) -> None:
+    snapshot_filter = _build_snapshot_filter(settings)
+    while True:
+        snapshot = await queue.get()
+        try:
+            fingerprint, reused = snapshot_filter.lookup(snapshot) if snapshot_filter else (0, None)
+            if reused is not None:
+                parsed = _publish(reused, reused_snapshot=True, cluster=cluster)
+            else:
+                prediction_response = await _request_from_pool(clients, settings, pool, snapshot)
+                parsed = _publish(prediction_response, cluster=cluster)
+                _observe_predictions(schedule, parsed)
+                if snapshot_filter:
+                    snapshot_filter.store(snapshot, fingerprint, prediction_response)
+            _persist(sink, snapshot, parsed, cluster)
+        except Exception:
+            metrics.record_cycle_failure(cluster)
+            LOGGER.exception("Predict stage of cluster '%s' failed.", cluster)
+
+
+async def _request_from_pool(
+    clients: HostClients, settings: Settings, pool: EndpointPool, snapshot: Dict[str, object]
+) -> Dict[str, object]:
+    """
+    Request predictions from the least busy replica, retrying once on another
+    replica when it fails or misses predict_deadline_seconds.
+    """
+    tried: List[Endpoint] = []
+    attempts = min(2, len(pool))
+    while True:
+        endpoint = pool.acquire(exclude=tried)
+        tried.append(endpoint)
+        try:
+            response = await asyncio.wait_for(
+                request_predictions_async(
+                    clients.for_url(endpoint.url),
+                    endpoint.url,
+                    snapshot,
+                    settings.prediction_format,
+                    settings.target_selector,
+                ),
+                timeout=settings.predict_deadline_seconds,
+            )
+        except Exception as exc:
+            pool.release(endpoint, ok=False)
+            if len(tried) >= attempts:
+                raise
+            LOGGER.warning("Prediction from %s failed (%r); retrying on another replica.", endpoint.url, exc)
+            continue
+        pool.release(endpoint, ok=True)
+        return response
+
+
+async def run_stream(settings: Settings) -> None:
+    """
+    Streaming variant of run_async(): snapshots fetched on the same tick grid are
+    pushed to ml-agent's /predict/stream WebSocket over one persistent connection,
+    and predictions are published as replies arrive, matched to their snapshot by
+    the reply's seq. ml-agent drops the oldest snapshots it cannot keep up with
+    (counted in orchestrator_stream_dropped_total). A closed or failed stream is
+    reopened after stream_reconnect_seconds. Streams drive the single cluster of
+    load_watcher_url and ml_agent_url.
+    """
+    LOGGER.info("Starting streaming orchestrator with %ss interval.", settings.poll_interval_seconds)
+    metrics.start_metrics_server(
+        bind_address=settings.metrics_bind_address,
+        port=settings.metrics_port,
+    )
+    metrics.configure_stale_series(settings.stale_series_cycles)
+
+    queue: asyncio.Queue[Dict[str, object]] = asyncio.Queue(maxsize=settings.pipeline_queue_size)
+    sink = _build_snapshot_sink(settings)
+    try:
+        async with httpx.AsyncClient(timeout=settings.request_timeout_seconds) as client:
+            watcher = Endpoint(settings.load_watcher_url, settings.eject_after_failures, settings.eject_seconds)
+            schedule = _build_poll_schedule(settings, settings.cluster_name)
+            await asyncio.gather(
+                _fetch_stage(client, settings, queue, watcher, schedule, settings.cluster_name),
+                _stream_stage(settings, queue, schedule, sink),
+            )
+    finally:
+        if sink:
+            sink.stop()
+
+
+def _stream_url(settings: Settings) -> str:
+    params: Dict[str, str] = {}
+    if settings.prediction_format == "msgpack":
+        params["format"] = "msgpack"
+    if settings.target_selector:
+        params["target_selector"] = settings.target_selector
+    url = settings.stream_url
+    if not params:
+        return url
+    return f"{url}{'&' if '?' in url else '?'}{urlencode(params)}"
+
+
+async def _stream_stage(
+    settings: Settings,
+    queue: asyncio.Queue[Dict[str, object]],
+    schedule: Optional[PollSchedule] = None,
+    sink: Optional[SnapshotSink] = None,
+) -> None:
+    url = _stream_url(settings)
+    cluster = settings.cluster_name
+    snapshot_filter = _build_snapshot_filter(settings)
+    while True:
+        try:
+            async with connect(url, max_size=None, open_timeout=settings.request_timeout_seconds) as connection:
+                LOGGER.info("Streaming snapshots to %s.", url)
+                # seq -> (snapshot, fingerprint); ml-agent numbers messages per connection
+                pending: "OrderedDict[int, Tuple[Dict[str, object], int]]" = OrderedDict()
+                tasks = [
+                    asyncio.create_task(_stream_send(connection, queue, pending, snapshot_filter, sink, cluster)),
+                    asyncio.create_task(_stream_receive(connection, pending, snapshot_filter, sink, schedule, cluster)),
+                ]
+                try:
+                    done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    for task in tasks:
+                        task.cancel()
+                    await asyncio.gather(*tasks, return_exceptions=True)
+                for task in done:
+                    task.result()
+                LOGGER.warning("Prediction stream closed by ml-agent.")
+        except Exception:
+            metrics.record_cycle_failure(cluster)
+            LOGGER.exception("Prediction stream failed.")
+        await asyncio.sleep(settings.stream_reconnect_seconds)
+
 
-            sleep_for = max(0.0, settings.poll_interval_seconds - (time.perf_counter() - cycle_start))
-            if sleep_for > 0:
-                time.sleep(sleep_for)
+async def _stream_send(
+    connection: ClientConnection,
+    queue: asyncio.Queue[Dict[str, object]],
+    pending: "OrderedDict[int, Tuple[Dict[str, object], int]]",
+    snapshot_filter: Optional[UnchangedSnapshotFilter],
+    sink: Optional[SnapshotSink],
+    cluster: str = "",
+) -> None:
+    seq = 0
+    while True:
+        snapshot = await queue.get()
+        fingerprint, reused = snapshot_filter.lookup(snapshot) if snapshot_filter else (0, None)
+        if reused is not None:
+            _persist(sink, snapshot, _publish(reused, reused_snapshot=True, cluster=cluster), cluster)
+            continue
+        pending[seq] = (snapshot, fingerprint)
+        if len(pending) > MAX_PENDING_STREAM_SNAPSHOTS:
+            pending.popitem(last=False)
+        seq += 1
+        await connection.send(orjson.dumps(snapshot))
+
+
+async def _stream_receive(
+    connection: ClientConnection,
+    pending: "OrderedDict[int, Tuple[Dict[str, object], int]]",
+    snapshot_filter: Optional[UnchangedSnapshotFilter],
+    sink: Optional[SnapshotSink],
+    schedule: Optional[PollSchedule] = None,
+    cluster: str = "",
+) -> None:
+    dropped = 0
+    async for message in connection:
+        try:
+            reply = decode_stream_message(message)
+            seq = int(reply.get("seq", -1))  # type: ignore[call-overload]
+            total_dropped = int(reply.get("dropped", 0))  # type: ignore[call-overload]
+            metrics.record_stream_dropped(total_dropped - dropped)
+            dropped = max(dropped, total_dropped)
+            # Replies come back in send order; anything older than seq was dropped by ml-agent
+            while pending and next(iter(pending)) < seq:
+                pending.popitem(last=False)
+            snapshot, fingerprint = pending.pop(seq, (None, 0))
+            if "error" in reply:
+                metrics.record_cycle_failure(cluster)
+                LOGGER.warning("ml-agent could not predict snapshot %s: %s", reply.get("timestamp"), reply["error"])
+                continue
+            parsed = _publish(reply, cluster=cluster)
+            _observe_predictions(schedule, parsed)
+            if snapshot is not None:
+                if snapshot_filter:
+                    snapshot_filter.store(snapshot, fingerprint, reply)
+                _persist(sink, snapshot, parsed, cluster)
+        except Exception:
+            metrics.record_cycle_failure(cluster)
+            LOGGER.exception("Could not handle a streamed prediction.")
+
+
+def _build_snapshot_filter(settings: Settings) -> Optional[UnchangedSnapshotFilter]:
+    if not settings.skip_unchanged_snapshots:
+        return None
+    return UnchangedSnapshotFilter(
+        SnapshotFingerprinter(
+            tolerances=settings.fingerprint_tolerances,
+            default_tolerance=settings.fingerprint_default_tolerance,
+        )
+    )
+
+
+def _build_poll_schedule(settings: Settings, cluster: str = "") -> PollSchedule:
+    if not settings.adaptive_polling:
+        return PollSchedule(settings.poll_interval_seconds, cluster)
+    return AdaptivePollSchedule(
+        min_interval=settings.poll_min_interval_seconds,
+        max_interval=settings.poll_max_interval_seconds,
+        backoff_factor=settings.poll_backoff_factor,
+        change_threshold=settings.poll_change_threshold,
+        align_to_window=settings.poll_align_to_window,
+        align_grace=settings.poll_align_grace_seconds,
+        cluster=cluster,
+    )
+
+
+def _build_snapshot_sink(settings: Settings) -> Optional[SnapshotSink]:
+    if not settings.snapshot_dir:
+        return None
+    sink = SnapshotSink(
+        settings.snapshot_dir,
+        batch_rows=settings.snapshot_batch_rows,
+        flush_interval_seconds=settings.snapshot_flush_interval_seconds,
+        rotate_bytes=settings.snapshot_rotate_bytes,
+        rotate_seconds=settings.snapshot_rotate_seconds,
+        retention_bytes=settings.snapshot_retention_bytes,
+        compression=settings.snapshot_compression,
+    )
+    sink.start()
+    LOGGER.info("Persisting snapshots to %s.", settings.snapshot_dir)
+    return sink
+
+
+def _observe_predictions(schedule: Optional[PollSchedule], parsed: ParsedPredictions) -> None:
+    if schedule is None:
+        return
+    columns, target_map, predictions, source_host = parsed
+    schedule.observe_predictions(source_host, target_map, columns, predictions)
+
+
+def _persist(
+    sink: Optional[SnapshotSink], snapshot: Dict[str, object], parsed: ParsedPredictions, cluster: str = ""
+) -> None:
+    if sink is None:
+        return
+    columns, target_map, predictions, source_host = parsed
+    sink.submit(
+        snapshot,
+        source_host=source_host,
+        target_map=target_map,
+        columns=columns,
+        predictions=predictions,
+        cluster=cluster,
+    )
+
+
+def _publish(
+    prediction_response: Dict[str, object], reused_snapshot: bool = False, cluster: str = ""
+) -> ParsedPredictions:
+    parsed = parse_predictions(prediction_response)
+    columns, target_map, predictions, source_host = parsed
+    if reused_snapshot:
+        # Snapshot unchanged since the last prediction: keep its series fresh without calling ml-agent
+        metrics.record_cycle_skipped(cluster)
+    metrics.publish_predictions(
+        source_host=source_host,
+        target_map=target_map,
+        columns=columns,
+        predictions=predictions,
+        cluster=cluster,
+    )
+    metrics.record_cycle_success(cluster)
+    LOGGER.info(
+        "%s %d predictions (cluster=%s, source_host=%s).",
+        "Snapshot unchanged; re-published" if reused_snapshot else "Published",
+        len(predictions),
+        cluster or "-",
+        source_host or "unknown",
+    )
+    return parsed
 
 
 def _log_snapshot(snapshot: Dict[str, object], limit: int = 2048) -> None:
+    if not LOGGER.isEnabledFor(logging.DEBUG):
+        return
     serialized = json.dumps(snapshot, sort_keys=True)
     if len(serialized) > limit:
         serialized = f"{serialized[:limit]}... (truncated {len(serialized) - limit} chars)"
@@ -0,0 +1,257 @@
+"""
+Poll schedules deciding when a cluster's next load-watcher snapshot is fetched:
+a fixed interval grid, or an adaptive schedule that polls faster while metrics
+change, backs off while they are stable and aligns fetches to the refreshes of
+load-watcher's snapshot window.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import time
+from typing import Callable, Dict, Hashable, List, Mapping, Optional, Sequence, Tuple
+
+from app import metrics
+from app.fingerprint import iter_node_metrics
+
+LOGGER = logging.getLogger(__name__)
+
+# (host or target, ..., metric name or feature) -> value
+ValueMap = Dict[Tuple[Hashable, ...], float]
+
+
+def relative_change(previous: Optional[ValueMap], current: ValueMap) -> float:
+    """
+    Largest relative change of any metric between two value maps, keyed by tuples
+    ending with the metric name. Per metric, the absolute differences are summed
+    over hosts (a missing host counts as 0) and divided by the larger of the two
+    totals, so a single near-zero value cannot dominate. Returns 0 without a
+    previous map.
+    """
+    if not previous:
+        return 0.0
+    diffs: Dict[Hashable, float] = {}
+    totals: Dict[Hashable, Tuple[float, float]] = {}
+    for key in previous.keys() | current.keys():
+        old = previous.get(key, 0.0)
+        new = current.get(key, 0.0)
+        name = key[-1]
+        diffs[name] = diffs.get(name, 0.0) + abs(new - old)
+        old_total, new_total = totals.get(name, (0.0, 0.0))
+        totals[name] = (old_total + abs(old), new_total + abs(new))
+    return max(
+        (diff / max(max(totals[name]), 1e-12) for name, diff in diffs.items()),
+        default=0.0,
+    )
+
+
+def window_end(snapshot: Mapping[str, object]) -> Optional[float]:
+    """Epoch seconds of the snapshot's window.end, falling back to its timestamp."""
+    window = snapshot.get("window") or {}
+    end = window.get("end") if isinstance(window, dict) else None
+    if end is None:
+        end = snapshot.get("timestamp")
+    try:
+        return float(end)  # type: ignore[arg-type]
+    except (TypeError, ValueError):
+        return None
+
+
+class PollSchedule:
+    """
+    Fixed interval grid: fetches every `interval` seconds from construction,
+    skipping ticks that were overrun instead of drifting. Subclasses reschedule
+    from the snapshots and predictions they observe.
+    """
+
+    def __init__(self, interval: float, cluster: str = "", clock: Callable[[], float] = time.time):
+        self.interval = interval
+        self.cluster = cluster
+        self.reason = "fixed"
+        self.next_fetch = clock()
+        self._clock = clock
+        self._wake = asyncio.Event()
+        metrics.record_poll_interval(cluster, interval, self.reason)
+
+    def observe_snapshot(self, snapshot: Mapping[str, object]) -> None:
+        """Called with every fetched snapshot, before schedule()."""
+
+    def observe_predictions(
+        self,
+        source_host: str,
+        target_map: Dict[int, str],
+        columns: Sequence[str],
+        predictions: Dict[int, List[float]],
+    ) -> None:
+        """Called with every fresh prediction; may bring the next fetch forward."""
+
+    def record_failure(self) -> None:
+        """Called when a fetch failed, before schedule()."""
+
+    def schedule(self) -> float:
+        """Pick the time of the next fetch, after the current one finished."""
+        self.next_fetch += self.interval
+        now = self._clock()
+        if self.next_fetch < now:
+            missed = math.ceil((now - self.next_fetch) / self.interval)
+            LOGGER.warning("Fetch stage of cluster '%s' overran by %d interval(s).", self.cluster, missed)
+            self.next_fetch += missed * self.interval
+        return self.next_fetch
+
+    def sleep(self) -> None:
+        """Block until the next fetch is due."""
+        time.sleep(max(0.0, self.next_fetch - self._clock()))
+
+    async def wait(self) -> None:
+        """Sleep until the next fetch is due, following reschedules made meanwhile."""
+        while True:
+            delay = self.next_fetch - self._clock()
+            if delay <= 0:
+                return
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def _reschedule(self, next_fetch: float) -> None:
+        self.next_fetch = next_fetch
+        self._wake.set()
+
+
+class AdaptivePollSchedule(PollSchedule):
+    """
+    Polls at min_interval while the observed metrics or the predictions change by
+    at least change_threshold (relative, see relative_change()) between polls, and
+    multiplies the interval by backoff_factor up to max_interval while they are
+    stable. A fast-changing prediction also brings forward a fetch that is already
+    scheduled.
+
+    load-watcher refreshes its snapshot periodically; the period is inferred from
+    the smallest step between the window ends seen so far. With align_to_window,
+    fetches are moved to the nearest expected refresh plus align_grace seconds, so
+    they land just after a refresh instead of just before one. A fetch that finds
+    the window not yet refreshed is retried after min_interval, backing off while
+    it stays pending.
+    """
+
+    def __init__(
+        self,
+        min_interval: float,
+        max_interval: float,
+        backoff_factor: float = 2.0,
+        change_threshold: float = 0.05,
+        align_to_window: bool = True,
+        align_grace: float = 1.0,
+        cluster: str = "",
+        clock: Callable[[], float] = time.time,
+    ):
+        super().__init__(min_interval, cluster, clock)
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.backoff_factor = backoff_factor
+        self.change_threshold = change_threshold
+        self.align_to_window = align_to_window
+        self.align_grace = align_grace
+        self.refresh_period: Optional[float] = None
+        self.reason = "initial"
+        self._scheduled_at = self.next_fetch
+        self._window_end: Optional[float] = None
+        self._pending = 0
+        self._failed = False
+        self._polls = 0
+        self._observed: Optional[ValueMap] = None
+        self._observed_change = 0.0
+        self._predicted: Optional[ValueMap] = None
+        self._predictions_changed = False
+        metrics.record_poll_interval(cluster, min_interval, self.reason)
+
+    def observe_snapshot(self, snapshot: Mapping[str, object]) -> None:
+        self._failed = False
+        end = window_end(snapshot)
+        if end is not None and self._window_end is not None and end <= self._window_end:
+            self._pending += 1
+            return
+        if end is not None and self._window_end is not None:
+            step = end - self._window_end
+            if self.refresh_period is None or step < self.refresh_period:
+                self.refresh_period = step
+                metrics.record_watcher_refresh_period(self.cluster, step)
+        if end is not None:
+            self._window_end = end
+        self._pending = 0
+        self._polls += 1
+        observed = {(host, name): value for host, name, value in iter_node_metrics(snapshot)}
+        self._observed_change = max(self._observed_change, relative_change(self._observed, observed))
+        self._observed = observed
+
+    def observe_predictions(
+        self,
+        source_host: str,
+        target_map: Dict[int, str],
+        columns: Sequence[str],
+        predictions: Dict[int, List[float]],
+    ) -> None:
+        predicted: ValueMap = {}
+        for target_id, values in predictions.items():
+            target_host = target_map.get(int(target_id), str(target_id))
+            for column, value in zip(columns, values):
+                predicted[(source_host, target_host, column)] = float(value)
+        change = relative_change(self._predicted, predicted)
+        self._predicted = predicted
+        if change < self.change_threshold:
+            return
+        self._predictions_changed = True
+        # Don't sit out a long back-off while predictions move; schedule() sets the reason
+        sooner = max(self._clock(), self._align(self._scheduled_at + self.min_interval))
+        if sooner < self.next_fetch:
+            self._reschedule(sooner)
+
+    def record_failure(self) -> None:
+        self._failed = True
+
+    def schedule(self) -> float:
+        now = self._clock()
+        self._scheduled_at = now
+        if self._failed:
+            reason, next_fetch = "failed", now + self.interval
+        elif self._pending:
+            # Late refresh: retry soon, backing off in case load-watcher stalled
+            delay = self.min_interval
+            if self.refresh_period:
+                delay = min(self.max_interval, delay * self.backoff_factor ** (self._pending - 1))
+            reason, next_fetch = "window_pending", now + delay
+        else:
+            if self._predictions_changed:
+                self.interval, reason = self.min_interval, "predictions_changing"
+            elif self._observed_change >= self.change_threshold:
+                self.interval, reason = self.min_interval, "observed_changing"
+            elif self._polls < 2:
+                reason = "initial"
+            else:
+                # Polling faster than load-watcher refreshes cannot see anything new
+                base = max(self.interval, self.refresh_period or 0.0)
+                self.interval, reason = min(self.max_interval, base * self.backoff_factor), "stable"
+            next_fetch = self._align(now + self.interval)
+            self._predictions_changed = False
+            self._observed_change = 0.0
+        self.next_fetch = next_fetch
+        self._set_reason(reason)
+        return next_fetch
+
+    def _set_reason(self, reason: str) -> None:
+        delay = max(0.0, self.next_fetch - self._scheduled_at)
+        if reason != self.reason:
+            LOGGER.info("Polling cluster '%s' again in %.1fs (%s).", self.cluster or "-", delay, reason)
+        self.reason = reason
+        metrics.record_poll_interval(self.cluster, delay, reason)
+
+    def _align(self, target: float) -> float:
+        """Move `target` to the nearest expected window refresh (plus grace) after the last one seen."""
+        if not self.align_to_window or not self.refresh_period or self._window_end is None:
+            return target
+        refreshes = max(1, round((target - self.align_grace - self._window_end) / self.refresh_period))
+        aligned = self._window_end + refreshes * self.refresh_period + self.align_grace
+        # An expected refresh already in the past (e.g. load-watcher stalled) gives no alignment
+        return aligned if aligned > self._clock() else target
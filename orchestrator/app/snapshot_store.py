@@ -0,0 +1,311 @@
+from __future__ import annotations
+
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from app import metrics
+
+LOGGER = logging.getLogger(__name__)
+
+OBSERVED_SCHEMA = pa.schema(
+    [
+        ("timestamp", pa.int64()),
+        ("window_end", pa.int64()),
+        ("host", pa.string()),
+        ("name", pa.string()),
+        ("type", pa.string()),
+        ("operator", pa.string()),
+        ("rollup", pa.string()),
+        ("value", pa.float64()),
+        ("cluster", pa.string()),
+    ]
+)
+
+PREDICTIONS_SCHEMA = pa.schema(
+    [
+        ("timestamp", pa.int64()),
+        ("source_host", pa.string()),
+        ("target_id", pa.int32()),
+        ("target_host", pa.string()),
+        ("feature", pa.string()),
+        ("value", pa.float64()),
+        ("cluster", pa.string()),
+    ]
+)
+
+# Repeated label columns are dictionary-encoded inside each row group
+_DICTIONARY_COLUMNS = [
+    "host", "name", "type", "operator", "rollup", "source_host", "target_host", "feature", "cluster",
+]
+
+_STOP = object()
+
+
+@dataclass
+class _Cycle:
+    snapshot: Mapping[str, object]
+    source_host: str
+    target_map: Dict[int, str]
+    columns: Sequence[str]
+    predictions: Dict[int, List[float]]
+    cluster: str = ""
+
+
+@dataclass
+class _TableWriter:
+    """
+    Append-only Parquet stream for one table: buffers rows column-wise, writes a
+    row group per flush and rotates to a new file by size or age (a rotate_seconds
+    of 0 closes the file after every flush). Files are written as *.parquet.tmp
+    and renamed once closed, so readers only see complete files; an unclosed file
+    has no footer and is lost if the process dies. A batch that fails to write is
+    dropped rather than retried.
+    """
+
+    directory: str
+    prefix: str
+    schema: pa.Schema
+    compression: str
+    rotate_bytes: int
+    rotate_seconds: float
+    columns: Dict[str, list] = field(default_factory=dict)
+    writer: Optional[pq.ParquetWriter] = None
+    path: str = ""
+    opened_at: float = 0.0
+
+    def __post_init__(self) -> None:
+        self._reset_buffer()
+
+    def _reset_buffer(self) -> None:
+        self.columns = {name: [] for name in self.schema.names}
+        self._column_lists = [self.columns[name] for name in self.schema.names]
+
+    def append_row(self, row: Tuple[object, ...]) -> None:
+        """Append one fully built row, in schema column order."""
+        for column, value in zip(self._column_lists, row):
+            column.append(value)
+
+    @property
+    def buffered_rows(self) -> int:
+        return len(self.columns[self.schema.names[0]])
+
+    def flush(self) -> int:
+        rows = self.buffered_rows
+        if rows == 0:
+            if self.writer is not None:
+                # Keep the open file's mtime fresh so it is not swept as stale
+                os.utime(self.path)
+            return 0
+        try:
+            if self.writer is None:
+                self._open()
+            table = pa.Table.from_pydict(self.columns, schema=self.schema)
+            self.writer.write_table(table)  # type: ignore[union-attr]
+        except Exception:
+            LOGGER.warning("Dropping %d buffered %s rows after a failed write.", rows, self.prefix)
+            raise
+        finally:
+            self._reset_buffer()
+        metrics.record_snapshot_rows_written(self.prefix, rows)
+        if (
+            self.rotate_seconds <= 0
+            or os.path.getsize(self.path) >= self.rotate_bytes
+            or time.monotonic() - self.opened_at >= self.rotate_seconds
+        ):
+            self.close()
+        return rows
+
+    def _open(self) -> None:
+        stamp = time.strftime("%Y%m%dT%H%M%S", time.gmtime())
+        # Unique even for several rotations per second or a restarted process reusing the pid
+        self.path = os.path.join(
+            self.directory, f"{self.prefix}-{stamp}-{os.getpid()}-{uuid.uuid4().hex[:8]}.parquet.tmp"
+        )
+        dictionary = [name for name in _DICTIONARY_COLUMNS if name in self.schema.names]
+        self.writer = pq.ParquetWriter(
+            self.path, self.schema, compression=self.compression, use_dictionary=dictionary
+        )
+        self.opened_at = time.monotonic()
+
+    def close(self) -> None:
+        if self.writer is None:
+            return
+        self.writer.close()
+        self.writer = None
+        os.replace(self.path, self.path[: -len(".tmp")])
+
+
+class SnapshotSink:
+    """
+    Background writer persisting each cycle's observed metrics and predictions to
+    append-only, compressed Parquet files under a shared directory. The hot loop
+    only enqueues references; flattening, encoding and disk I/O happen on the
+    writer thread. When the queue is full new cycles are dropped (and counted)
+    rather than stalling the loop. Closed files beyond retention_bytes are
+    deleted oldest first. Unfinished *.parquet.tmp files count towards retention;
+    ones not modified for two flush intervals (left by a crashed or restarted
+    writer) are removed at startup and by retention.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        batch_rows: int = 4096,
+        flush_interval_seconds: float = 300.0,
+        rotate_bytes: int = 64 * 1024 * 1024,
+        rotate_seconds: float = 0.0,
+        retention_bytes: int = 10 * 1024 * 1024 * 1024,
+        compression: str = "zstd",
+        queue_size: int = 128,
+    ):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.batch_rows = batch_rows
+        self.flush_interval_seconds = flush_interval_seconds
+        self.retention_bytes = retention_bytes
+        self._queue: "queue.Queue[object]" = queue.Queue(maxsize=queue_size)
+        self._observed = _TableWriter(directory, "observed", OBSERVED_SCHEMA, compression, rotate_bytes, rotate_seconds)
+        self._predictions = _TableWriter(
+            directory, "predictions", PREDICTIONS_SCHEMA, compression, rotate_bytes, rotate_seconds
+        )
+        self._thread = threading.Thread(target=self._run, name="snapshot-sink", daemon=True)
+        self._remove_stale_tmp_files()
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Flush buffered rows and close (rename) the open files, waiting up to `timeout`."""
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            LOGGER.warning("Snapshot writer did not finish within %.1fs; unflushed rows may be lost.", timeout)
+
+    def submit(
+        self,
+        snapshot: Mapping[str, object],
+        source_host: str = "",
+        target_map: Optional[Dict[int, str]] = None,
+        columns: Sequence[str] = (),
+        predictions: Optional[Dict[int, List[float]]] = None,
+        cluster: str = "",
+    ) -> None:
+        cycle = _Cycle(snapshot, source_host, target_map or {}, columns, predictions or {}, cluster)
+        try:
+            self._queue.put_nowait(cycle)
+        except queue.Full:
+            metrics.record_snapshot_dropped()
+
+    def _run(self) -> None:
+        last_flush = time.monotonic()
+        while True:
+            timeout = max(0.0, self.flush_interval_seconds - (time.monotonic() - last_flush))
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if item is _STOP:
+                self._flush(close=True)
+                return
+            try:
+                if isinstance(item, _Cycle):
+                    self._append(item)
+                due = time.monotonic() - last_flush >= self.flush_interval_seconds
+                if due or max(self._observed.buffered_rows, self._predictions.buffered_rows) >= self.batch_rows:
+                    self._flush()
+                    last_flush = time.monotonic()
+            except Exception:
+                LOGGER.exception("Snapshot sink failed to write a batch.")
+
+    def _append(self, cycle: _Cycle) -> None:
+        snapshot = cycle.snapshot
+        timestamp = int(snapshot.get("timestamp") or 0)  # type: ignore[call-overload]
+        window = snapshot.get("window") or {}
+        window_end = int((window.get("end") if isinstance(window, dict) else 0) or 0)
+        data = snapshot.get("data") or {}
+        node_metrics_map = (data.get("NodeMetricsMap") if isinstance(data, dict) else None) or {}
+
+        # Rows are built completely before they are appended, so a bad value cannot
+        # leave the buffered columns misaligned
+        for host, bucket in node_metrics_map.items():
+            for metric in (bucket or {}).get("metrics", []) or []:
+                try:
+                    value = float(metric.get("value", 0.0))
+                except (TypeError, ValueError):
+                    continue
+                self._observed.append_row(
+                    (
+                        timestamp,
+                        window_end,
+                        host,
+                        str(metric.get("name", "")),
+                        str(metric.get("type", "")),
+                        str(metric.get("operator", "")),
+                        str(metric.get("rollup", "")),
+                        value,
+                        cycle.cluster,
+                    )
+                )
+
+        column_count = len(cycle.columns)
+        for target_id, values in cycle.predictions.items():
+            target_host = cycle.target_map.get(int(target_id), str(target_id))
+            for idx, value in enumerate(values):
+                self._predictions.append_row(
+                    (
+                        timestamp,
+                        cycle.source_host,
+                        int(target_id),
+                        target_host,
+                        cycle.columns[idx] if idx < column_count else f"y_{idx}",
+                        float(value),
+                        cycle.cluster,
+                    )
+                )
+
+    def _flush(self, close: bool = False) -> None:
+        try:
+            self._observed.flush()
+            self._predictions.flush()
+            if close:
+                self._observed.close()
+                self._predictions.close()
+        finally:
+            self._enforce_retention()
+
+    def _is_stale_tmp(self, path: str) -> bool:
+        if path in (self._observed.path, self._predictions.path):
+            return False
+        return time.time() - os.path.getmtime(path) > 2 * self.flush_interval_seconds
+
+    def _remove_stale_tmp_files(self) -> None:
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith(".parquet.tmp") and self._is_stale_tmp(path):
+                os.remove(path)
+                LOGGER.info("Removed unfinished snapshot file %s.", path)
+
+    def _enforce_retention(self) -> None:
+        files = [
+            os.path.join(self.directory, name)
+            for name in os.listdir(self.directory)
+            if name.endswith((".parquet", ".parquet.tmp"))
+        ]
+        files.sort(key=os.path.getmtime)
+        total = sum(os.path.getsize(path) for path in files)
+        # Files still being written (by this or another live writer) are counted but kept
+        removable = [path for path in files if path.endswith(".parquet") or self._is_stale_tmp(path)]
+        while removable and total > self.retention_bytes:
+            oldest = removable.pop(0)
+            total -= os.path.getsize(oldest)
+            os.remove(oldest)
+            LOGGER.info("Removed %s to stay within snapshot retention.", oldest)